@@ -0,0 +1,763 @@
+#!/usr/bin/env python3
+
+import os, sys
+import datetime, time, uuid, argparse
+from collections import OrderedDict
+
+# Defaults/globals
+
+AREAS = ['Policies', 'Billing', 'Claims', 'Reports']
+STATUSES = ['Complete', 'Rejected', 'Deferred']
+DATETIMEFMT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+# Shortcuts
+
+def timeit(func, repeat=5):
+    '''Calls func repeat times, returns best time in seconds'''
+    best = None
+    for x in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def printrows(rows, headers, spacer='  '):
+    if rows:
+        # Get column widths per field
+        widths = [ max(map(lambda x: len(str(x)), col)) for col in zip(*rows) ]
+        # Check if headers are longer
+        widths = [ max(width, len(hd)) for width, hd in zip(widths, headers) ]
+    else:
+        widths = [ len(hd) for hd in headers ]
+
+    # Print headers
+    print(spacer.join(header.ljust(width) for header, width in zip(headers, widths)))
+    # Print separators
+    print(spacer.join('-' * width for width in widths))
+    # Print rows
+    for row in rows:
+        print(spacer.join(str(col).ljust(width) for col, width in zip(row, widths)))
+
+def fakereqlist(count, desclen=400, clients=3):
+    '''Builds a payload shaped like /featreq/req/all/?fields=all, with count
+    requests, each open for one client and closed for another.
+    '''
+    basedt = datetime.datetime(2016, 4, 1, 12, 0, 0)
+    clids = [ str(uuid.uuid4()) for x in range(clients) ]
+    desc = ('Lorem ipsum dolor sit amet. ' * (desclen // 28 + 1))[:desclen]
+    frlist = []
+    for x in range(count):
+        dt = (basedt + datetime.timedelta(minutes=x)).strftime(DATETIMEFMT)
+        fr = OrderedDict([
+            ('id', str(uuid.uuid4())), ('title', 'Test request {0}'.format(x)),
+            ('desc', desc), ('ref_url', 'http://test-{0}.com'.format(x)),
+            ('prod_area', AREAS[x % len(AREAS)]), ('date_cr', dt), ('user_cr', 'iws-admin'),
+            ('date_up', dt), ('user_up', 'iws-admin'),
+        ])
+        fr['open_list'] = [ OrderedDict([
+            ('client_id', clids[x % clients]), ('priority', x % 100 + 1), ('date_tgt', dt),
+            ('opened_at', dt), ('opened_by', 'iws-admin'),
+        ]) ]
+        fr['closed_list'] = [ OrderedDict([
+            ('client_id', clids[(x + 1) % clients]), ('priority', None), ('date_tgt', None),
+            ('opened_at', dt), ('opened_by', 'iws-admin'), ('closed_at', dt),
+            ('closed_by', 'iws-admin'), ('status', STATUSES[x % len(STATUSES)]),
+            ('reason', 'Request fulfilled'),
+        ]) ]
+        frlist.append(fr)
+    return OrderedDict([('req_count', len(frlist)), ('req_list', frlist)])
+
+
+def djangosetup(dbpath=None):
+    '''Sets up Django against a scratch SQLite database at dbpath (a new
+    temp file if None), migrated to the current schema. Returns dbpath.
+    '''
+    import tempfile
+    if dbpath is None:
+        fd, dbpath = tempfile.mkstemp(prefix='iws-bench-', suffix='.sqlite3')
+        os.close(fd)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'iws.settings')
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = dbpath
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    return dbpath
+
+def seedreqs(count, desclen=400, clients=3):
+    '''Bulk-inserts count requests with desclen-character descriptions,
+    each open for one of clients clients and closed for another. Returns
+    list of client ids.
+    '''
+    from featreq.models import FeatureReq, FeatureReqDesc, ClientInfo, OpenReq, ClosedReq
+
+    basedt = datetime.datetime(2016, 4, 1, 12, 0, 0, tzinfo=datetime.timezone.utc)
+    desc = ('Lorem ipsum dolor sit amet. ' * (desclen // 28 + 1))[:desclen]
+    cllist = [ ClientInfo(id=uuid.uuid4(), name='Bench client {0}'.format(x)) for x in range(clients) ]
+    ClientInfo.objects.bulk_create(cllist)
+    frlist, olist, clist = [], [], []
+    for x in range(count):
+        dt = basedt + datetime.timedelta(minutes=x)
+        fr = FeatureReq(
+            id=uuid.uuid4(), title='Test request {0}'.format(x), desc=desc,
+            ref_url='http://test-{0}.com'.format(x), prod_area='PO',
+            date_cr=dt, user_cr='iws-admin', date_up=dt, user_up='iws-admin')
+        frlist.append(fr)
+        olist.append(OpenReq(
+            client=cllist[x % clients], req=fr, priority=x // clients + 1,
+            opened_at=dt, opened_by='iws-admin'))
+        clist.append(ClosedReq(
+            client=cllist[(x + 1) % clients], req=fr, opened_at=dt, opened_by='iws-admin',
+            closed_at=dt, closed_by='iws-admin', status='C', reason='Request fulfilled'))
+    FeatureReq.objects.bulk_create(frlist, batch_size=500)
+    FeatureReqDesc.objects.bulk_create([ FeatureReqDesc(req=fr, body=fr.desc) for fr in frlist ], batch_size=500)
+    OpenReq.objects.bulk_create(olist, batch_size=500)
+    ClosedReq.objects.bulk_create(clist, batch_size=500)
+    return [ cl.id for cl in cllist ]
+
+
+# Benchmark funcs
+
+def benchcodec(counts=(1000, 10000, 50000), repeat=5):
+    '''Encode/decode throughput of each available JSON backend'''
+    from featreq import codec
+
+    rows = []
+    for count in counts:
+        payload = fakereqlist(count)
+        for name in codec.CODECS:
+            codec.setcodec(name)
+            encoded = codec.jsondumps(payload)
+            mbytes = len(encoded) / 1048576
+            enctime = timeit(lambda: codec.jsondumps(payload), repeat)
+            dectime = timeit(lambda: codec.jsonloads(encoded), repeat)
+            rows.append((
+                count, name, '{0:.2f}'.format(mbytes),
+                '{0:.1f}'.format(mbytes / enctime), '{0:.1f}'.format(mbytes / dectime),
+                '{0:.1f}'.format(enctime * 1000), '{0:.1f}'.format(dectime * 1000)))
+
+    printrows(rows, ('Reqs', 'Codec', 'MB', 'Enc MB/s', 'Dec MB/s', 'Enc ms', 'Dec ms'))
+    print()
+
+def benchprojection(count=2000, desclen=51200, repeat=5):
+    '''Open/closed list queries loading full FeatureReq rows (as before) vs
+    only the requested fields, with large descriptions
+    '''
+    djangosetup()
+    clids = seedreqs(count, desclen)
+    from featreq.models import FeatureReq, OpenReq, ClosedReq
+    from featreq.views import linkprojection
+
+    fields = ['id', 'title']
+
+    def loaded(qset, fields):
+        # Bytes of FeatureReq column data pulled into memory
+        total = 0
+        for row in qset:
+            total += sum(len(str(getattr(row.req, fn))) for fn in fields)
+        return total
+
+    cases = [
+        ('req/all/open', OpenReq.objects.all()),
+        ('req/all/closed', ClosedReq.objects.all()),
+        ('client/<id>/open', OpenReq.objects.filter(client_id=clids[0])),
+        ('client/<id>/closed', ClosedReq.objects.filter(client_id=clids[0])),
+    ]
+    rows = []
+    for name, qset in cases:
+        full = linkprojection(qset, FeatureReq.fields)
+        proj = linkprojection(qset, fields)
+        # (Fresh clones each time, as evaluated querysets cache their rows)
+        fulltime = timeit(lambda: list(full.all()), repeat)
+        projtime = timeit(lambda: list(proj.all()), repeat)
+        rows.append((
+            name, '{0:.1f}'.format(loaded(full, FeatureReq.fields) / 1048576), '{0:.3f}'.format(loaded(proj, fields) / 1048576),
+            '{0:.1f}'.format(fulltime * 1000), '{0:.1f}'.format(projtime * 1000)))
+
+    # Single request, as in reqbyid_ext
+    req_id = FeatureReq.objects.values_list('id', flat=True)[0]
+    fulltime = timeit(lambda: FeatureReq.objects.withdesc().get(id=req_id), repeat)
+    projtime = timeit(lambda: FeatureReq.objects.only('id').get(id=req_id), repeat)
+    rows.append(('req/<id>/all', '{0:.3f}'.format(desclen / 1048576), '0.000',
+        '{0:.2f}'.format(fulltime * 1000), '{0:.2f}'.format(projtime * 1000)))
+
+    print('{0} requests, {1} KB descriptions, fields={2}'.format(count, desclen // 1024, ','.join(fields)))
+    printrows(rows, ('Query', 'Full MB', 'Proj MB', 'Full ms', 'Proj ms'))
+    print()
+
+def benchuuidkeys(count=200000, clients=50, repeat=5):
+    '''Index sizes and join timings with UUID keys stored as 32-char hex text
+    (Django's UUIDField on SQLite) vs 16-byte blobs (BinaryUUIDField)
+    '''
+    import random, sqlite3, tempfile
+
+    def build(keytype, tokey):
+        fd, dbpath = tempfile.mkstemp(prefix='iws-bench-', suffix='.sqlite3')
+        os.close(fd)
+        db = sqlite3.connect(dbpath)
+        # Same shape as the Django-generated tables (less unused columns)
+        db.executescript('''
+            CREATE TABLE clients (id {0} NOT NULL PRIMARY KEY, name varchar(64) NOT NULL);
+            CREATE TABLE featreqs (id {0} NOT NULL PRIMARY KEY, title varchar(128) NOT NULL,
+                "desc" text NOT NULL, date_cr datetime NOT NULL);
+            CREATE TABLE openreqs (id integer NOT NULL PRIMARY KEY AUTOINCREMENT,
+                priority smallint NULL, client_id {0} NOT NULL REFERENCES clients (id),
+                req_id {0} NOT NULL REFERENCES featreqs (id));
+            CREATE INDEX openreqs_client_id ON openreqs (client_id);
+            CREATE INDEX openreqs_req_id ON openreqs (req_id);
+            CREATE INDEX openreqs_client_id_priority ON openreqs (client_id, priority);
+        '''.format(keytype))
+        rnd = random.Random(1)
+        clids = [ uuid.UUID(int=rnd.getrandbits(128), version=4) for x in range(clients) ]
+        reqids = [ uuid.UUID(int=rnd.getrandbits(128), version=4) for x in range(count) ]
+        db.executemany('INSERT INTO clients VALUES (?, ?)',
+            ((tokey(cid), 'Client {0}'.format(x)) for x, cid in enumerate(clids)))
+        db.executemany('INSERT INTO featreqs VALUES (?, ?, ?, ?)',
+            ((tokey(rid), 'Test request {0}'.format(x), 'Lorem ipsum', '2016-04-01 12:00:00')
+                for x, rid in enumerate(reqids)))
+        db.executemany('INSERT INTO openreqs (priority, client_id, req_id) VALUES (?, ?, ?)',
+            ((x // clients + 1, tokey(clids[x % clients]), tokey(rid)) for x, rid in enumerate(reqids)))
+        db.commit()
+        db.execute('ANALYZE')
+        return db, dbpath, [ tokey(cid) for cid in clids ], [ tokey(rid) for rid in rnd.sample(reqids, 1000) ]
+
+    def indexsizes(db):
+        try:
+            rows = db.execute('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name').fetchall()
+        except sqlite3.OperationalError:
+            # SQLite built without dbstat
+            return {}
+        return dict(rows)
+
+    variants = (('hex text', 'char(32)', lambda u: u.hex), ('binary', 'blob', lambda u: u.bytes))
+    results = []
+    for name, keytype, tokey in variants:
+        db, dbpath, clkeys, reqkeys = build(keytype, tokey)
+        sizes = indexsizes(db)
+        clientjoin = timeit(lambda: [ db.execute(
+            'SELECT o.priority, f.id, f.title FROM openreqs o JOIN featreqs f ON f.id = o.req_id '
+            'WHERE o.client_id = ? ORDER BY o.priority', (ck,)).fetchall() for ck in clkeys ], repeat)
+        fulljoin = timeit(lambda: db.execute(
+            'SELECT f.id, f.title, c.name, o.priority FROM openreqs o '
+            'JOIN featreqs f ON f.id = o.req_id JOIN clients c ON c.id = o.client_id').fetchall(), repeat)
+        lookups = timeit(lambda: [ db.execute(
+            'SELECT id, title FROM featreqs WHERE id = ?', (rk,)).fetchone() for rk in reqkeys ], repeat)
+        results.append((name, sizes, os.path.getsize(dbpath), clientjoin, fulljoin, lookups))
+        db.close()
+        os.remove(dbpath)
+
+    print('{0} requests, {1} clients'.format(count, clients))
+    indexes = ('sqlite_autoindex_featreqs_1', 'openreqs_client_id', 'openreqs_req_id', 'openreqs_client_id_priority')
+    rows = [ [ idx ] + [ '{0:.2f}'.format(res[1][idx] / 1048576) if idx in res[1] else 'n/a' for res in results ]
+        for idx in indexes ]
+    rows.append([ 'database file' ] + [ '{0:.2f}'.format(res[2] / 1048576) for res in results ])
+    printrows(rows, [ 'Index (MB)' ] + [ res[0] for res in results ])
+    print()
+    rows = [
+        [ 'open list per client (x{0})'.format(clients) ] + [ '{0:.1f}'.format(res[3] * 1000) for res in results ],
+        [ 'full open join' ] + [ '{0:.1f}'.format(res[4] * 1000) for res in results ],
+        [ 'id lookups (x1000)' ] + [ '{0:.1f}'.format(res[5] * 1000) for res in results ],
+    ]
+    printrows(rows, [ 'Query (ms)' ] + [ res[0] for res in results ])
+    print()
+
+def benchdesc(count=20000, desclen=20480, repeat=5):
+    '''Table size, column scans and description reads with descriptions
+    stored as text or compressed (CompressedTextField) in featreqs, vs
+    compressed in a side table (FeatureReqDesc)
+    '''
+    import random, sqlite3, tempfile
+    from featreq.fields import compresstext, decompresstext
+
+    # Word salad compresses roughly like prose (repeated lorem ipsum
+    # would flatter compression)
+    rnd = random.Random(1)
+    words = [ ''.join(rnd.choice('abcdefghijklmnopqrstuvwxyz') for y in range(rnd.randint(2, 9)))
+        for x in range(2000) ]
+    def makedesc():
+        out, size = [], 0
+        while size < desclen:
+            word = rnd.choice(words)
+            out.append(word)
+            size += len(word) + 1
+        return ' '.join(out)[:desclen]
+    descs = [ makedesc() for x in range(1000) ]
+
+    # Columns in the Django-generated order (desc, if inline, after title)
+    othercols = ('"ref_url" varchar(254) NOT NULL, "prod_area" varchar(2) NOT NULL, '
+        '"date_cr" datetime NOT NULL, "date_up" datetime NOT NULL, "user_cr" varchar(30) NOT NULL, '
+        '"user_up" varchar(30) NOT NULL, "version" integer unsigned NOT NULL')
+    othervals = ('http://test.com', 'PO', '2016-04-01 12:00:00', '2016-04-01 12:00:00', 'iws-admin', 'iws-admin', 1)
+    # All but desc, as the list views read
+    listcols = 'id, title, ref_url, prod_area, date_cr, date_up, user_cr, user_up, version'
+
+    variants = (
+        ('text', 'text', False, lambda d: d, lambda d: d),
+        ('inline', 'blob', False, compresstext, decompresstext),
+        ('side table', 'blob', True, compresstext, decompresstext),
+    )
+    results = []
+    for name, coltype, side, pack, unpack in variants:
+        fd, dbpath = tempfile.mkstemp(prefix='iws-bench-', suffix='.sqlite3')
+        os.close(fd)
+        db = sqlite3.connect(dbpath)
+        reqs = [ (uuid.uuid4().bytes, 'Test request {0}'.format(x), pack(descs[x % len(descs)]))
+            for x in range(count) ]
+        if side:
+            db.execute('CREATE TABLE featreqs (id blob NOT NULL PRIMARY KEY, title varchar(128) NOT NULL, '
+                '{0})'.format(othercols))
+            db.execute('CREATE TABLE featreq_descs (req_id blob NOT NULL PRIMARY KEY, body blob NOT NULL)')
+            db.executemany('INSERT INTO featreqs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                ( req[:2] + othervals for req in reqs ))
+            db.executemany('INSERT INTO featreq_descs VALUES (?, ?)', ( (req[0], req[2]) for req in reqs ))
+            descquery = 'SELECT body FROM featreq_descs WHERE req_id = ?'
+        else:
+            db.execute('CREATE TABLE featreqs (id blob NOT NULL PRIMARY KEY, title varchar(128) NOT NULL, '
+                '"desc" {0} NOT NULL, {1})'.format(coltype, othercols))
+            db.executemany('INSERT INTO featreqs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                ( req + othervals for req in reqs ))
+            descquery = 'SELECT "desc" FROM featreqs WHERE id = ?'
+        db.commit()
+        # Fewer than the decompression cache holds, so the second pass hits
+        ids = [ req[0] for req in reqs[:200] ]
+        idtitle = timeit(lambda: db.execute('SELECT id, title FROM featreqs').fetchall(), repeat)
+        listscan = timeit(lambda: db.execute('SELECT {0} FROM featreqs'.format(listcols)).fetchall(), repeat)
+        def readdescs():
+            for rid in ids:
+                unpack(db.execute(descquery, (rid,)).fetchone()[0])
+        decompresstext.cache_clear()
+        colddesc = timeit(readdescs, 1)
+        warmdesc = timeit(readdescs, repeat)
+        results.append((name, os.path.getsize(dbpath), idtitle, listscan, colddesc, warmdesc))
+        db.close()
+        os.remove(dbpath)
+
+    print('{0} requests, {1} KB descriptions'.format(count, desclen // 1024))
+    rows = [
+        [ 'database file (MB)' ] + [ '{0:.1f}'.format(res[1] / 1048576) for res in results ],
+        [ 'scan id,title (ms)' ] + [ '{0:.1f}'.format(res[2] * 1000) for res in results ],
+        [ 'scan list columns (ms)' ] + [ '{0:.1f}'.format(res[3] * 1000) for res in results ],
+        [ '200 desc reads, cold (ms)' ] + [ '{0:.1f}'.format(res[4] * 1000) for res in results ],
+        [ '200 desc reads, cached (ms)' ] + [ '{0:.1f}'.format(res[5] * 1000) for res in results ],
+    ]
+    printrows(rows, [ '' ] + [ res[0] for res in results ])
+    print()
+
+def benchwrites(rate=500, seconds=5, threads=16, window=2, repeat=1):
+    '''Write latency and errors at a target rate of new/open/close calls,
+    each in its own transaction vs group-committed through the write queue
+    '''
+    import threading
+    djangosetup()
+    clids = seedreqs(100)
+    from django.db import connection
+    from featreq.models import FeatureReq, OpenReq, ClosedReq
+    from featreq.writequeue import WriteQueue
+
+    def run(call):
+        # Each thread cycles through creating, opening and closing a
+        # request, at its share of the target rate
+        interval = threads / rate
+        latencies, errors = [], []
+        def worker(idx):
+            start = time.perf_counter()
+            step = 0
+            fr = None
+            try:
+                while True:
+                    due = start + step * interval
+                    now = time.perf_counter()
+                    if due - start >= seconds:
+                        break
+                    if due > now:
+                        time.sleep(due - now)
+                    t0 = time.perf_counter()
+                    try:
+                        if step % 3 == 0:
+                            fr = call(FeatureReq.objects.newreq, 'bench', 'Bench request', 'Lorem ipsum')
+                        elif step % 3 == 1:
+                            call(OpenReq.objects.attachreq, 'bench', clids[idx % len(clids)], fr)
+                        else:
+                            call(ClosedReq.objects.closereq, 'bench', fr)
+                    except Exception as e:
+                        # Mostly "database is locked" (plus follow-on
+                        # failures, like closing what didn't open)
+                        errors.append(str(e))
+                    latencies.append(time.perf_counter() - t0)
+                    step += 1
+            finally:
+                connection.close()
+        workers = [ threading.Thread(target=worker, args=(x,)) for x in range(threads) ]
+        start = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        return latencies, errors, time.perf_counter() - start
+
+    wq = WriteQueue(window=window)
+    modes = (('per-call', lambda func, *args: func(*args)), ('queued', wq.call))
+    rows = []
+    for name, call in modes:
+        for x in range(repeat):
+            latencies, errors, elapsed = run(call)
+            latencies.sort()
+            pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+            commits = wq.commits if name == 'queued' else len(latencies) - len(errors)
+            wq.commits = 0
+            rows.append((
+                name, len(latencies), '{0:.0f}'.format(len(latencies) / elapsed), len(errors), commits,
+                '{0:.1f}'.format(pct(0.5)), '{0:.1f}'.format(pct(0.99)), '{0:.1f}'.format(latencies[-1] * 1000)))
+
+    print('{0} writes/s target, {1} threads, {2}s, {3} ms window'.format(rate, threads, seconds, window))
+    printrows(rows, ('Mode', 'Writes', 'Writes/s', 'Errors', 'Commits', 'p50 ms', 'p99 ms', 'Max ms'))
+    print()
+
+def benchasgi(count=500, clients=(8, 32, 128), holders=32, seconds=5, workers=8, wait=2, repeat=1):
+    '''List request throughput/latency with clients concurrent clients and
+    holders idle long-polls, through 8 sync workers (standing in for the
+    uWSGI processes, a long-poll holding one for its whole wait) vs the
+    ASGI application (IWS_ASGI_DB_THREADS threads)
+    '''
+    import asyncio, threading
+    from concurrent.futures import ThreadPoolExecutor
+    djangosetup()
+    seedreqs(count)
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from featreq.models import ChangeEvent
+    from featreq.asyncapp import application, runwsgi, wsgienviron
+
+    User.objects.create_user('bench', password='bench')
+    client = Client()
+    client.login(username='bench', password='bench')
+    cookie = '{0}={1}'.format(settings.SESSION_COOKIE_NAME, client.cookies[settings.SESSION_COOKIE_NAME].value)
+    lastid = ChangeEvent.objects.lastid()
+
+    def scope(path, query=b''):
+        return {
+            'type': 'http', 'method': 'GET', 'path': path, 'query_string': query, 'root_path': '',
+            'scheme': 'http', 'http_version': '1.1', 'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+            'headers': [(b'host', b'localhost'), (b'accept', b'application/json'), (b'cookie', cookie.encode())],
+        }
+    listscope = scope('/featreq/req/open/', b'fields=id,title')
+    pollscope = scope('/featreq/changes/', 'since={0}&wait={1}'.format(lastid, wait).encode())
+
+    async def asgicall(sc):
+        sent = []
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        async def send(message):
+            sent.append(message)
+        await application(sc, receive, send)
+        return sent[0]['status']
+
+    def wsgicall(environ):
+        sent = []
+        runwsgi(environ, sent.append, threading.Event())
+        return sent[0][0]
+
+    def run(mode, listers):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        pool = ThreadPoolExecutor(workers)
+        latencies = []
+        async def lister(deadline):
+            while time.perf_counter() < deadline:
+                t0 = time.perf_counter()
+                if mode == 'asgi':
+                    status = await asgicall(listscope)
+                else:
+                    status = await loop.run_in_executor(pool, wsgicall, wsgienviron(listscope, b''))
+                assert status == 200, status
+                latencies.append(time.perf_counter() - t0)
+        async def poller(deadline):
+            while time.perf_counter() < deadline:
+                if mode == 'asgi':
+                    await asgicall(pollscope)
+                else:
+                    await loop.run_in_executor(pool, time.sleep, wait)
+        async def main():
+            deadline = time.perf_counter() + seconds
+            await asyncio.gather(*([ poller(deadline) for x in range(holders) ] +
+                [ lister(deadline) for x in range(listers) ]))
+        start = time.perf_counter()
+        loop.run_until_complete(main())
+        elapsed = time.perf_counter() - start
+        pool.shutdown()
+        loop.close()
+        return latencies, elapsed
+
+    rows = []
+    for mode in ('wsgi x{0}'.format(workers), 'asgi'):
+        for listers in clients:
+            for x in range(repeat):
+                latencies, elapsed = run(mode, listers)
+                latencies.sort()
+                pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0
+                rows.append((mode, listers, len(latencies), '{0:.0f}'.format(len(latencies) / elapsed),
+                    '{0:.1f}'.format(pct(0.5)), '{0:.1f}'.format(pct(0.99))))
+
+    print('{0} open requests, {1} idle long-polls ({2}s), {3}s per run, {4} ASGI threads'.format(
+        count, holders, wait, seconds, getattr(settings, 'IWS_ASGI_DB_THREADS', 4)))
+    printrows(rows, ('Server', 'Clients', 'Lists', 'Lists/s', 'p50 ms', 'p99 ms'))
+    print()
+
+# Run in a fresh interpreter by benchstartup(): loads the WSGI application
+# as the uWSGI master would, then forks a worker and times its first request
+STARTUP_CHILD = '''
+import os, sys, time, json
+t0 = time.perf_counter()
+sys.path.insert(0, {basedir!r})
+os.environ['DJANGO_SETTINGS_MODULE'] = 'iws.settings'
+from django.conf import settings
+settings.DATABASES['default']['NAME'] = {dbpath!r}
+settings.IWS_WARMUP = {warm!r}
+import iws.wsgi
+loaded = time.perf_counter() - t0
+rfd, wfd = os.pipe()
+pid = os.fork()
+if pid == 0:
+    t1 = time.perf_counter()
+    started = []
+    environ = {{
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': {path!r}, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+        'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'localhost', 'HTTP_ACCEPT': 'application/json', 'HTTP_COOKIE': {cookie!r},
+        'wsgi.input': sys.stdin.buffer, 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+        'wsgi.version': (1, 0), 'wsgi.multithread': False, 'wsgi.multiprocess': True, 'wsgi.run_once': False,
+    }}
+    result = iws.wsgi.application(environ, lambda status, headers, exc_info=None: started.append(status))
+    b''.join(result)
+    result.close()
+    os.write(wfd, json.dumps([time.perf_counter() - t1, started[0]]).encode())
+    os._exit(0)
+os.waitpid(pid, 0)
+first, status = json.loads(os.read(rfd, 4096).decode())
+print(json.dumps([loaded, first, status]))
+'''
+
+def benchstartup(path='/featreq/req/open/', repeat=5):
+    '''Application load time (uWSGI master) and time to first response in
+    a freshly forked (or recycled) worker, with and without warmup
+    '''
+    import json, statistics, subprocess
+    dbpath = djangosetup()
+    seedreqs(200)
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.test import Client
+    User.objects.create_user('bench', password='bench')
+    client = Client()
+    client.login(username='bench', password='bench')
+    cookie = '{0}={1}'.format(settings.SESSION_COOKIE_NAME, client.cookies[settings.SESSION_COOKIE_NAME].value)
+    basedir = os.path.dirname(os.path.abspath(__file__))
+
+    rows = []
+    for warm in (False, True):
+        code = STARTUP_CHILD.format(basedir=basedir, dbpath=dbpath, warm=warm, path=path, cookie=cookie)
+        results = []
+        for x in range(repeat):
+            out = subprocess.check_output([sys.executable, '-c', code], cwd=basedir)
+            results.append(json.loads(out.decode().strip().splitlines()[-1]))
+        loaded = statistics.median(res[0] for res in results)
+        first = statistics.median(res[1] for res in results)
+        rows.append(('on' if warm else 'off', results[-1][2], '{0:.1f}'.format(loaded * 1000),
+            '{0:.1f}'.format(first * 1000)))
+
+    print('GET {0}, median of {1} runs'.format(path, repeat))
+    printrows(rows, ('Warmup', 'Status', 'Load ms', 'First response ms'))
+    print()
+
+def benchreadmodel(count=5000, clients=50, repeat=5):
+    '''Open list GETs (all, and one client's) from the database vs the open
+    request read model, and the read model's own lookup and refresh times
+    '''
+    djangosetup()
+    clids = seedreqs(count, clients=clients)
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from featreq import readmodel
+    from featreq.models import OpenReq
+    User.objects.create_user('bench', password='bench')
+    client = Client()
+    client.login(username='bench', password='bench')
+    paths = (
+        ('all', '/featreq/req/open/?fields=id,title,prod_area'),
+        ('client', '/featreq/client/{0}/open/?fields=id,title'.format(clids[0])),
+    )
+
+    rows = []
+    model = readmodel.getopenmodel()
+    for enabled in (False, True):
+        readmodel.READ_MODEL = enabled
+        for name, path in paths:
+            elapsed = timeit(lambda: client.get(path, HTTP_ACCEPT='application/json'), repeat)
+            rows.append(('read model' if enabled else 'database', name, '{0:.2f}'.format(elapsed * 1000)))
+    readmodel.READ_MODEL = False
+
+    print('{0} open requests, {1} clients, best of {2}'.format(count, clients, repeat))
+    printrows(rows, ('Source', 'List', 'GET ms'))
+    print()
+
+    # Up to date (one event id check), and after one update (one client's
+    # open requests read again)
+    oreq = OpenReq.objects.filter(client_id=clids[0]).first()
+    def update():
+        OpenReq.objects.updatereq(oreq, date_tgt=datetime.timedelta(days=30))
+        model.openlist(clids[0])
+    model.load()
+    lookup = timeit(lambda: model.openlist(clids[0]), repeat)
+    rows = [
+        ('full load', '{0:.2f} ms'.format(timeit(model.load, repeat) * 1000)),
+        ('lookup, up to date', '{0:.0f} us'.format(lookup * 1e6)),
+        ('update, then lookup', '{0:.2f} ms'.format(timeit(update, repeat) * 1000)),
+    ]
+    printrows(rows, ('Read model', 'Time'))
+    print()
+
+def benchrecords(count=100000, repeat=3):
+    '''Time and peak memory listing link rows (as the client open/closed
+    list views do) from model instances vs row records
+    '''
+    import gc, tracemalloc
+    djangosetup()
+    seedreqs(count, desclen=40)
+    from featreq.models import OpenReq, ClosedReq, FeatureReq
+    from featreq.records import linkrecords
+    from featreq.views import linkprojection
+    fields = ['id', 'title', 'prod_area']
+
+    def instances(model):
+        qset = linkprojection(model.objects.all(), fields)
+        return [ (row.jsondict(), row.req.jsondict(fields)) for row in qset ]
+
+    def records(model):
+        return [ (row.jsondict(), row.req.jsondict(fields)) for row in linkrecords(model.objects.all(), 'req', fields) ]
+
+    rows = []
+    for model in (OpenReq, ClosedReq):
+        for name, func in (('instances', instances), ('records', records)):
+            elapsed = timeit(lambda: func(model), repeat)
+            gc.collect()
+            tracemalloc.start()
+            func(model)
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            rows.append((model.__name__, name, '{0:.0f}'.format(elapsed * 1000), '{0:.1f}'.format(peak / 2**20)))
+
+    print('{0} rows per list, with request fields {1}, best of {2}'.format(count, ','.join(fields), repeat))
+    printrows(rows, ('Model', 'Rows as', 'List ms', 'Peak MB'))
+    print()
+
+IMPORTS_CHILD = '''
+import runpy, sys
+sys.path.insert(0, {basedir!r})
+sys.argv = [{script!r}] + {argv!r}
+import os
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'iws.settings')
+from django.conf import settings
+settings.DATABASES['default']['NAME'] = {dbpath!r}
+runpy.run_path({script!r}, run_name='__main__')
+'''
+
+# Budget (ms of imports) for the slim entry point, and modules it mustn't load
+IMPORTS_BUDGET = 250
+IMPORTS_DEFERRED = ('featreq.views', 'django.contrib.admin', 'django.contrib.auth', 'numpy', 'asyncio')
+
+def importtimes(stderr):
+    '''Parses -X importtime output. Returns tuple of (total ms, set of
+    module names imported).
+    '''
+    total, modules = 0, set()
+    for line in stderr.splitlines():
+        # (skipping the header line)
+        if not line.startswith('import time:') or line.endswith('| imported package'):
+            continue
+        selfus, cumus, name = line[len('import time:'):].split('|')
+        modules.add(name.strip())
+        # Only top-level imports count towards the total (the rest are
+        # included in their cumulative times)
+        if len(name) - len(name.lstrip()) == 1:
+            total += int(cumus)
+    return total / 1000, modules
+
+def benchimports(argv=('featreq_export', '--types', 'client'), repeat=5):
+    '''Import time and process run time of a featreq command under manage.py
+    and the slim cli.py, checking cli.py against IMPORTS_BUDGET. Returns
+    False if over budget or any of IMPORTS_DEFERRED were loaded.
+    '''
+    import statistics, subprocess
+    dbpath = djangosetup()
+    seedreqs(50)
+    basedir = os.path.dirname(os.path.abspath(__file__))
+
+    rows, ok = [], True
+    for script in ('manage.py', 'cli.py'):
+        code = IMPORTS_CHILD.format(basedir=basedir, script=script, argv=list(argv), dbpath=dbpath)
+        imptimes, runtimes = [], []
+        for x in range(repeat):
+            start = time.perf_counter()
+            proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=basedir,
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+            runtimes.append(time.perf_counter() - start)
+            imptime, modules = importtimes(proc.stderr.decode())
+            imptimes.append(imptime)
+        deferred = [ name for name in IMPORTS_DEFERRED
+            if any(mod == name or mod.startswith(name + '.') for mod in modules) ]
+        imptime = statistics.median(imptimes)
+        if script == 'cli.py':
+            over = imptime > IMPORTS_BUDGET
+            ok = ok and not over and not deferred
+            budget = '{0} ({1})'.format(IMPORTS_BUDGET, 'OVER' if over else 'ok')
+        else:
+            budget = '-'
+        rows.append((script, '{0:.1f}'.format(imptime), '{0:.1f}'.format(statistics.median(runtimes) * 1000),
+            budget, ', '.join(deferred) or '-'))
+
+    print('{0}, median of {1} runs'.format(' '.join(argv), repeat))
+    printrows(rows, ('Entry point', 'Import ms', 'Run ms', 'Budget ms', 'Loaded'))
+    print()
+    return ok
+
+if __name__ == "__main__":
+    # Parse cmdline args
+    parser = argparse.ArgumentParser(description='Run performance benchmarks')
+    parser.add_argument('-c', '--codec', action='store_true', help='JSON codec encode/decode throughput')
+    parser.add_argument('-p', '--projection', action='store_true', help='field projection on joined list queries')
+    parser.add_argument('-u', '--uuid-keys', action='store_true', dest='uuidkeys', help='index size/join speed of hex vs binary UUID keys')
+    parser.add_argument('-d', '--desc', action='store_true', help='description storage: text or compressed in featreqs vs a side table')
+    parser.add_argument('-w', '--writes', action='store_true', help='per-call vs group-committed writes at 500/s')
+    parser.add_argument('-a', '--asgi', action='store_true', help='sync workers vs ASGI under concurrent lists and long-polls')
+    parser.add_argument('-s', '--startup', action='store_true', help='worker time-to-first-response with and without warmup')
+    parser.add_argument('-m', '--read-model', action='store_true', dest='readmodel', help='open list GETs from the database vs the in-memory read model')
+    parser.add_argument('-l', '--link-records', action='store_true', dest='records', help='link list memory/time with model instances vs row records')
+    parser.add_argument('-i', '--imports', action='store_true', help='command import time under manage.py vs cli.py (exits 1 if over budget)')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='repetitions per measurement (best is kept)')
+    args = parser.parse_args()
+
+    if args.codec:
+        benchcodec(repeat=args.repeat)
+    if args.projection:
+        benchprojection(repeat=args.repeat)
+    if args.uuidkeys:
+        benchuuidkeys(repeat=args.repeat)
+    if args.desc:
+        benchdesc(repeat=args.repeat)
+    if args.writes:
+        benchwrites(repeat=args.repeat)
+    if args.asgi:
+        benchasgi(repeat=args.repeat)
+    if args.startup:
+        benchstartup(repeat=args.repeat)
+    if args.readmodel:
+        benchreadmodel(repeat=args.repeat)
+    if args.records:
+        benchrecords(repeat=args.repeat)
+    if args.imports and not benchimports(repeat=args.repeat):
+        sys.exit(1)
@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+import os
+import sys
+
+## Slim entry point for the featreq commands
+# For cron jobs and scripts: same as manage.py, but for the featreq_*
+# commands only the featreq app is installed (its models don't depend on
+# any other), so the admin, auth, sessions and the rest are never imported.
+# Any other command runs with the full set of apps, as under manage.py.
+
+CLI_APPS = ['featreq.apps.FeatreqConfig']
+
+if __name__ == "__main__":
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "iws.settings")
+
+    from django.conf import settings
+
+    if len(sys.argv) > 1 and sys.argv[1].startswith('featreq_'):
+        settings.INSTALLED_APPS = CLI_APPS
+
+    from django.core.management import execute_from_command_line
+
+    execute_from_command_line(sys.argv)
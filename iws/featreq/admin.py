@@ -1,7 +1,186 @@
+import datetime
+from django import forms
 from django.contrib import admin
-from .models import FeatureReq, ClientInfo, OpenReq, ClosedReq
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from .models import FeatureReq, FeatureReqDesc, ClientInfo, OpenReq, ClosedReq
+from .utils import validuuid, checkdatetgt, DATEONLYFMT
 
-admin.site.register(FeatureReq)
-admin.site.register(ClientInfo)
-admin.site.register(OpenReq)
-admin.site.register(ClosedReq)
+## Row count estimation
+# The default changelist paginator runs COUNT(*) over the whole table on
+# every page view, which is a full scan on SQLite. For unfiltered lists on
+# large tables, we use the database's own row estimate instead.
+
+# Tables estimated below this many rows are still counted exactly
+ESTIMATE_THRESHOLD = 10000
+
+def estimatecount(model, using='default'):
+    '''Returns estimated row count of model's table, or None if the
+    database can't provide one cheaply.
+    '''
+    conn = connections[using]
+    table = model._meta.db_table
+
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            # Row count from ANALYZE statistics, if gathered
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='sqlite_stat1'")
+            if cursor.fetchone():
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+                row = cursor.fetchone()
+                if row:
+                    return int(row[0].split()[0])
+            # Otherwise highest rowid, which is an index lookup (overestimates
+            # by the number of rows deleted)
+            cursor.execute('SELECT MAX(rowid) FROM {0}'.format(conn.ops.quote_name(table)))
+            row = cursor.fetchone()
+            return row[0] or 0
+        elif conn.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [table])
+            row = cursor.fetchone()
+            if row and row[0] >= 0:
+                return int(row[0])
+
+    return None
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator using estimated row counts for unfiltered large tables"""
+
+    @property
+    def count(self):
+        try:
+            return self._estcount
+        except AttributeError:
+            pass
+
+        qset = self.object_list
+        est = None
+        # Only unfiltered querysets can use the table estimate
+        if hasattr(qset, 'query') and not qset.query.where:
+            est = estimatecount(qset.model, qset.db)
+        if est is not None and est >= ESTIMATE_THRESHOLD:
+            self._estcount = est
+        else:
+            self._estcount = super(EstimatedCountPaginator, self).count
+        return self._estcount
+
+
+## Admin classes
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Base admin for tables which may grow to millions of rows"""
+
+    paginator = EstimatedCountPaginator
+    # Skip the second, unfiltered COUNT(*) shown next to filtered results
+    show_full_result_count = False
+    list_per_page = 50
+    # Indexed column searched by prefix (also needs search_fields set, so
+    # the search box is shown)
+    prefix_field = None
+
+    def get_search_results(self, request, queryset, search_term):
+        '''Searches by prefix of prefix_field as a range on that column, since
+        the LIKE used for '^field' search_fields can't use its index.
+        Note this is case-sensitive, unlike the default search.
+        '''
+        term = search_term.strip()
+        if not self.prefix_field:
+            return super(LargeTableAdmin, self).get_search_results(request, queryset, search_term)
+        if not term:
+            return queryset, False
+        return queryset.filter(**{
+            self.prefix_field + '__gte': term,
+            self.prefix_field + '__lt': term + '\uffff',
+        }), False
+
+# Descriptions are in their own table (see FeatureReqDesc), so they're
+# edited inline with their request
+class FeatureReqDescInline(admin.StackedInline):
+    model = FeatureReqDesc
+    can_delete = False
+
+@admin.register(FeatureReq)
+class FeatureReqAdmin(LargeTableAdmin):
+    list_display = ('title', 'prod_area', 'date_cr', 'user_cr', 'date_up', 'user_up')
+    inlines = (FeatureReqDescInline,)
+    # date_cr is indexed, so both filtering and ordering use the index
+    list_filter = ('date_cr',)
+    ordering = ('-date_cr',)
+    # title is indexed, so prefix searches use a range on it
+    search_fields = ('^title',)
+    prefix_field = 'title'
+
+    def get_search_results(self, request, queryset, search_term):
+        '''Searches by request id or creation date (yyyy-mm-dd) if search_term
+        is one, using the indexed id/date_cr fields, otherwise by title prefix.
+        '''
+        term = search_term.strip()
+        uid = validuuid(term) if term else None
+        if uid:
+            return queryset.filter(id=uid), False
+        try:
+            day = datetime.datetime.strptime(term, DATEONLYFMT).replace(tzinfo=datetime.timezone.utc)
+        except ValueError:
+            return super(FeatureReqAdmin, self).get_search_results(request, queryset, search_term)
+        else:
+            nextday = day + datetime.timedelta(days=1)
+            return queryset.filter(date_cr__gte=day, date_cr__lt=nextday), False
+
+@admin.register(ClientInfo)
+class ClientInfoAdmin(LargeTableAdmin):
+    list_display = ('name', 'con_name', 'con_mail', 'date_add')
+    # name is indexed, so ordering uses the index, and prefix searches use
+    # a range on it
+    ordering = ('name',)
+    search_fields = ('^name',)
+    prefix_field = 'name'
+
+class LinkAdmin(LargeTableAdmin):
+    """Base admin for OpenReq/ClosedReq"""
+
+    # Client and request are fetched in the same query, and shown by
+    # column instead of through __str__
+    list_select_related = ('client', 'req')
+    search_fields = ('^client__name',)
+    prefix_field = 'client__name'
+    # Selecting from millions of requests in a dropdown isn't an option
+    raw_id_fields = ('client', 'req')
+
+    def req_title(self, obj):
+        return obj.req.title
+    req_title.short_description = 'Request'
+    req_title.admin_order_field = 'req__title'
+
+    def client_name(self, obj):
+        return obj.client.name
+    client_name.short_description = 'Client'
+    client_name.admin_order_field = 'client__name'
+
+class OpenReqForm(forms.ModelForm):
+    """Open request form, refusing new targets already passed (as the API
+    does, so the overdue scan can find them; see deadlines.py)"""
+
+    def clean_date_tgt(self):
+        date_tgt = self.cleaned_data.get('date_tgt')
+        if date_tgt and 'date_tgt' in self.changed_data:
+            try:
+                checkdatetgt(date_tgt)
+            except ValueError as e:
+                raise ValidationError(str(e))
+        return date_tgt
+
+@admin.register(OpenReq)
+class OpenReqAdmin(LinkAdmin):
+    form = OpenReqForm
+    list_display = ('req_title', 'client_name', 'priority', 'date_tgt', 'opened_at', 'opened_by')
+    # Filtering by client and ordering by priority use the (client, priority) index
+    list_filter = ('client',)
+    ordering = ('client', 'priority')
+
+@admin.register(ClosedReq)
+class ClosedReqAdmin(LinkAdmin):
+    list_display = ('req_title', 'client_name', 'status', 'closed_at', 'closed_by', 'opened_at', 'priority')
+    # client and closed_at are indexed
+    list_filter = ('client', 'closed_at')
+    ordering = ('-closed_at',)
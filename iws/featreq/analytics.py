@@ -0,0 +1,374 @@
+import itertools, math
+from array import array
+from django.db import connection, transaction
+from .models import ClientInfo, ChangeEvent, AREA_CHOICES, STATUS_CHOICES
+from .archive import archiveenabled
+from .utils import ordereddict
+
+# numpy is optional, and takes longer to import than the rest of the app
+# put together, so it's only looked for once analytics are first computed
+_numpy = False
+
+def getnumpy():
+    '''Returns numpy module, or None if not installed'''
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy = numpy
+    return _numpy
+
+## Closed request analytics
+# Lead time (opened_at to closed_at), target date slippage (date_tgt to
+# closed_at, for requests which had one) and priority churn (the number of
+# times the open request's priority changed, whether updated directly or
+# shifted by another's, as recorded by 'opened', 'open_updated' and
+# 'reprioritized' change events) over all closed requests, main and
+# archived, grouped by client, product area and status.
+#
+# Rows are read in keyset-paginated chunks of plain numbers (the database
+# computes the day differences and group codes), and each chunk is folded
+# into per-group accumulators: counts, sums and maxima (a few numbers per
+# possible group), and histograms with one-day bins for medians/percentiles.
+# Histograms are sparse, holding counts only for the (group, bin) pairs
+# actually seen, since most groups (client x area x status) never occur,
+# and those which do only cover a fraction of the range. Memory use is
+# bounded by the number of groups and distinct day values, not rows. With
+# NumPy installed, chunks are folded with vectorized bincounts and sorted
+# merges; otherwise, a plain loop over array module buffers and dicts does
+# the same work more slowly.
+#
+# The queries use SQLite date functions, as does the rest of the app's
+# storage layer (see fields.py), and churn is counted with its JSON and
+# window functions (so needs SQLite 3.25 or later). 'reprioritized' events
+# list requests by string id, so churn is keyed by hex request id.
+
+# Rows per chunk
+CHUNK_ROWS = 100000
+
+# Group dimensions, in the order group codes are built
+GROUP_DIMS = ('client', 'prod_area', 'status')
+AREA_CODES = tuple(k for k, v in AREA_CHOICES if k)
+STATUS_CODES = tuple(k for k, v in STATUS_CHOICES if k)
+
+# Histogram ranges (days); values outside are clamped to the end bins
+LEAD_BINS = 1096
+SLIP_MIN = -365
+SLIP_BINS = 1096
+
+# Stand-in for NULL slippage (no target date), well outside any real value
+NO_SLIP = -1.0e9
+
+def _casesql(expr, codes):
+    '''Returns SQL CASE expression mapping expr to index in codes, or -1'''
+    whens = ' '.join("WHEN '{0}' THEN {1}".format(code, idx) for idx, code in enumerate(codes))
+    return 'COALESCE(CASE {0} {1} END, -1)'.format(expr, whens)
+
+def _chunksql(table, witharchive):
+    '''Returns SQL selecting one chunk of closed requests from table as
+    (id, client rowid, area index, status index, lead days, slip days,
+    churn), after a given id.
+    '''
+    if witharchive:
+        area = 'COALESCE(f.prod_area, af.prod_area)'
+        archjoin = 'LEFT JOIN "archive"."featreqs" af ON af.id = c.req_id'
+    else:
+        area = 'f.prod_area'
+        archjoin = ''
+    return '''SELECT c.id, cl.rowid, {area}, {status},
+            julianday(c.closed_at) - julianday(c.opened_at),
+            COALESCE(julianday(c.closed_at) - julianday(c.date_tgt), {noslip}),
+            COALESCE(ch.n, 0)
+        FROM {table} c
+        JOIN clients cl ON cl.id = c.client_id
+        LEFT JOIN featreqs f ON f.id = c.req_id
+        {archjoin}
+        LEFT JOIN temp.iws_churn ch
+            ON ch.client_id = c.client_id AND ch.req_hex = hex(c.req_id)
+        WHERE c.id > %s ORDER BY c.id LIMIT %s'''.format(
+            area=_casesql(area, AREA_CODES), status=_casesql('c.status', STATUS_CODES),
+            noslip=NO_SLIP, table=table, archjoin=archjoin)
+
+def _churnsql():
+    '''Returns SQL statements creating temp.iws_churn, of (client id, hex
+    request id, number of priority changes) from the change event table
+    (to be formatted in), and its index.
+    '''
+    # Each open request's priority as of every event recording it
+    seen = """SELECT id, client_id, hex(req_id) AS req_hex, json_extract(data, '$.priority') AS pri
+            FROM {0} WHERE kind IN ('opened', 'open_updated')
+        UNION ALL
+        SELECT e.id, e.client_id, upper(replace(json_extract(p.value, '$[0]'), '-', '')), json_extract(p.value, '$[1]')
+            FROM {0} e, json_each(e.data, '$.priorities') p WHERE e.kind = 'reprioritized'"""
+    return ('''CREATE TEMP TABLE iws_churn AS SELECT client_id, req_hex, COUNT(*) AS n
+            FROM (SELECT client_id, req_hex, pri,
+                    LAG(pri) OVER w AS prevpri, ROW_NUMBER() OVER w AS seq
+                FROM (''' + seen + ''')
+                WINDOW w AS (PARTITION BY client_id, req_hex ORDER BY id))
+            WHERE seq > 1 AND pri IS NOT prevpri GROUP BY client_id, req_hex''',
+        'CREATE INDEX temp.iws_churn_key ON iws_churn (client_id, req_hex)')
+
+
+class SparseHist(object):
+    """Histogram counts per (group, bin), held only for pairs seen"""
+
+    def __init__(self, bins, numpy=None):
+        self.bins = bins
+        self.numpy = numpy
+        if numpy is not None:
+            # Sorted keys (group * bins + bin) and their counts
+            self.keys = numpy.zeros(0, dtype=numpy.int64)
+            self.counts = numpy.zeros(0, dtype=numpy.int64)
+        else:
+            self.counts = {}
+
+    def addmany(self, group, binidx):
+        '''Adds one to each (group, bin) pair of NumPy arrays group and binidx'''
+        np = self.numpy
+        keys, counts = np.unique(group * self.bins + binidx, return_counts=True)
+        self.keys, inv = np.unique(np.concatenate((self.keys, keys)), return_inverse=True)
+        self.counts = np.bincount(inv, weights=np.concatenate((self.counts, counts)),
+            minlength=len(self.keys)).astype(np.int64)
+
+    def add(self, group, binidx):
+        '''Adds one to (group, bin)'''
+        key = group * self.bins + binidx
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def items(self):
+        '''Generator yielding (group, bin, count) for each pair seen'''
+        if self.numpy is not None:
+            pairs = zip(self.keys.tolist(), self.counts.tolist())
+        else:
+            pairs = self.counts.items()
+        for key, count in pairs:
+            group, binidx = divmod(key, self.bins)
+            yield group, binidx, count
+
+
+class Accumulator(object):
+    """Per-group running totals and histograms"""
+
+    def __init__(self, groups):
+        self.groups = groups
+        self.numpy = numpy = getnumpy()
+        if numpy is not None:
+            zeros = lambda size, dtype: numpy.zeros(size, dtype=dtype)
+            inttype, floattype = numpy.int64, numpy.float64
+        else:
+            zeros = lambda size, dtype: array(dtype, bytes(array(dtype).itemsize * size))
+            inttype, floattype = 'q', 'd'
+        self.count = zeros(groups, inttype)
+        self.leadsum = zeros(groups, floattype)
+        self.leadhist = SparseHist(LEAD_BINS, numpy)
+        self.slipcount = zeros(groups, inttype)
+        self.slipsum = zeros(groups, floattype)
+        self.latecount = zeros(groups, inttype)
+        self.sliphist = SparseHist(SLIP_BINS, numpy)
+        self.churnsum = zeros(groups, inttype)
+        self.churnmax = zeros(groups, inttype)
+
+    def add(self, group, lead, slip, churn):
+        '''Adds rows given as sequences of group index, lead days, slip days
+        (or NO_SLIP) and churn count.
+        '''
+        if self.numpy is not None:
+            self._addnumpy(group, lead, slip, churn)
+        else:
+            self._addpython(group, lead, slip, churn)
+
+    def _addnumpy(self, group, lead, slip, churn):
+        np, groups = self.numpy, self.groups
+        self.count += np.bincount(group, minlength=groups)
+        self.leadsum += np.bincount(group, weights=lead, minlength=groups)
+        leadbin = np.clip(np.floor(lead), 0, LEAD_BINS - 1).astype(np.int64)
+        self.leadhist.addmany(group, leadbin)
+
+        hasslip = slip > NO_SLIP / 2
+        sgroup, slip = group[hasslip], slip[hasslip]
+        self.slipcount += np.bincount(sgroup, minlength=groups)
+        self.slipsum += np.bincount(sgroup, weights=slip, minlength=groups)
+        self.latecount += np.bincount(sgroup[slip > 0], minlength=groups)
+        slipbin = np.clip(np.floor(slip) - SLIP_MIN, 0, SLIP_BINS - 1).astype(np.int64)
+        self.sliphist.addmany(sgroup, slipbin)
+
+        churn = churn.astype(np.int64)
+        self.churnsum += np.bincount(group, weights=churn, minlength=groups).astype(np.int64)
+        np.maximum.at(self.churnmax, group, churn)
+
+    def _addpython(self, group, lead, slip, churn):
+        for g, ld, sl, ch in zip(group, lead, slip, churn):
+            ch = int(ch)
+            self.count[g] += 1
+            self.leadsum[g] += ld
+            self.leadhist.add(g, min(max(int(math.floor(ld)), 0), LEAD_BINS - 1))
+            if sl > NO_SLIP / 2:
+                self.slipcount[g] += 1
+                self.slipsum[g] += sl
+                if sl > 0:
+                    self.latecount[g] += 1
+                self.sliphist.add(g, min(max(int(math.floor(sl)) - SLIP_MIN, 0), SLIP_BINS - 1))
+            self.churnsum[g] += ch
+            if ch > self.churnmax[g]:
+                self.churnmax[g] = ch
+
+def histquantile(hist, q, offset=0):
+    '''Returns value (bin index plus offset) at quantile q of histogram
+    hist (dict of bin index to count), or None if empty.
+    '''
+    total = sum(hist.values())
+    if not total:
+        return None
+    # Zero-based position of quantile value
+    target = min(int(q * total), total - 1)
+    seen = 0
+    for idx in sorted(hist):
+        seen += hist[idx]
+        if seen > target:
+            return idx + offset
+    return None
+
+def _readchunks(witharchive):
+    '''Generator yielding chunks of closed request rows (see _chunksql()),
+    from the main and (if witharchive) archive tables.
+    '''
+    tables = ['"closedreqs"']
+    if witharchive:
+        tables.append('"archive"."closedreqs"')
+    with connection.cursor() as cursor:
+        for table in tables:
+            sql = _chunksql(table, witharchive)
+            lastid = 0
+            while True:
+                cursor.execute(sql, [lastid, CHUNK_ROWS])
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                lastid = rows[-1][0]
+                yield rows
+
+def parsegroup(groupstr):
+    '''Returns tuple of group dimensions from comma-separated string
+    groupstr (empty for totals only). Raises ValueError if any are invalid.
+    '''
+    group = tuple(dim.strip() for dim in groupstr.split(',') if dim.strip())
+    for dim in group:
+        if dim not in GROUP_DIMS:
+            raise ValueError('Invalid group: {0}'.format(dim))
+    return group
+
+def closedmetrics(group=GROUP_DIMS):
+    '''Computes closed request metrics grouped by the dimensions in group
+    (any of 'client', 'prod_area', 'status', or none for totals only).
+
+    Returns tuple of (list of per-group dicts, number of rows read).
+    Raises ValueError for invalid group dimensions or if the database isn't
+    SQLite (3.25 or later).
+    '''
+    for dim in group:
+        if dim not in GROUP_DIMS:
+            raise ValueError('Invalid group: {0}'.format(dim))
+    if connection.vendor != 'sqlite' or connection.Database.sqlite_version_info < (3, 25):
+        raise ValueError('Analytics requires SQLite 3.25 or later')
+
+    witharchive = archiveenabled()
+    nareas, nstatus = len(AREA_CODES), len(STATUS_CODES)
+    numpy = getnumpy()
+    rowcount = 0
+
+    # Single read transaction, for a consistent snapshot
+    with transaction.atomic():
+        clients = list(ClientInfo.objects.extra(select={'rowid': 'clients.rowid'}).order_by(
+            'rowid').values_list('rowid', 'id'))
+        clrowids = [ rowid for rowid, cid in clients ]
+        clindex = { rowid: idx for idx, rowid in enumerate(clrowids) }
+        acc = Accumulator(max(len(clients), 1) * nareas * nstatus)
+
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS temp.iws_churn')
+            for stmt in _churnsql():
+                cursor.execute(stmt.format(connection.ops.quote_name(ChangeEvent._meta.db_table)))
+
+        for rows in _readchunks(witharchive):
+            rowcount += len(rows)
+            if numpy is not None:
+                arr = numpy.fromiter(itertools.chain.from_iterable(rows), dtype=numpy.float64,
+                    count=len(rows) * 7).reshape(len(rows), 7)
+                # Client rowids (sorted) to dense indexes
+                clidx = numpy.searchsorted(numpy.asarray(clrowids, dtype=numpy.float64), arr[:, 1])
+                area, status = arr[:, 2].astype(numpy.int64), arr[:, 3].astype(numpy.int64)
+                valid = (area >= 0) & (status >= 0)
+                grp = (clidx * nareas + area) * nstatus + status
+                acc.add(grp[valid], arr[valid, 4], arr[valid, 5], arr[valid, 6])
+            else:
+                rows = [ row for row in rows if row[2] >= 0 and row[3] >= 0 ]
+                acc.add(
+                    [ (clindex[row[1]] * nareas + row[2]) * nstatus + row[3] for row in rows ],
+                    [ row[4] for row in rows ], [ row[5] for row in rows ], [ row[6] for row in rows ])
+
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS temp.iws_churn')
+
+    return _rollup(acc, clients, group), rowcount
+
+def _rollup(acc, clients, group):
+    '''Returns list of dicts of metrics from acc, summed over the
+    dimensions not in group.
+    '''
+    nareas, nstatus = len(AREA_CODES), len(STATUS_CODES)
+    merged = ordereddict()
+    # Group index -> merged totals
+    bygroup = {}
+
+    for g in range(acc.groups):
+        if not acc.count[g]:
+            continue
+        clidx, rest = divmod(g, nareas * nstatus)
+        areaidx, statusidx = divmod(rest, nstatus)
+        keyvals = {
+            'client': str(clients[clidx][1]),
+            'prod_area': dict(AREA_CHOICES)[AREA_CODES[areaidx]],
+            'status': dict(STATUS_CHOICES)[STATUS_CODES[statusidx]],
+        }
+        key = tuple(keyvals[dim] for dim in group)
+        try:
+            m = merged[key]
+        except KeyError:
+            m = merged[key] = {
+                'count': 0, 'leadsum': 0.0, 'leadhist': {},
+                'slipcount': 0, 'slipsum': 0.0, 'latecount': 0, 'sliphist': {},
+                'churnsum': 0, 'churnmax': 0,
+            }
+        bygroup[g] = m
+        m['count'] += int(acc.count[g])
+        m['leadsum'] += float(acc.leadsum[g])
+        m['slipcount'] += int(acc.slipcount[g])
+        m['slipsum'] += float(acc.slipsum[g])
+        m['latecount'] += int(acc.latecount[g])
+        m['churnsum'] += int(acc.churnsum[g])
+        m['churnmax'] = max(m['churnmax'], int(acc.churnmax[g]))
+
+    for name in ('leadhist', 'sliphist'):
+        for g, binidx, count in getattr(acc, name).items():
+            hist = bygroup[g][name]
+            hist[binidx] = hist.get(binidx, 0) + count
+
+    dimnames = { 'client': 'client_id', 'prod_area': 'prod_area', 'status': 'status' }
+    results = []
+    for key, m in merged.items():
+        row = ordereddict((dimnames[dim], val) for dim, val in zip(group, key))
+        count, slipcount = m['count'], m['slipcount']
+        row['count'] = count
+        row['lead_mean_days'] = round(m['leadsum'] / count, 2)
+        row['lead_median_days'] = histquantile(m['leadhist'], 0.5)
+        row['lead_p90_days'] = histquantile(m['leadhist'], 0.9)
+        row['slip_count'] = slipcount
+        row['slip_mean_days'] = round(m['slipsum'] / slipcount, 2) if slipcount else None
+        row['slip_median_days'] = histquantile(m['sliphist'], 0.5, SLIP_MIN)
+        row['late_count'] = m['latecount']
+        row['churn_mean'] = round(m['churnsum'] / count, 3)
+        row['churn_max'] = m['churnmax']
+        results.append(row)
+    return results
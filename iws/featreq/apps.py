@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class FeatreqConfig(AppConfig):
     name = 'featreq'
     verbose_name = 'Feature requests'
+
+    def ready(self):
+        # Connect archive database and SQLite journal mode signal handlers
+        from . import archive, db
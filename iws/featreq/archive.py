@@ -0,0 +1,158 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from .models import FeatureReq, FeatureReqDesc, ClosedReq, ArchivedFeatureReq, ArchivedClosedReq, ARCHIVE_SCHEMA
+
+## Archive database
+# If IWS_ARCHIVE_DB is set (to an SQLite file path), it's attached to every
+# SQLite connection as schema 'archive'. Its tables are created (or brought
+# up to date) if missing on the first connection in each process only, so
+# later connections just run the ATTACH. Rows are moved with INSERT ... SELECT and DELETE on the same
+# connection, so each batch moves atomically, and no change events are
+# recorded (archived rows haven't changed, they've only moved). Archived
+# requests keep their descriptions inline, since the archive is rarely
+# scanned; they're copied from the side table (see FeatureReqDesc) as
+# stored, still compressed.
+
+ARCHIVE_DB = getattr(settings, 'IWS_ARCHIVE_DB', None)
+# Rows moved per transaction
+ARCHIVE_BATCH = 500
+
+# Column types as Django creates them on SQLite for the main tables
+ARCHIVE_DDL = (
+    '''CREATE TABLE IF NOT EXISTS "{0}"."featreqs" (
+        "id" blob NOT NULL PRIMARY KEY, "title" varchar(128) NOT NULL, "desc" blob NOT NULL,
+        "ref_url" varchar(254) NOT NULL, "prod_area" varchar(2) NOT NULL,
+        "date_cr" datetime NOT NULL, "date_up" datetime NOT NULL,
+        "user_cr" varchar(30) NOT NULL, "user_up" varchar(30) NOT NULL,
+        "version" integer unsigned NOT NULL DEFAULT 1)''',
+    '''CREATE TABLE IF NOT EXISTS "{0}"."closedreqs" (
+        "id" integer NOT NULL PRIMARY KEY, "client_id" blob NOT NULL, "req_id" blob NOT NULL,
+        "priority" smallint NULL, "date_tgt" datetime NULL,
+        "opened_at" datetime NOT NULL, "opened_by" varchar(30) NOT NULL,
+        "closed_at" datetime NOT NULL, "closed_by" varchar(30) NOT NULL,
+        "status" varchar(1) NOT NULL, "reason" varchar(128) NOT NULL)''',
+    'CREATE INDEX IF NOT EXISTS "{0}"."closedreqs_client_id" ON "closedreqs" ("client_id", "closed_at")',
+    'CREATE INDEX IF NOT EXISTS "{0}"."closedreqs_req_id" ON "closedreqs" ("req_id")',
+    'CREATE INDEX IF NOT EXISTS "{0}"."closedreqs_closed_at" ON "closedreqs" ("closed_at")',
+)
+# Columns added since archives were first created, as (table, column, definition)
+ARCHIVE_COLUMNS = (
+    ('featreqs', 'version', '"version" integer unsigned NOT NULL DEFAULT 1'),
+)
+
+# Set once the archive's tables have been checked in this process
+_archiveready = False
+
+def archiveenabled(conn=None):
+    '''Returns True if the archive database is configured and usable'''
+    return bool(ARCHIVE_DB) and (conn or connection).vendor == 'sqlite'
+
+def setuparchive(cursor):
+    '''Creates archive tables if missing, and adds any columns missing from
+    older archives, using cursor (on a connection with the archive attached)
+    '''
+    for stmt in ARCHIVE_DDL:
+        cursor.execute(stmt.format(ARCHIVE_SCHEMA))
+    for table, column, coldef in ARCHIVE_COLUMNS:
+        cursor.execute('PRAGMA "{0}".table_info("{1}")'.format(ARCHIVE_SCHEMA, table))
+        if column not in [ row[1] for row in cursor.fetchall() ]:
+            cursor.execute('ALTER TABLE "{0}"."{1}" ADD COLUMN {2}'.format(ARCHIVE_SCHEMA, table, coldef))
+
+@receiver(connection_created)
+def attacharchive(sender, connection, **kwargs):
+    '''Attaches archive database to new connections (setting up its tables
+    on the first in this process)
+    '''
+    global _archiveready
+    if not archiveenabled(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('ATTACH DATABASE %s AS "{0}"'.format(ARCHIVE_SCHEMA), [ARCHIVE_DB])
+        if not _archiveready:
+            setuparchive(cursor)
+            _archiveready = True
+
+def _moverows(cursor, model, archmodel, pkvals):
+    '''Copies rows of model with primary keys pkvals to archmodel's table,
+    then deletes them from model's table.
+    '''
+    qn = connection.ops.quote_name
+    cols = ', '.join(qn(f.column) for f in model._meta.concrete_fields)
+    pk = model._meta.pk
+    params = [ pk.get_db_prep_value(val, connection) for val in pkvals ]
+    marks = ', '.join(['%s'] * len(params))
+    cursor.execute('INSERT INTO {0} ({1}) SELECT {1} FROM {2} WHERE {3} IN ({4})'.format(
+        qn(archmodel._meta.db_table), cols, qn(model._meta.db_table), qn(pk.column), marks), params)
+    cursor.execute('DELETE FROM {0} WHERE {1} IN ({2})'.format(
+        qn(model._meta.db_table), qn(pk.column), marks), params)
+
+def _movereqs(cursor, pkvals):
+    '''Copies feature requests with ids pkvals, with their descriptions, to
+    the archive, then deletes them (and their descriptions) from the main
+    tables.
+    '''
+    qn = connection.ops.quote_name
+    reqtable, desctable = qn(FeatureReq._meta.db_table), qn(FeatureReqDesc._meta.db_table)
+    cols = [ qn(f.column) for f in FeatureReq._meta.concrete_fields ]
+    pk = FeatureReq._meta.pk
+    params = [ pk.get_db_prep_value(val, connection) for val in pkvals ]
+    marks = ', '.join(['%s'] * len(params))
+    nodesc = ArchivedFeatureReq._meta.get_field('desc').get_db_prep_value('', connection)
+    cursor.execute('INSERT INTO {0} ({1}, "desc") SELECT {2}, COALESCE({3}."body", %s) FROM {4} '
+        'LEFT OUTER JOIN {3} ON {3}."req_id" = {4}.{5} WHERE {4}.{5} IN ({6})'.format(
+            qn(ArchivedFeatureReq._meta.db_table), ', '.join(cols),
+            ', '.join('{0}.{1}'.format(reqtable, col) for col in cols),
+            desctable, reqtable, qn(pk.column), marks), [nodesc] + params)
+    cursor.execute('DELETE FROM {0} WHERE "req_id" IN ({1})'.format(desctable, marks), params)
+    cursor.execute('DELETE FROM {0} WHERE {1} IN ({2})'.format(reqtable, qn(pk.column), marks), params)
+
+def archiveclosed(cutoff, withreqs=False, batch=ARCHIVE_BATCH, dryrun=False):
+    '''Moves closed requests closed before datetime cutoff to the archive.
+
+    If withreqs is True, also moves feature requests last updated before
+    cutoff which have no open or closed requests left in the main database,
+    and at least one archived closed request.
+
+    Returns tuple of (closed requests moved, feature requests moved). If
+    dryrun is True, nothing is moved, and the counts are of rows which
+    would have been (not including feature requests which would only
+    qualify once this run's closed requests were moved).
+
+    Raises ValueError if the archive database is not configured.
+    '''
+    if not archiveenabled():
+        raise ValueError('Archive database not configured (set IWS_ARCHIVE_DB)')
+
+    closedqset = ClosedReq.objects.filter(closed_at__lt=cutoff)
+    if dryrun:
+        closedcount = closedqset.count()
+    else:
+        closedcount = 0
+        while True:
+            with transaction.atomic(), connection.cursor() as cursor:
+                ids = list(closedqset.order_by('id').values_list('id', flat=True)[:batch])
+                if not ids:
+                    break
+                _moverows(cursor, ClosedReq, ArchivedClosedReq, ids)
+            closedcount += len(ids)
+
+    reqcount = 0
+    if withreqs:
+        # Candidates have nothing left in the main database...
+        reqqset = FeatureReq.objects.filter(
+            date_up__lt=cutoff, open_list__isnull=True, closed_list__isnull=True
+        ).order_by('id').values_list('id', flat=True)
+        reqids = list(reqqset)
+        for start in range(0, len(reqids), batch):
+            chunk = reqids[start:start+batch]
+            # ...and were closed at some point (not just never opened)
+            chunk = list(ArchivedClosedReq.objects.filter(
+                req_id__in=chunk).values_list('req_id', flat=True).distinct())
+            if chunk and not dryrun:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    _movereqs(cursor, chunk)
+            reqcount += len(chunk)
+
+    return closedcount, reqcount
@@ -0,0 +1,208 @@
+import asyncio, io, sys, threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from django.core.handlers.wsgi import WSGIHandler
+from .events import eventstream, getexecutor, getbroadcaster, sendjson, parselastid, EVENTS_PATH
+
+## ASGI application
+# Serves the whole site under ASGI. The change event stream is handled
+# natively (see events.py); everything else runs through Django's usual
+# handler (middleware, sessions and all) on worker threads, so the event
+# loop only reads requests and sends responses, and a slow list request
+# ties up one thread rather than a whole worker process:
+#
+# - GETs (and other safe methods) run on the shared pool of
+#   IWS_ASGI_DB_THREADS threads (events.getexecutor()). Requests beyond
+#   that wait their turn as coroutines, which cost next to nothing.
+# - Everything else (POSTs and the like, which may write) runs on a single
+#   thread, since SQLite only takes one writer at a time anyway.
+# - Each request runs start to finish on one thread, including producing a
+#   streamed body (Django's connections and transactions are per thread),
+#   handing chunks over to the event loop through a small queue.
+# - /featreq/changes/ long-polls if given parameter wait (seconds, up to
+#   CHANGES_WAIT_MAX): if nothing has changed since the cursor, the
+#   connection waits on the event broadcaster (as a coroutine, holding no
+#   thread) until something does or the time is up, then runs the view.
+
+CHANGES_PATH = '/featreq/changes/'
+CHANGES_WAIT_MAX = 60
+
+# Methods which only read
+READ_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+# Body chunks waiting to be sent, per streamed response
+STREAM_QUEUE = 16
+
+# Django's handler and the writer thread (created on first use)
+_handler = None
+_writer = None
+
+def gethandler():
+    '''Returns Django request handler'''
+    global _handler
+    if _handler is None:
+        _handler = WSGIHandler()
+    return _handler
+
+def getwriter():
+    '''Returns single-thread pool for requests which may write'''
+    global _writer
+    if _writer is None:
+        _writer = ThreadPoolExecutor(1)
+    return _writer
+
+def isread(scope):
+    '''Returns True if request in ASGI scope only reads'''
+    return scope['method'] in READ_METHODS
+
+def wsgienviron(scope, body):
+    '''Returns WSGI environ for request in ASGI scope, with body bytes'''
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        # WSGI paths are bytes decoded as latin-1
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'REMOTE_ADDR': str(client[0]),
+        'SERVER_PROTOCOL': 'HTTP/{0}'.format(scope.get('http_version', '1.1')),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        # Repeated headers are combined, as servers do for WSGI
+        environ[name] = environ[name] + ',' + value if name in environ else value
+    return environ
+
+def runwsgi(environ, emit, stop):
+    '''Runs request through Django (blocking), body and all, on the calling
+    thread. Calls emit with tuple of (status, header list), then with each
+    chunk of body bytes (the whole body, unless streaming), stopping early
+    if threading.Event stop is set.
+    '''
+    started = []
+    def start_response(status, headers, exc_info=None):
+        started[:] = [ int(status.split(' ', 1)[0]), headers ]
+    response = gethandler()(environ, start_response)
+    try:
+        emit(tuple(started))
+        if getattr(response, 'streaming', False):
+            for chunk in response:
+                if stop.is_set():
+                    break
+                if chunk:
+                    emit(chunk)
+        else:
+            emit(b''.join(response))
+    finally:
+        # Sends request_finished, which closes the thread's connection
+        response.close()
+
+async def readbody(receive):
+    '''Returns request body bytes, or None if the client disconnected'''
+    body = []
+    more = True
+    while more:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body.append(message.get('body', b''))
+        more = message.get('more_body', False)
+    return b''.join(body)
+
+async def waitchanges(scope):
+    '''Waits (up to parameter wait seconds) until there are change events
+    past parameter since, if both are given.
+    '''
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    since = parselastid(query.get('since', [None])[0])
+    try:
+        wait = min(float(query.get('wait', [0])[0]), CHANGES_WAIT_MAX)
+    except ValueError:
+        # Left for the view to complain about
+        return
+    if since is None or wait <= 0:
+        return
+    broadcaster = getbroadcaster()
+    await broadcaster.start()
+    if broadcaster.lastid > since:
+        return
+    queue = broadcaster.subscribe()
+    try:
+        await asyncio.wait_for(queue.get(), wait)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        broadcaster.unsubscribe(queue)
+
+async def djangoview(scope, receive, send):
+    '''Runs request in ASGI scope through Django on a worker thread'''
+    loop = asyncio.get_event_loop()
+    body = await readbody(receive)
+    if body is None:
+        return
+    read = isread(scope)
+    if read and scope['path'] == CHANGES_PATH:
+        await waitchanges(scope)
+    pool = getexecutor() if read else getwriter()
+
+    # The worker thread hands over the response start and body chunks, then
+    # None once it's done (waiting for room if the client is slow)
+    queue = asyncio.Queue(STREAM_QUEUE)
+    stop = threading.Event()
+    def emit(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+    future = loop.run_in_executor(pool, runwsgi, wsgienviron(scope, body), emit, stop)
+    future.add_done_callback(lambda f: asyncio.ensure_future(queue.put(None)))
+
+    item = await queue.get()
+    try:
+        if item is None:
+            # Failed before responding
+            await future
+            return
+        status, headers = item
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [ (name.encode('latin-1'), value.encode('latin-1')) for name, value in headers ],
+        })
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            await send({'type': 'http.response.body', 'body': item, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        # If sending failed, let the thread finish (and clean up) anyway
+        stop.set()
+        while item is not None:
+            item = await queue.get()
+
+async def application(scope, receive, send):
+    '''ASGI application serving the whole site'''
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    elif scope['type'] == 'http' and scope['path'] == EVENTS_PATH:
+        await eventstream(scope, receive, send)
+    elif scope['type'] == 'http':
+        await djangoview(scope, receive, send)
+    else:
+        await sendjson(send, 404, {'status_code': 404, 'error': 'Resource not found'})
@@ -0,0 +1,181 @@
+import hashlib, threading, time, uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+## Single-flight GETs
+# When a dashboard opens, dozens of browsers send the same GETs at once,
+# and each worker would run the same queries and encoding. Instead, views
+# decorated with coalesce() let concurrent identical GETs (same path, query
+# string and Accept header, from authenticated users or not -- responses
+# don't vary by user) share one run: the first request (the leader) runs
+# the view, and the rest (followers) wait for it and get copies of its
+# response, sharing the same body bytes. Nothing is kept once the leader
+# finishes, so a request arriving afterwards always runs the view afresh.
+#
+# Without further setup, requests are only coalesced within a process. With
+# IWS_COALESCE_CACHE set, leaders also take a lock in the default cache
+# (which must then be shared between processes, eg memcached), and leave
+# their responses there for followers in other processes, which poll for
+# them (up to IWS_COALESCE_WAIT seconds) before giving up and running the
+# view themselves. Streaming responses aren't shared.
+#
+# A follower gets data read when the leader's run started, which may be
+# before the follower itself arrived -- and so before a write the same
+# session had just made. To keep read-your-writes, sessions which wrote
+# within the last IWS_COALESCE_AFTER_WRITE seconds (by default, as long as
+# a follower can wait) always run the view themselves; writes are noted
+# in the session by notewrite(), called for each successful API write (see
+# views.notedwrite()), but not for read-only POSTs such as multi-gets.
+
+COALESCE_CACHE = getattr(settings, 'IWS_COALESCE_CACHE', False)
+COALESCE_WAIT = getattr(settings, 'IWS_COALESCE_WAIT', 5)
+# Poll interval (s) for followers in other processes
+COALESCE_POLL = 0.01
+# Seconds shared responses stay in the cache, for followers still polling
+COALESCE_LINGER = 2
+COALESCE_PREFIX = 'iws:flight:'
+COALESCE_AFTER_WRITE = getattr(settings, 'IWS_COALESCE_AFTER_WRITE', COALESCE_WAIT)
+# Session key holding time of session's last write
+WROTE_KEY = 'iws_wrote_at'
+
+def notewrite(request):
+    '''Notes in request's session that it has just written'''
+    if COALESCE_AFTER_WRITE and hasattr(request, 'session'):
+        request.session[WROTE_KEY] = time.time()
+
+def wroterecently(request):
+    '''Returns True if request's session wrote within the last
+    COALESCE_AFTER_WRITE seconds.
+    '''
+    if not COALESCE_AFTER_WRITE or not hasattr(request, 'session'):
+        return False
+    wrote_at = request.session.get(WROTE_KEY)
+    return wrote_at is not None and time.time() - wrote_at < COALESCE_AFTER_WRITE
+
+def requestkey(request):
+    '''Returns coalescing key for request, or None if it mustn't be shared'''
+    if request.method != 'GET':
+        return None
+    parts = (
+        request.path, request.META.get('QUERY_STRING', ''), request.META.get('HTTP_ACCEPT', ''),
+        'auth' if request.user.is_authenticated() else 'anon',
+    )
+    return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+def freeze(response):
+    '''Returns tuple of (status, headers, content) for response, or None if
+    it's streaming.
+    '''
+    if response.streaming:
+        return None
+    return (response.status_code, list(response.items()), response.content)
+
+def thaw(frozen):
+    '''Returns new response from frozen tuple'''
+    status, headers, content = frozen
+    resp = HttpResponse(content, status=status)
+    for name, value in headers:
+        resp[name] = value
+    return resp
+
+class Flight(object):
+    """In-process run of a view, shared by identical requests"""
+
+    __slots__ = ('done', 'frozen', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.frozen = None
+        self.error = None
+
+_flights = {}
+_flightlock = threading.Lock()
+
+def _sharedrun(key, run):
+    '''Runs run() (returning a response) unless another process is already
+    running the same request. Returns tuple of (frozen response, response
+    if run here or None).
+    '''
+    lockkey = COALESCE_PREFIX + key
+    token = uuid.uuid4().hex
+    if cache.add(lockkey, token, COALESCE_WAIT):
+        try:
+            resp = run()
+            frozen = freeze(resp)
+            if frozen is not None:
+                cache.set(COALESCE_PREFIX + token, frozen, COALESCE_LINGER)
+        finally:
+            cache.delete(lockkey)
+        return frozen, resp
+
+    # Wait for the other process's leader
+    deadline = time.perf_counter() + COALESCE_WAIT
+    leader = cache.get(lockkey)
+    while leader is not None:
+        frozen = cache.get(COALESCE_PREFIX + leader)
+        if frozen is not None:
+            return frozen, None
+        if time.perf_counter() >= deadline:
+            break
+        time.sleep(COALESCE_POLL)
+        current = cache.get(lockkey)
+        if current is None:
+            # Finished (and unlocked) between polls, or failed
+            frozen = cache.get(COALESCE_PREFIX + leader)
+            if frozen is not None:
+                return frozen, None
+        leader = current
+    resp = run()
+    return freeze(resp), resp
+
+def coalesced(key, run):
+    '''Runs run() (returning a response) for request key, or waits for
+    the run already in flight. Returns tuple of (frozen response, response
+    if run here or None).
+    '''
+    with _flightlock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Flight()
+
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.frozen, None
+
+    try:
+        if COALESCE_CACHE:
+            flight.frozen, resp = _sharedrun(key, run)
+        else:
+            resp = run()
+            flight.frozen = freeze(resp)
+        return flight.frozen, resp
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _flightlock:
+            del _flights[key]
+        flight.done.set()
+
+## Decorator
+
+def coalesce(f):
+    '''Decorator for views. Concurrent identical GETs share one run of the
+    view, unless the session wrote recently (see above).
+    '''
+    def wrapped(request, *args, **kwargs):
+        key = requestkey(request)
+        if key is None or wroterecently(request):
+            return f(request, *args, **kwargs)
+        frozen, resp = coalesced(key, lambda: f(request, *args, **kwargs))
+        if resp is not None:
+            return resp
+        if frozen is None:
+            # Leader's response couldn't be shared
+            return f(request, *args, **kwargs)
+        return thaw(frozen)
+    return wrapped
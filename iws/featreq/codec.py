@@ -0,0 +1,222 @@
+import json
+from collections import OrderedDict
+
+## JSON codec layer
+# All JSON encoding/decoding in the app goes through jsondumps() and
+# jsonloads(), so the backend can be swapped without touching the views.
+# The fastest installed library is used (orjson, then ujson), falling back
+# to the stdlib json module. A specific backend can be forced with the
+# setting IWS_JSON_CODEC ('orjson', 'ujson', or 'json').
+# Output is identical in layout whichever backend is used: indented by two
+# spaces (the only indent orjson supports) by default, or compact if the
+# setting IWS_JSON_COMPACT is True, or if asked for (see jsondumps()).
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+# Encodings which can be passed straight through to the decoders as bytes
+UTF8_NAMES = frozenset(('utf-8', 'utf8', 'utf_8'))
+
+## Backend implementations
+# Each dumps function returns bytes with a trailing newline, each loads
+# function accepts bytes or str, and both raise ValueError on bad input.
+
+# Indent for pretty output, fixed by orjson (OPT_INDENT_2)
+PRETTY_INDENT = 2
+
+def _orjson_dumps(obj, pretty=True):
+    opts = orjson.OPT_APPEND_NEWLINE
+    if pretty:
+        opts |= orjson.OPT_INDENT_2
+    return orjson.dumps(obj, option=opts)
+
+def _orjson_loads(data):
+    return orjson.loads(data)
+
+def _ujson_dumps(obj, pretty=True):
+    if pretty:
+        retstr = ujson.dumps(obj, indent=PRETTY_INDENT, escape_forward_slashes=False)
+    else:
+        retstr = ujson.dumps(obj, escape_forward_slashes=False)
+    return (retstr + '\n').encode('utf-8')
+
+def _ujson_loads(data):
+    return ujson.loads(data)
+
+def _stdlib_dumps(obj, pretty=True):
+    if pretty:
+        retstr = json.dumps(obj, indent=PRETTY_INDENT)
+    else:
+        retstr = json.dumps(obj, separators=(',', ':'))
+    return (retstr + '\n').encode('utf-8')
+
+def _stdlib_loads(data):
+    return json.loads(data)
+
+# Backends in order of preference, by name
+CODECS = OrderedDict()
+if orjson is not None:
+    CODECS['orjson'] = (_orjson_dumps, _orjson_loads)
+if ujson is not None:
+    CODECS['ujson'] = (_ujson_dumps, _ujson_loads)
+CODECS['json'] = (_stdlib_dumps, _stdlib_loads)
+
+# Selected backend, and whether output is pretty by default, resolved on
+# first use (so settings aren't touched at import time)
+_codec = None
+_pretty = True
+
+def setcodec(name=None):
+    '''Selects JSON backend by name. If name is None, uses the setting
+    IWS_JSON_CODEC if present, otherwise the fastest backend installed.
+    Raises ValueError if the named backend is not available.
+
+    Also reads the setting IWS_JSON_COMPACT, for jsondumps()'s default.
+
+    Returns name of backend selected.
+    '''
+    global _codec, _pretty
+
+    from django.conf import settings
+    _pretty = not getattr(settings, 'IWS_JSON_COMPACT', False)
+    if name is None:
+        name = getattr(settings, 'IWS_JSON_CODEC', None)
+
+    if not name or name == 'auto':
+        name = next(iter(CODECS))
+    elif name not in CODECS:
+        raise ValueError('JSON codec {0} not available'.format(name))
+
+    _codec = (name,) + CODECS[name]
+    return name
+
+def codecname():
+    '''Returns name of JSON backend in use'''
+    if _codec is None:
+        setcodec()
+    return _codec[0]
+
+def jsondumps(obj, pretty=None):
+    '''Serializes obj to JSON, returned as UTF-8 bytes with a trailing
+    newline. Output is indented if pretty is True, or compact if False; if
+    None (default), it's indented unless the setting IWS_JSON_COMPACT is
+    True.
+    '''
+    if _codec is None:
+        setcodec()
+    if pretty is None:
+        pretty = _pretty
+    return _codec[1](obj, pretty)
+
+def jsonloads(data, encoding=None):
+    '''Deserializes JSON from data, which can be bytes or str. Bytes in
+    UTF-8 (or with encoding unspecified) are handed to the decoder directly,
+    without an intermediate str; other encodings are decoded first.
+
+    Raises ValueError if data is not valid JSON.
+    '''
+    if _codec is None:
+        setcodec()
+    if encoding and isinstance(data, bytes) and encoding.lower() not in UTF8_NAMES:
+        data = data.decode(encoding)
+    try:
+        return _codec[2](data)
+    except ValueError:
+        raise
+    except Exception as e:
+        # Some backends raise other types for malformed input
+        raise ValueError('Invalid JSON: {0}'.format(str(e)))
+
+def jsonpretty(data):
+    '''Re-encodes JSON bytes or str (compact or not) as indented JSON bytes,
+    keeping key order. For display only, so uses the stdlib decoder
+    regardless of backend. Raises ValueError if data is not valid JSON.
+    '''
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return jsondumps(json.loads(data, object_pairs_hook=OrderedDict), pretty=True)
+
+
+## Binary codecs
+# Optional MessagePack/CBOR output for bulk consumers, chosen by the Accept
+# header. Objects are expected to be built with binary field translators
+# (see utils.binaryfcalls()), so UUIDs arrive here as 16-byte bytes and
+# datetimes as timezone-aware datetime instances, which both formats encode
+# as native timestamps.
+
+msgpack_contype = 'application/msgpack'
+cbor_contype = 'application/cbor'
+
+def _msgpack_dumps(obj):
+    return msgpack.packb(obj, use_bin_type=True, datetime=True)
+
+def _cbor_dumps(obj):
+    return cbor2.dumps(obj, datetime_as_timestamp=True)
+
+# Available binary encoders, by content type
+BINARY_CODECS = OrderedDict()
+if msgpack is not None:
+    BINARY_CODECS[msgpack_contype] = _msgpack_dumps
+    BINARY_CODECS['application/x-msgpack'] = _msgpack_dumps
+if cbor2 is not None:
+    BINARY_CODECS[cbor_contype] = _cbor_dumps
+
+def _acceptweights(accept):
+    '''Yields tuple of (q-value, specificity, -position, media type) for
+    each media type in Accept header string accept, skipping those with
+    invalid q-values. Specificity is 0 for */*, 1 for type/* and 2 otherwise.
+    '''
+    for pos, entry in enumerate(accept.lower().split(',')):
+        params = entry.split(';')
+        mtype, q = params[0].strip(), 1.0
+        if not mtype:
+            continue
+        for param in params[1:]:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value.strip())
+                except ValueError:
+                    q = None
+        if q is None:
+            continue
+        spec = 0 if mtype == '*/*' else (1 if mtype.endswith('/*') else 2)
+        yield (q, spec, -pos, mtype)
+
+def binarycontype(accept):
+    '''Returns binary content type given the highest weight (q-value) in
+    Accept header string accept, or None if no binary format was asked for,
+    a non-binary type (JSON, or any type through a wildcard) is weighted
+    higher, or the matching library isn't installed. Ties go to the more
+    specific type, then the first listed; types with q=0 are refused.
+    '''
+    if not BINARY_CODECS or not accept:
+        return None
+    weighted = [ w for w in _acceptweights(accept) if w[0] > 0 ]
+    if not weighted:
+        return None
+    mtype = max(weighted)[3]
+    return mtype if mtype in BINARY_CODECS else None
+
+def binarydumps(obj, contype):
+    '''Serializes obj in binary format matching content type contype.
+    Raises KeyError if no encoder is available for contype.
+    '''
+    return BINARY_CODECS[contype](obj)
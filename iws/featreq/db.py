@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+## SQLite journal mode
+# In SQLite's default rollback journal mode, a long read transaction (such
+# as an export, see export.py) holds a shared lock which keeps every writer
+# from committing (until they give up with "database is locked"), so SQLite
+# database files are switched to write-ahead logging (IWS_SQLITE_WAL), where
+# readers and the writer don't block each other. The mode is kept in the
+# file, so it's only set on the first connection to each database in a
+# process. Connected in FeatreqConfig.ready() (see apps.py).
+
+SQLITE_WAL = getattr(settings, 'IWS_SQLITE_WAL', True)
+
+# Database files already switched to WAL in this process
+_walfiles = set()
+
+@receiver(connection_created)
+def setwal(sender, connection, **kwargs):
+    '''Switches SQLite database of new connection to write-ahead logging'''
+    if not SQLITE_WAL or connection.vendor != 'sqlite':
+        return
+    name = connection.settings_dict['NAME']
+    if name in _walfiles:
+        return
+    with connection.cursor() as cursor:
+        # (In-memory databases stay as they are)
+        cursor.execute('PRAGMA journal_mode=WAL')
+    _walfiles.add(name)
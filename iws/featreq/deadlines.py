@@ -0,0 +1,148 @@
+import datetime, logging
+from django.db import transaction
+from django.db.models import Q
+from django.dispatch import Signal
+from .models import OpenReq, ChangeEvent, ScanMark, EVENT_REQ_FIELDS
+from .codec import jsonloads
+from .utils import approxnow, approxdatefmt
+
+## Overdue scanner
+# Finds open requests whose target dates have passed since the last scan,
+# reading forward from a high-water mark (the time of the last scan, kept
+# in ScanMark) along the date_tgt index, so each run only touches requests
+# which became overdue in between.
+#
+# Targets can land behind the mark, though: the API and admin only accept
+# future targets, but imports can set past ones. So each scan also reads
+# the 'opened'/'open_updated' change events recorded since the last one
+# (by event id, kept in a second ScanMark), and records any of those open
+# requests whose targets are already passed and behind the mark, unless
+# already recorded overdue for that target since opening. Imports run
+# without events aren't seen here.
+#
+# For each request found, an 'overdue' change event is recorded (so the
+# change feed and event stream pick it up), a log message is written, and
+# the requests_overdue signal is sent. Rows are read outside any
+# transaction, then each batch's events and the new mark are written in
+# one short transaction, which never touches the open request table.
+
+logger = logging.getLogger('featreq.deadlines')
+
+# Sent after each batch of newly overdue requests is recorded, with
+# argument oreqs (list of OpenReq)
+requests_overdue = Signal(providing_args=['oreqs'])
+
+SCAN_NAME = 'overdue'
+# Mark for change events read (last_id only)
+SCAN_EVENTS_NAME = 'overdue_events'
+# Kinds of change events which can set a target
+SCAN_EVENT_KINDS = ('opened', 'open_updated')
+# Requests per batch
+SCAN_BATCH = 500
+# Starting mark for the first scan, so everything already overdue is found
+SCAN_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+def _overdueqset(now):
+    '''Returns QuerySet of open requests overdue as of now, with the fields
+    their events need (including their requests')
+    '''
+    return OpenReq.objects.overdue(now).select_related('req').only(
+        *([ f.name for f in OpenReq._meta.concrete_fields ] + [ 'req__' + fn for fn in EVENT_REQ_FIELDS ]))
+
+def _recordoverdue(oreqs, marks):
+    '''Records overdue events for oreqs (list of OpenReq) and updates scan
+    marks (dict of ScanMark name to dict of new values) in one transaction,
+    then logs them and sends requests_overdue.
+    '''
+    evlist = []
+    for oreq in oreqs:
+        evdata = oreq.jsondict()
+        evdata['req'] = oreq.req.jsondict(EVENT_REQ_FIELDS)
+        evlist.append(('overdue', oreq.client_id, oreq.req_id, evdata))
+    with transaction.atomic():
+        ChangeEvent.objects.recordmany(evlist)
+        for name, values in marks.items():
+            ScanMark.objects.filter(name=name).update(**values)
+
+    for oreq in oreqs:
+        logger.info('Request %s overdue for client %s (target %s)',
+            oreq.req_id, oreq.client_id, oreq.date_tgt.isoformat())
+    if oreqs:
+        requests_overdue.send(sender=OpenReq, oreqs=oreqs)
+
+def _behindmark(markdt, lastid, lastevent, toevent, now, batch):
+    '''Returns list of open requests written (per change events after id
+    lastevent, up to toevent) with targets before now and at or behind the
+    mark (markdt, lastid), which haven't been recorded overdue for their
+    current target since they were opened.
+    '''
+    pairs = set(ChangeEvent.objects.filter(
+        id__gt=lastevent, id__lte=toevent, kind__in=SCAN_EVENT_KINDS
+    ).values_list('client_id', 'req_id'))
+    reqids = list(set(req_id for client_id, req_id in pairs))
+
+    found = []
+    for start in range(0, len(reqids), batch):
+        for oreq in _overdueqset(now).filter(
+            Q(date_tgt__lt=markdt) | Q(date_tgt=markdt, id__lte=lastid),
+            req_id__in=reqids[start:start+batch]
+        ):
+            if (oreq.client_id, oreq.req_id) in pairs:
+                found.append(oreq)
+    if not found:
+        return found
+
+    # Latest overdue event already recorded for each, by target
+    flagged = {}
+    for client_id, req_id, data, date in ChangeEvent.objects.filter(
+        kind='overdue', req_id__in=list(set(oreq.req_id for oreq in found)),
+        date__gte=min(oreq.opened_at for oreq in found)
+    ).values_list('client_id', 'req_id', 'data', 'date'):
+        key = (client_id, req_id, jsonloads(data).get('date_tgt'))
+        flagged[key] = max(date, flagged.get(key, date))
+    return [ oreq for oreq in found
+        if flagged.get((oreq.client_id, oreq.req_id, approxdatefmt(oreq.date_tgt)), SCAN_EPOCH) < oreq.opened_at ]
+
+def scanoverdue(now=None, batch=SCAN_BATCH):
+    '''Records events for open requests which have become overdue (as of
+    datetime now, default present) since the last scan, or have been given
+    targets already passed and behind the last scan's mark.
+
+    Returns number of requests found.
+    '''
+    now = now or approxnow()
+    mark = ScanMark.objects.filter(name=SCAN_NAME).first()
+    if mark is None:
+        mark = ScanMark.objects.create(name=SCAN_NAME, mark=SCAN_EPOCH, last_id=0)
+    markdt, lastid = mark.mark, mark.last_id
+    # Events read up to here (none before the first scan matter, since it
+    # starts from the epoch)
+    toevent = ChangeEvent.objects.lastid()
+    evmark = ScanMark.objects.filter(name=SCAN_EVENTS_NAME).first()
+    if evmark is None:
+        evmark = ScanMark.objects.create(name=SCAN_EVENTS_NAME, mark=now, last_id=toevent)
+
+    # Targets set behind the mark first, while it's still where it was
+    oreqs = _behindmark(markdt, lastid, evmark.last_id, toevent, now, batch)
+    _recordoverdue(oreqs, {SCAN_EVENTS_NAME: {'mark': now, 'last_id': toevent}})
+    found = len(oreqs)
+
+    while True:
+        # Past the mark, by (date_tgt, id)
+        oreqs = list(_overdueqset(now).filter(
+            Q(date_tgt__gt=markdt) | Q(date_tgt=markdt, id__gt=lastid)
+        )[:batch])
+        if not oreqs:
+            break
+        markdt, lastid = oreqs[-1].date_tgt, oreqs[-1].id
+
+        _recordoverdue(oreqs, {SCAN_NAME: {'mark': markdt, 'last_id': lastid}})
+        found += len(oreqs)
+
+        if len(oreqs) < batch:
+            break
+
+    # Everything before now is done (requests due exactly at now aren't
+    # overdue yet, and id 0 keeps them for the next scan)
+    ScanMark.objects.filter(name=SCAN_NAME).update(mark=now, last_id=0)
+    return found
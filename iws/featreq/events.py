@@ -0,0 +1,250 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from urllib.parse import parse_qs
+from django.conf import settings
+from django.db import close_old_connections
+from .models import ChangeEvent
+from .codec import jsondumps
+
+## Server-sent events change stream
+# Change events are recorded by the model managers (see models.ChangeEvent).
+# Under WSGI, the /featreq/events/ view sends whatever is pending and closes,
+# letting the browser's EventSource reconnect after the retry interval.
+# Under ASGI (see asyncapp.py), eventstream() holds connections open
+# instead: a single poller task per process reads new events from the
+# database and fans them out to every connection, so idle connections cost
+# one coroutine and one queue.
+
+EVENTS_PATH = '/featreq/events/'
+EVENT_CONTYPE = 'text/event-stream'
+
+# Reconnect interval sent to clients (ms), for the WSGI path
+EVENT_RETRY = getattr(settings, 'IWS_EVENTS_RETRY', 3000)
+# Database poll interval (s), heartbeat interval (s), and max events per
+# fetch, for the ASGI path
+EVENT_POLL = getattr(settings, 'IWS_EVENTS_POLL', 0.5)
+EVENT_HEARTBEAT = getattr(settings, 'IWS_EVENTS_HEARTBEAT', 15)
+EVENT_BATCH = 500
+# Events buffered per connection before it's dropped (the client will
+# reconnect with Last-Event-ID and catch up from the database)
+EVENT_QUEUE_MAX = 1000
+
+def ssemessage(event):
+    '''Returns SSE message bytes for ChangeEvent event'''
+    return 'id: {0}\nevent: {1}\ndata: {2}\n\n'.format(event.id, event.kind, event.data).encode('utf-8')
+
+def ssecomment(text=''):
+    '''Returns SSE comment bytes (ignored by clients, used as heartbeat)'''
+    return ': {0}\n\n'.format(text).encode('utf-8')
+
+def sseretry(retry=EVENT_RETRY):
+    '''Returns SSE retry directive bytes'''
+    return 'retry: {0}\n\n'.format(retry).encode('utf-8')
+
+def parselastid(value):
+    '''Parses Last-Event-ID header or since parameter value, returning int
+    event id or None if missing or invalid.
+    '''
+    try:
+        lastid = int(value)
+    except (TypeError, ValueError):
+        return None
+    return lastid if lastid >= 0 else None
+
+def fetchevents(last_id, limit=EVENT_BATCH):
+    '''Returns list of events after last_id (blocking)'''
+    close_old_connections()
+    return list(ChangeEvent.objects.since(last_id, limit))
+
+def fetchlastid():
+    '''Returns latest event id (blocking)'''
+    close_old_connections()
+    return ChangeEvent.objects.lastid()
+
+
+class EventBroadcaster(object):
+    """Polls change events and fans them out to subscriber queues"""
+
+    def __init__(self, poll=EVENT_POLL):
+        self.poll = poll
+        self.lastid = None
+        self.queues = set()
+        self.starting = None
+        self.task = None
+
+    async def start(self):
+        '''Starts poller task if not already running'''
+        if self.task is None:
+            # Concurrent first callers share the same initial fetch
+            if self.starting is None:
+                loop = asyncio.get_event_loop()
+                self.starting = asyncio.ensure_future(loop.run_in_executor(getexecutor(), fetchlastid))
+            try:
+                lastid = await self.starting
+            except Exception:
+                self.starting = None
+                raise
+            if self.task is None:
+                self.lastid = lastid
+                self.task = asyncio.ensure_future(self.run())
+
+    def subscribe(self):
+        '''Returns new queue which will receive lists of new events'''
+        queue = asyncio.Queue(EVENT_QUEUE_MAX)
+        self.queues.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.queues.discard(queue)
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.poll)
+            # Don't bother the database when nobody's listening
+            if not self.queues:
+                continue
+            try:
+                events = await loop.run_in_executor(getexecutor(), fetchevents, self.lastid)
+            except Exception:
+                # Try again next round (database may be locked)
+                continue
+            if not events:
+                continue
+            self.lastid = events[-1].id
+            for queue in list(self.queues):
+                try:
+                    queue.put_nowait(events)
+                except asyncio.QueueFull:
+                    # Too slow, so drop its backlog and signal it to close
+                    # (the client will reconnect and catch up)
+                    self.queues.discard(queue)
+                    while not queue.empty():
+                        queue.get_nowait()
+                    queue.put_nowait(None)
+
+
+# Thread pool for blocking database/session work (created on first use, so
+# WSGI workers importing this module don't pay for it), and shared broadcaster
+_executor = None
+_broadcaster = EventBroadcaster()
+
+def getexecutor():
+    '''Returns thread pool used for blocking work under ASGI'''
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(getattr(settings, 'IWS_ASGI_DB_THREADS', 4))
+    return _executor
+
+def getbroadcaster():
+    '''Returns this process's event broadcaster'''
+    return _broadcaster
+
+async def waitdisconnect(receive):
+    '''Waits for ASGI client disconnect message'''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+def getuser(headers):
+    '''Returns Django user for session cookie in ASGI headers (blocking)'''
+    from http.cookies import SimpleCookie
+    from django.contrib.auth import get_user
+
+    class _SessionReq(object):
+        pass
+
+    cookie = SimpleCookie()
+    for name, value in headers:
+        if name == b'cookie':
+            cookie.load(value.decode('latin-1'))
+    sessionkey = cookie.get(settings.SESSION_COOKIE_NAME)
+
+    close_old_connections()
+    engine = import_module(settings.SESSION_ENGINE)
+    req = _SessionReq()
+    req.session = engine.SessionStore(sessionkey.value if sessionkey else None)
+    return get_user(req)
+
+async def sendjson(send, status, respdict):
+    '''Sends complete JSON response over ASGI send callable'''
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json')],
+    })
+    await send({'type': 'http.response.body', 'body': jsondumps(respdict)})
+
+async def eventstream(scope, receive, send):
+    '''ASGI handler for the change event stream'''
+    loop = asyncio.get_event_loop()
+
+    if scope['method'] != 'GET':
+        await sendjson(send, 405, {'status_code': 405, 'error': 'Method {0} not available here.'.format(scope['method'])})
+        return
+
+    # Check auth
+    user = await loop.run_in_executor(getexecutor(), getuser, scope['headers'])
+    if not user.is_authenticated():
+        await sendjson(send, 403, {'status_code': 403, 'error': 'Not logged in or session expired'})
+        return
+
+    # Resume point from Last-Event-ID header, or since parameter
+    lastid = None
+    for name, value in scope['headers']:
+        if name == b'last-event-id':
+            lastid = parselastid(value.decode('latin-1'))
+    if lastid is None:
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        lastid = parselastid(query.get('since', [None])[0])
+
+    # Subscribe before catching up, so nothing is missed in between
+    await _broadcaster.start()
+    queue = _broadcaster.subscribe()
+    disconnect = asyncio.ensure_future(waitdisconnect(receive))
+
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', EVENT_CONTYPE.encode()), (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no')],
+        })
+        await send({'type': 'http.response.body', 'body': sseretry(), 'more_body': True})
+
+        # Catch up from database if resuming
+        if lastid is None:
+            lastid = _broadcaster.lastid
+        while lastid < _broadcaster.lastid:
+            events = await loop.run_in_executor(getexecutor(), fetchevents, lastid)
+            if not events:
+                break
+            await send({'type': 'http.response.body', 'body': b''.join(map(ssemessage, events)), 'more_body': True})
+            lastid = events[-1].id
+
+        # Now stream live events until disconnected
+        while not disconnect.done():
+            getter = asyncio.ensure_future(queue.get())
+            done, pending = await asyncio.wait(
+                (getter, disconnect), timeout=EVENT_HEARTBEAT, return_when=asyncio.FIRST_COMPLETED)
+            if getter not in done:
+                getter.cancel()
+                if not disconnect.done():
+                    await send({'type': 'http.response.body', 'body': ssecomment(), 'more_body': True})
+                continue
+            events = getter.result()
+            if events is None:
+                # Dropped by broadcaster
+                break
+            events = [ ev for ev in events if ev.id > lastid ]
+            if events:
+                await send({'type': 'http.response.body', 'body': b''.join(map(ssemessage, events)), 'more_body': True})
+                lastid = events[-1].id
+
+        if not disconnect.done():
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        _broadcaster.unsubscribe(queue)
+        disconnect.cancel()
@@ -0,0 +1,139 @@
+import csv, io, zlib
+from django.db import transaction
+from .models import FeatureReq, ClientInfo, OpenReq, ClosedReq
+from .codec import jsondumps
+from .utils import ordereddict, defaultfields
+
+## Bulk export
+# Rows are read in primary key order, a chunk at a time, with each chunk
+# starting after the last key of the previous one (so every query is an
+# index range scan, however far into the table it is), and encoded and
+# handed on before the next is read. All chunks are read in one
+# transaction, so the export is a consistent snapshot even while requests
+# are being changed. Memory use is bounded by the chunk size.
+#
+# SQLite databases are switched to write-ahead logging (see db.py), so that
+# long read transaction doesn't keep writers from committing.
+#
+# NDJSON output has one object per line, of the form
+# {"type": <type>, "data": <row>}, with rows as the API returns them, and
+# all types in one stream (requests and clients first, so the stream can be
+# imported in order). CSV output has a header line and one row per line,
+# and so is limited to one type per stream.
+
+# Rows per chunk
+EXPORT_CHUNK = 2000
+
+# Export types, in output order
+EXPORT_TYPES = ordereddict([
+    ('req', FeatureReq), ('client', ClientInfo), ('open', OpenReq), ('closed', ClosedReq),
+])
+
+# Formats and their content types
+EXPORT_FORMATS = ordereddict([
+    ('ndjson', 'application/x-ndjson'), ('csv', 'text/csv; charset=utf-8'),
+])
+GZIP_CONTYPE = 'application/gzip'
+
+def parsetypes(typestr):
+    '''Returns list of export types from comma-separated string typestr
+    (all types if empty), in output order. Raises ValueError if any are
+    invalid.
+    '''
+    types = set(t.strip() for t in typestr.split(',') if t.strip())
+    for t in types:
+        if t not in EXPORT_TYPES:
+            raise ValueError('Invalid type: {0}'.format(t))
+    return [ t for t in EXPORT_TYPES if t in types or not types ]
+
+def exportrows(model, chunk=EXPORT_CHUNK):
+    '''Generator yielding lists of at most chunk JSON-compatible dicts of
+    model's rows (with fields from defaultfields(model)), in primary key
+    order.
+    '''
+    fields = defaultfields(model)
+    fcalls = tuple(model.fields[fn] for fn in fields)
+    qset = model.objects.order_by('pk')
+    lastpk = None
+    while True:
+        page = qset if lastpk is None else qset.filter(pk__gt=lastpk)
+        rows = list(page.values_list('pk', *fields)[:chunk])
+        if not rows:
+            return
+        lastpk = rows[-1][0]
+        yield [ ordereddict([ (fn, fc(fv)) if fc is not None else (fn, fv)
+            for fn, fc, fv in zip(fields, fcalls, fvals[1:]) ]) for fvals in rows ]
+
+def _ndjsonchunks(types, chunk, counts):
+    for typename in types:
+        for rows in exportrows(EXPORT_TYPES[typename], chunk):
+            counts[typename] = counts.get(typename, 0) + len(rows)
+            yield b''.join(jsondumps(ordereddict([('type', typename), ('data', row)]), pretty=False)
+                for row in rows)
+
+def _csvchunks(types, chunk, counts):
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator='\n')
+    for typename in types:
+        model = EXPORT_TYPES[typename]
+        writer.writerow(defaultfields(model))
+        for rows in exportrows(model, chunk):
+            counts[typename] = counts.get(typename, 0) + len(rows)
+            writer.writerows([ '' if val is None else val for val in row.values() ] for row in rows)
+            yield buf.getvalue().encode('utf-8')
+            buf.seek(0)
+            buf.truncate()
+        # Header only, if no rows
+        if buf.tell():
+            yield buf.getvalue().encode('utf-8')
+            buf.seek(0)
+            buf.truncate()
+
+def _snapshot(chunks):
+    '''Runs generator chunks to completion inside one transaction'''
+    with transaction.atomic():
+        yield from chunks
+
+def _gzipchunks(chunks, level=6):
+    comp = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for data in chunks:
+        out = comp.compress(data)
+        if out:
+            yield out
+    yield comp.flush()
+
+def exportstream(types, fmt='ndjson', gzip=False, chunk=EXPORT_CHUNK, counts=None):
+    '''Returns generator yielding bytes of an export of types (list of
+    EXPORT_TYPES keys) in format fmt ('ndjson' or 'csv'), optionally
+    gzipped. If counts is given (as a dict), rows exported are added to it
+    by type as the export proceeds.
+
+    Raises ValueError for an invalid format or types (checked immediately,
+    not when the generator is first run).
+    '''
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError('Invalid format: {0}'.format(fmt))
+    if not types:
+        raise ValueError('No types to export')
+    for t in types:
+        if t not in EXPORT_TYPES:
+            raise ValueError('Invalid type: {0}'.format(t))
+    if fmt == 'csv' and len(types) > 1:
+        raise ValueError('CSV export requires exactly one type')
+    if chunk < 1:
+        raise ValueError('Invalid chunk size: {0}'.format(chunk))
+
+    if counts is None:
+        counts = {}
+    if fmt == 'csv':
+        chunks = _csvchunks(types, chunk, counts)
+    else:
+        chunks = _ndjsonchunks(types, chunk, counts)
+    chunks = _snapshot(chunks)
+    if gzip:
+        chunks = _gzipchunks(chunks)
+    return chunks
+
+def exportcontype(fmt, gzip=False):
+    '''Returns content type of export in format fmt'''
+    return GZIP_CONTYPE if gzip else EXPORT_FORMATS[fmt]
@@ -0,0 +1,187 @@
+import uuid, zlib
+from functools import lru_cache
+from django.conf import settings
+from django.db import models
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+## Custom model fields
+
+class BinaryUUIDField(models.UUIDField):
+    """UUIDField stored as 16 raw bytes on SQLite.
+
+    Django's UUIDField falls back to 32-character hex strings on databases
+    without a native UUID type, which doubles the size of every key and of
+    every index or foreign key column referencing it. On SQLite this field
+    stores UUID.bytes in a blob column instead; on other databases it
+    behaves exactly like UUIDField (PostgreSQL's uuid type is already 16
+    bytes). Values are UUID instances either way, so nothing outside the
+    model layer sees a difference.
+
+    Foreign keys to a BinaryUUIDField primary key take the same column type
+    and value conversion automatically.
+    """
+
+    @staticmethod
+    def isbinary(connection):
+        return connection.vendor == 'sqlite'
+
+    def get_internal_type(self):
+        # Not 'UUIDField', so the backends' hex string converters don't
+        # run on binary values (from_db_value() handles both forms)
+        return 'BinaryUUIDField'
+
+    def db_type(self, connection):
+        if self.isbinary(connection):
+            return 'blob'
+        return connection.data_types['UUIDField']
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not self.isbinary(connection):
+            return super(BinaryUUIDField, self).get_db_prep_value(value, connection, prepared)
+        if value is None:
+            return None
+        if not isinstance(value, uuid.UUID):
+            value = self.to_python(value)
+        return value.bytes
+
+    def from_db_value(self, value, expression, connection, context):
+        if value is None or isinstance(value, uuid.UUID):
+            return value
+        if isinstance(value, (bytes, memoryview)):
+            return uuid.UUID(bytes=bytes(value))
+        # Hex string (other databases, or rows not yet converted)
+        return uuid.UUID(value)
+
+
+## Compressed text
+# Stored values are one tag byte followed by the payload, so rows written
+# with different (or no) compression can be mixed freely
+
+TAG_RAW = b'\x00'
+TAG_ZLIB = b'\x01'
+TAG_ZSTD = b'\x02'
+
+# Texts shorter than this (in bytes) aren't worth compressing
+COMPRESS_MIN = 256
+# Decompressed texts kept in memory, per process
+DECOMPRESS_CACHE = getattr(settings, 'IWS_DESC_CACHE', 256)
+
+if zstandard is not None:
+    _zstd_c = zstandard.ZstdCompressor(level=3)
+    _zstd_d = zstandard.ZstdDecompressor()
+
+def compresstext(text):
+    '''Returns tagged bytes of text, compressed with zstd if available,
+    otherwise zlib, unless text is too short to benefit.
+    '''
+    data = text.encode('utf-8')
+    if len(data) < COMPRESS_MIN:
+        return TAG_RAW + data
+    if zstandard is not None:
+        packed = TAG_ZSTD + _zstd_c.compress(data)
+    else:
+        packed = TAG_ZLIB + zlib.compress(data, 6)
+    # Incompressible text is left as-is
+    return packed if len(packed) <= len(data) else TAG_RAW + data
+
+@lru_cache(maxsize=DECOMPRESS_CACHE)
+def decompresstext(data):
+    '''Returns text from tagged bytes data (see compresstext()). Raises
+    ValueError if data is malformed or needs zstandard and it's missing.
+    '''
+    tag, payload = data[:1], data[1:]
+    if tag == TAG_RAW:
+        return payload.decode('utf-8')
+    elif tag == TAG_ZLIB:
+        try:
+            return zlib.decompress(payload).decode('utf-8')
+        except zlib.error as e:
+            raise ValueError('Invalid compressed text: {0}'.format(str(e)))
+    elif tag == TAG_ZSTD:
+        if zstandard is None:
+            raise ValueError('Compressed text requires zstandard, which is not installed')
+        try:
+            return _zstd_d.decompress(payload).decode('utf-8')
+        except zstandard.ZstdError as e:
+            raise ValueError('Invalid compressed text: {0}'.format(str(e)))
+    else:
+        raise ValueError('Invalid compressed text tag: {0!r}'.format(tag))
+
+class CompressedText(object):
+    """Compressed text as read from the database, decompressed only when
+    its value is used (by str(), comparison, or plaintext())"""
+
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        return decompresstext(self.data)
+
+    def __repr__(self):
+        return '<CompressedText: {0} bytes>'.format(len(self.data))
+
+    def __eq__(self, other):
+        if isinstance(other, CompressedText):
+            return self.data == other.data or str(self) == str(other)
+        return str(self) == other
+
+    def __hash__(self):
+        return hash(str(self))
+
+def plaintext(value):
+    '''Returns value decompressed to str if it's CompressedText, otherwise
+    unchanged (as a serialization callable, see utils.tojsondict()).
+    '''
+    return str(value) if isinstance(value, CompressedText) else value
+
+class CompressedTextField(models.TextField):
+    """TextField stored compressed on SQLite.
+
+    Values are compressed with compresstext() on write and stored in a blob
+    column. Reads return CompressedText, which only decompresses (through a
+    small LRU cache, so repeated reads of the same unchanged text pay once)
+    when the value is used, so rows loaded but never serialized cost
+    nothing extra. Models list plaintext() as the field's JSON translator
+    (see utils.tojsondict()), so it's decompressed as it's serialized.
+
+    On other databases this is a plain TextField (PostgreSQL already
+    compresses large text and stores it out of line).
+    """
+
+    @staticmethod
+    def iscompressed(connection):
+        return connection.vendor == 'sqlite'
+
+    def get_internal_type(self):
+        # Not 'TextField', so backend text handling doesn't touch blobs
+        return 'CompressedTextField'
+
+    def db_type(self, connection):
+        if self.iscompressed(connection):
+            return 'blob'
+        return connection.data_types['TextField']
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if isinstance(value, CompressedText):
+            # Written back as read, without decompressing
+            if self.iscompressed(connection):
+                return value.data
+            value = str(value)
+        value = super(CompressedTextField, self).get_db_prep_value(value, connection, prepared)
+        if value is None or not self.iscompressed(connection):
+            return value
+        return compresstext(value)
+
+    def from_db_value(self, value, expression, connection, context):
+        if isinstance(value, memoryview):
+            value = bytes(value)
+        if isinstance(value, bytes):
+            return CompressedText(value)
+        # Plain text (other databases, or rows not yet converted)
+        return value
@@ -0,0 +1,315 @@
+import datetime, uuid
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from .models import FeatureReq, FeatureReqDesc, ClientInfo, OpenReq, ClosedReq, ChangeEvent, EVENT_REQ_FIELDS,\
+    AREA_BY_SHORT, AREA_BY_TEXT, STATUS_BY_SHORT, STATUS_BY_TEXT
+from .codec import jsonloads
+from .utils import validuuid, approxnow, ordereddict, qset_vals_tojsonlist,\
+    DATETIMEFMT, DATEFULLFMT, DATEONLYFMT
+
+## Bulk import
+# Reads NDJSON records in the form featreq_export writes them, one
+# {"type": <type>, "data": <row>} object per line, with rows as the API
+# returns them (string UUIDs and dates, full product area and status
+# names, though short codes are accepted too). Records are validated and
+# upserted a batch at a time, one transaction per batch: requests and
+# clients by id, open requests by client and request, and closed requests
+# by client, request and closing date/time, so re-importing the same
+# records (say, after an interruption) changes nothing.
+#
+# Rows are written with bulk inserts (and plain updates for rows already
+# present whose values differ), bypassing the per-row manager methods;
+# change events are recorded in bulk alongside them, for rows inserted or
+# changed only. Rows present with the same values are left alone, so their
+# versions stay put and no events are recorded for them. Requests'
+# descriptions are upserted the same way into their side table, and a
+# changed description counts as a changed request. Rollup tables aren't maintained row by
+# row, and should be rebuilt once the import is done (see stats.py).
+#
+# Open and closed requests must refer to requests and clients already in
+# the database or earlier in the same batch, which an export always
+# satisfies, since it writes requests and clients first.
+
+# Records per transaction
+IMPORT_BATCH = 1000
+# Username recorded for rows without one
+IMPORT_USER = 'import'
+# Values per IN (...) lookup (SQLite allows 999 parameters per query)
+IMPORT_LOOKUP = 500
+
+IMPORT_TYPES = ('req', 'client', 'open', 'closed')
+
+def _uuid(data, field):
+    val = data.get(field)
+    # Ids are kept exactly as given (not forced to version 4)
+    uid = validuuid(val, version=None) if isinstance(val, str) else None
+    if uid is None:
+        raise ValueError('Invalid {0}: {1}'.format(field, val))
+    return uid
+
+def _date(data, field):
+    val = data.get(field)
+    if not val:
+        return None
+    for fmt in (DATETIMEFMT, DATEFULLFMT, DATEONLYFMT):
+        try:
+            return datetime.datetime.strptime(val, fmt).replace(tzinfo=datetime.timezone.utc)
+        except (ValueError, TypeError):
+            pass
+    raise ValueError('Invalid {0}: {1}'.format(field, val))
+
+def _choice(data, field, byshort, bytext):
+    val = data.get(field)
+    if val in byshort:
+        return val
+    elif val in bytext:
+        return bytext[val]
+    raise ValueError('Invalid {0}: {1}'.format(field, val))
+
+def _buildreq(data, user):
+    dt = approxnow()
+    return FeatureReq(
+        id=_uuid(data, 'id'), title=data.get('title') or '', desc=(data.get('desc') or '').strip(),
+        ref_url=data.get('ref_url') or '', prod_area=_choice(data, 'prod_area', AREA_BY_SHORT, AREA_BY_TEXT),
+        date_cr=_date(data, 'date_cr') or dt, user_cr=data.get('user_cr') or user,
+        date_up=_date(data, 'date_up') or dt, user_up=data.get('user_up') or user)
+
+def _buildclient(data, user):
+    return ClientInfo(
+        id=_uuid(data, 'id'), name=data.get('name') or '', con_name=data.get('con_name') or '',
+        con_mail=data.get('con_mail') or '', date_add=_date(data, 'date_add') or approxnow())
+
+def _buildopen(data, user):
+    return OpenReq(
+        client_id=_uuid(data, 'client_id'), req_id=_uuid(data, 'req_id'), priority=data.get('priority') or None,
+        date_tgt=_date(data, 'date_tgt'), opened_at=_date(data, 'opened_at') or approxnow(),
+        opened_by=data.get('opened_by') or user)
+
+def _buildclosed(data, user):
+    closed_at = _date(data, 'closed_at')
+    if closed_at is None:
+        raise ValueError('closed_at required')
+    return ClosedReq(
+        client_id=_uuid(data, 'client_id'), req_id=_uuid(data, 'req_id'), priority=data.get('priority') or None,
+        date_tgt=_date(data, 'date_tgt'), opened_at=_date(data, 'opened_at') or closed_at,
+        opened_by=data.get('opened_by') or user, closed_at=closed_at, closed_by=data.get('closed_by') or user,
+        status=_choice(data, 'status', STATUS_BY_SHORT, STATUS_BY_TEXT), reason=data.get('reason') or '')
+
+# Per type: model, builder, and fields identifying an existing row
+IMPORT_SPECS = {
+    'req': (FeatureReq, _buildreq, ('id',)),
+    'client': (ClientInfo, _buildclient, ('id',)),
+    'open': (OpenReq, _buildopen, ('client_id', 'req_id')),
+    'closed': (ClosedReq, _buildclosed, ('client_id', 'req_id', 'closed_at')),
+}
+
+def _errmsg(e):
+    '''Returns single-line message from ValueError/TypeError/ValidationError e'''
+    if isinstance(e, ValidationError) and hasattr(e, 'message_dict'):
+        return '; '.join('{0}: {1}'.format(field, ' '.join(msgs)) for field, msgs in e.message_dict.items())
+    elif isinstance(e, ValidationError):
+        return ' '.join(e.messages)
+    return str(e)
+
+def _chunked(values, size=IMPORT_LOOKUP):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start+size]
+
+def _existingrows(model, keyfields, keys, updfields):
+    '''Returns dict of key (tuple of keyfields values) to tuple of stored
+    updfields values, for each of keys which already exists in model's table.
+    '''
+    found = {}
+    nkeys = len(keyfields)
+    # First key field narrows the lookup; the rest are compared here
+    for chunk in _chunked(set(key[0] for key in keys)):
+        qset = model.objects.filter(**{keyfields[0] + '__in': chunk}).values_list(*(tuple(keyfields) + updfields))
+        for row in qset:
+            key = row[:nkeys]
+            if key in keys:
+                found[key] = row[nkeys:]
+    return found
+
+def _upsert(model, keyfields, objs):
+    '''Inserts or updates model instances objs (dict of key to instance),
+    updating only rows whose stored values differ.
+    Returns tuple of (set of keys already present, set of keys updated).
+    '''
+    updfields = tuple( f.attname for f in model._meta.concrete_fields
+        if not f.primary_key and f.attname not in keyfields and f.attname != 'version' )
+    existing = _existingrows(model, keyfields, objs, updfields)
+    model.objects.bulk_create([ obj for key, obj in objs.items() if key not in existing ])
+    # Versioned rows count a changed import as an update (see models.py)
+    bump = {}
+    if any(f.attname == 'version' for f in model._meta.concrete_fields):
+        bump['version'] = F('version') + 1
+    changed = set()
+    for key, stored in existing.items():
+        obj = objs[key]
+        values = tuple( getattr(obj, fname) for fname in updfields )
+        if values == stored:
+            continue
+        model.objects.filter(**dict(zip(keyfields, key))).update(**dict(bump, **dict(zip(updfields, values))))
+        changed.add(key)
+    return set(existing), changed
+
+def _upsertdescs(objs, unchanged):
+    '''Inserts or updates descriptions (in their side table) of FeatureReq
+    instances objs (dict of key to instance), bumping the versions of those
+    of the requests with keys in unchanged whose descriptions differ.
+    Returns set of keys of those requests.
+    '''
+    descs = ordereddict( (key, FeatureReqDesc(req_id=obj.id, body=obj.desc)) for key, obj in objs.items() )
+    existing, changed = _upsert(FeatureReqDesc, ('req_id',), descs)
+    bumped = changed & unchanged
+    for chunk in _chunked(key[0] for key in bumped):
+        FeatureReq.objects.filter(id__in=chunk).update(version=F('version') + 1)
+    return bumped
+
+def _reqinfo(req_ids):
+    '''Returns dict of request id to compact event dict, for those of
+    req_ids which exist.
+    '''
+    info = {}
+    for chunk in _chunked(req_ids):
+        for fr in qset_vals_tojsonlist(FeatureReq.objects.filter(id__in=chunk), EVENT_REQ_FIELDS):
+            info[uuid.UUID(fr['id'])] = fr
+    return info
+
+def _clientids(client_ids):
+    '''Returns set of those of client_ids which exist'''
+    found = set()
+    for chunk in _chunked(client_ids):
+        found.update(ClientInfo.objects.filter(id__in=chunk).values_list('id', flat=True))
+    return found
+
+def importbatch(records, user=IMPORT_USER, events=True):
+    '''Validates and upserts records (list of (line number, type, data)
+    tuples) in one transaction.
+
+    Returns tuple of (dict of rows upserted by type, list of (line number,
+    error message) tuples for records skipped).
+    '''
+    errors = []
+    # Valid instances by type, keyed for upserting (later duplicates win)
+    built = { typename: ordereddict() for typename in IMPORT_TYPES }
+    linenos = {}
+    for lineno, typename, data in records:
+        model, build, keyfields = IMPORT_SPECS[typename]
+        try:
+            obj = build(data, user)
+            # Related rows are checked in bulk below, not one query each
+            obj.clean_fields(exclude=['client', 'req'])
+        except (ValueError, TypeError, ValidationError) as e:
+            errors.append((lineno, _errmsg(e)))
+            continue
+        key = tuple(getattr(obj, fname) for fname in keyfields)
+        built[typename][key] = obj
+        linenos[(typename, key)] = lineno
+
+    counts = {}
+    evlist = []
+    with transaction.atomic():
+        for typename in ('req', 'client'):
+            objs = built[typename]
+            if not objs:
+                continue
+            model, build, keyfields = IMPORT_SPECS[typename]
+            existing, updated = _upsert(model, keyfields, objs)
+            if typename == 'req':
+                updated |= _upsertdescs(objs, existing - updated)
+            counts[typename] = len(objs)
+            if events:
+                for key, obj in objs.items():
+                    # Nothing to record for rows left as they were
+                    if key in existing and key not in updated:
+                        continue
+                    if typename == 'req':
+                        kind = 'req_updated' if key in updated else 'req_created'
+                        evlist.append((kind, None, obj.id, obj.jsondict(EVENT_REQ_FIELDS)))
+                    else:
+                        evlist.append(('client_changed', obj.id, None, obj.jsondict()))
+
+        # Links need their request and client to exist
+        links = [ (typename, key, obj) for typename in ('open', 'closed')
+            for key, obj in built[typename].items() ]
+        reqinfo = _reqinfo(set(obj.req_id for typename, key, obj in links))
+        clients = _clientids(set(obj.client_id for typename, key, obj in links))
+        for typename, key, obj in links:
+            if obj.req_id not in reqinfo:
+                errors.append((linenos[(typename, key)], 'No such req_id: {0}'.format(obj.req_id)))
+                del built[typename][key]
+            elif obj.client_id not in clients:
+                errors.append((linenos[(typename, key)], 'No such client_id: {0}'.format(obj.client_id)))
+                del built[typename][key]
+
+        for typename in ('open', 'closed'):
+            objs = built[typename]
+            if not objs:
+                continue
+            model, build, keyfields = IMPORT_SPECS[typename]
+            existing, updated = _upsert(model, keyfields, objs)
+            counts[typename] = len(objs)
+            if events:
+                for key, obj in objs.items():
+                    # Nothing to record for rows left as they were, and closed
+                    # requests don't change once closed, so there's no event
+                    # for re-importing one
+                    if key in existing and (typename == 'closed' or key not in updated):
+                        continue
+                    kind = typename if typename == 'closed' else ('open_updated' if key in updated else 'opened')
+                    evdata = obj.jsondict()
+                    evdata['req'] = reqinfo[obj.req_id]
+                    evlist.append((kind, obj.client_id, obj.req_id, evdata))
+
+        if evlist:
+            ChangeEvent.objects.recordmany(evlist)
+
+    errors.sort()
+    return counts, errors
+
+def parserecord(line):
+    '''Returns tuple of (type, data) from NDJSON line (bytes or str).
+    Raises ValueError if line isn't a valid record.
+    '''
+    record = jsonloads(line)
+    if not isinstance(record, dict):
+        raise ValueError('Record is not an object')
+    typename, data = record.get('type'), record.get('data')
+    if typename not in IMPORT_SPECS:
+        raise ValueError('Invalid type: {0}'.format(typename))
+    if not isinstance(data, dict):
+        raise ValueError('Record data is not an object')
+    return typename, data
+
+def importlines(lines, user=IMPORT_USER, batch=IMPORT_BATCH, skip=0, events=True):
+    '''Generator which imports NDJSON records from iterable lines, a batch
+    of batch records per transaction, after skipping the first skip lines.
+
+    After each batch is committed, yields tuple of (lines read so far,
+    dict of rows upserted by type, list of (line number, error message)
+    tuples for records skipped), for the batch. Resuming with skip set to
+    the last lines read value continues after the last committed batch.
+    '''
+    if batch < 1:
+        raise ValueError('Invalid batch size: {0}'.format(batch))
+    records, errors = [], []
+    lineno = 0
+    for lineno, line in enumerate(lines, 1):
+        if lineno <= skip or not line.strip():
+            continue
+        try:
+            typename, data = parserecord(line)
+        except ValueError as e:
+            errors.append((lineno, str(e)))
+            continue
+        records.append((lineno, typename, data))
+        if len(records) >= batch:
+            counts, batcherrors = importbatch(records, user, events)
+            yield lineno, counts, sorted(errors + batcherrors)
+            records, errors = [], []
+    if records or errors:
+        counts, batcherrors = importbatch(records, user, events) if records else ({}, [])
+        yield lineno, counts, sorted(errors + batcherrors)
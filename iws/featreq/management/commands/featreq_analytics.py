@@ -0,0 +1,41 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from featreq.analytics import closedmetrics, parsegroup, getnumpy, GROUP_DIMS
+from featreq.codec import jsondumps
+
+class Command(BaseCommand):
+    help = 'Computes lead time, target date slippage and priority churn over all closed requests'
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', default=','.join(GROUP_DIMS),
+            help='comma-separated dimensions to group by, from {0} (default all, empty for totals)'.format(
+                ', '.join(GROUP_DIMS)))
+        parser.add_argument('--json', action='store_true',
+            help='output JSON instead of a table')
+
+    def handle(self, *args, **options):
+        try:
+            group = parsegroup(options['group'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        start = time.perf_counter()
+        try:
+            results, rowcount = closedmetrics(group)
+        except ValueError as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - start
+
+        if options['json']:
+            self.stdout.write(jsondumps(results).decode('utf-8'), ending='')
+        elif results:
+            cols = list(results[0].keys())
+            rows = [ cols ] + [ [ '-' if row[col] is None else str(row[col]) for col in cols ] for row in results ]
+            widths = [ max(len(row[i]) for row in rows) for i in range(len(cols)) ]
+            for row in rows:
+                self.stdout.write('  '.join(val.rjust(width) for val, width in zip(row, widths)))
+
+        rate = rowcount / elapsed if elapsed > 0 else 0
+        self.stderr.write('{0} closed request(s) in {1:.2f}s ({2:,.0f} rows/s, {3})'.format(
+            rowcount, elapsed, rate, 'numpy' if getnumpy() is not None else 'array'))
@@ -0,0 +1,47 @@
+import datetime, time
+from django.core.management.base import BaseCommand, CommandError
+from featreq.archive import archiveclosed, ARCHIVE_BATCH, ARCHIVE_DB
+from featreq.utils import approxnow, DATEONLYFMT
+
+class Command(BaseCommand):
+    help = 'Moves closed requests older than a cutoff to the archive database (IWS_ARCHIVE_DB)'
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        cutoff = parser.add_mutually_exclusive_group(required=True)
+        cutoff.add_argument('--days', type=int,
+            help='archive requests closed more than this many days ago')
+        cutoff.add_argument('--before',
+            help='archive requests closed before this date (yyyy-mm-dd, UTC)')
+        parser.add_argument('--with-reqs', action='store_true', dest='withreqs',
+            help='also archive feature requests with nothing left open or closed')
+        parser.add_argument('--batch', type=int, default=ARCHIVE_BATCH,
+            help='rows moved per transaction (default {0})'.format(ARCHIVE_BATCH))
+        parser.add_argument('--dry-run', action='store_true', dest='dryrun',
+            help='only count rows which would be archived')
+
+    def handle(self, *args, **options):
+        if options['days'] is not None:
+            if options['days'] < 0:
+                raise CommandError('--days must not be negative')
+            cutoff = approxnow() - datetime.timedelta(days=options['days'])
+        else:
+            try:
+                cutoff = datetime.datetime.strptime(options['before'], DATEONLYFMT).replace(
+                    tzinfo=datetime.timezone.utc)
+            except ValueError:
+                raise CommandError('Invalid date: {0}'.format(options['before']))
+        if options['batch'] < 1:
+            raise CommandError('--batch must be positive')
+
+        start = time.perf_counter()
+        try:
+            closedcount, reqcount = archiveclosed(
+                cutoff, withreqs=options['withreqs'], batch=options['batch'], dryrun=options['dryrun'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - start
+
+        verb = 'Would archive' if options['dryrun'] else 'Archived'
+        self.stdout.write('{0} {1} closed request(s) and {2} request(s) to {3} ({4:.1f}s)'.format(
+            verb, closedcount, reqcount, ARCHIVE_DB, elapsed))
@@ -0,0 +1,45 @@
+import sys, time
+from django.core.management.base import BaseCommand, CommandError
+from featreq.export import exportstream, parsetypes, EXPORT_TYPES, EXPORT_FORMATS, EXPORT_CHUNK
+
+class Command(BaseCommand):
+    help = 'Exports requests, clients, and open/closed requests as NDJSON or CSV'
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='ndjson', dest='fmt',
+            help='output format (default ndjson)')
+        parser.add_argument('--types', default='',
+            help='comma-separated types to export, from {0} (default all; CSV takes one)'.format(
+                ', '.join(EXPORT_TYPES)))
+        parser.add_argument('--gzip', action='store_true',
+            help='gzip output')
+        parser.add_argument('--chunk', type=int, default=EXPORT_CHUNK,
+            help='rows read per query (default {0})'.format(EXPORT_CHUNK))
+        parser.add_argument('-o', '--output',
+            help='file to write to (default stdout)')
+
+    def handle(self, *args, **options):
+        counts = {}
+        try:
+            types = parsetypes(options['types'])
+            chunks = exportstream(types, options['fmt'], options['gzip'], options['chunk'], counts)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        start = time.perf_counter()
+        outfile = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for data in chunks:
+                outfile.write(data)
+        finally:
+            if options['output']:
+                outfile.close()
+            else:
+                outfile.flush()
+        elapsed = time.perf_counter() - start
+
+        total = sum(counts.values())
+        rate = total / elapsed if elapsed > 0 else 0
+        self.stderr.write('Exported {0} row(s) in {1:.1f}s ({2:,.0f} rows/s): {3}'.format(
+            total, elapsed, rate, ', '.join('{0} {1}'.format(counts.get(t, 0), t) for t in types)))
@@ -0,0 +1,110 @@
+import gzip, os, sys, time
+from django.core.management.base import BaseCommand, CommandError
+from featreq.importer import importlines, IMPORT_BATCH, IMPORT_USER, IMPORT_TYPES
+from featreq.codec import jsondumps, jsonloads
+from featreq.stats import rebuildrollups
+
+# Seconds between progress reports
+PROGRESS_INTERVAL = 5
+# Errors shown individually (the rest are only counted)
+ERRORS_SHOWN = 20
+
+def readcheckpoint(path):
+    '''Returns checkpoint dict from file at path, or None if missing'''
+    try:
+        with open(path, 'rb') as f:
+            return jsonloads(f.read())
+    except FileNotFoundError:
+        return None
+
+def writecheckpoint(path, state):
+    '''Writes checkpoint dict state to file at path, atomically'''
+    tmppath = path + '.tmp'
+    with open(tmppath, 'wb') as f:
+        f.write(jsondumps(state, pretty=False))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmppath, path)
+
+class Command(BaseCommand):
+    help = 'Imports requests, clients, and open/closed requests from NDJSON (as written by featreq_export)'
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('input',
+            help='NDJSON file to read (gzipped if ending in .gz), or - for stdin')
+        parser.add_argument('--batch', type=int, default=IMPORT_BATCH,
+            help='records per transaction (default {0})'.format(IMPORT_BATCH))
+        parser.add_argument('--user', default=IMPORT_USER,
+            help='username for rows without one (default {0})'.format(IMPORT_USER))
+        parser.add_argument('--checkpoint',
+            help='checkpoint file, for resuming (default <input>.checkpoint; none for stdin)')
+        parser.add_argument('--restart', action='store_true',
+            help='ignore any existing checkpoint and start from the beginning')
+        parser.add_argument('--no-events', action='store_false', dest='events',
+            help="don't record change events for imported rows")
+        parser.add_argument('--no-rollups', action='store_false', dest='rollups',
+            help="don't rebuild statistics rollups afterwards")
+
+    def handle(self, *args, **options):
+        if options['batch'] < 1:
+            raise CommandError('--batch must be positive')
+        source = options['input']
+        ckpath = options['checkpoint']
+        if ckpath is None and source != '-':
+            ckpath = source + '.checkpoint'
+
+        # Resume after last committed batch, if checkpointed
+        skip = 0
+        if ckpath and not options['restart']:
+            state = readcheckpoint(ckpath)
+            if state is not None:
+                if state.get('source') != source:
+                    raise CommandError('Checkpoint {0} is for {1}, not {2} (use --restart to ignore)'.format(
+                        ckpath, state.get('source'), source))
+                skip = state['line']
+                self.stderr.write('Resuming after line {0}'.format(skip))
+
+        if source == '-':
+            infile = sys.stdin.buffer
+        elif source.endswith('.gz'):
+            infile = gzip.open(source, 'rb')
+        else:
+            infile = open(source, 'rb')
+
+        totals, errcount = {}, 0
+        start = lastreport = time.perf_counter()
+        try:
+            for lineno, counts, errors in importlines(
+                    infile, options['user'], options['batch'], skip, options['events']):
+                for typename, count in counts.items():
+                    totals[typename] = totals.get(typename, 0) + count
+                for errline, msg in errors:
+                    if errcount < ERRORS_SHOWN:
+                        self.stderr.write('Line {0}: {1}'.format(errline, msg))
+                    errcount += 1
+                if ckpath:
+                    writecheckpoint(ckpath, {'source': source, 'line': lineno})
+                now = time.perf_counter()
+                if now - lastreport >= PROGRESS_INTERVAL:
+                    total = sum(totals.values())
+                    self.stderr.write('Line {0}: {1} row(s) ({2:,.0f} rows/s)'.format(
+                        lineno, total, total / (now - start)))
+                    lastreport = now
+        finally:
+            if infile is not sys.stdin.buffer:
+                infile.close()
+        elapsed = time.perf_counter() - start
+
+        total = sum(totals.values())
+        rate = total / elapsed if elapsed > 0 else 0
+        self.stdout.write('Imported {0} row(s) in {1:.1f}s ({2:,.0f} rows/s): {3}; {4} record(s) skipped'.format(
+            total, elapsed, rate, ', '.join('{0} {1}'.format(totals.get(t, 0), t)
+                for t in IMPORT_TYPES), errcount))
+
+        if options['rollups'] and total:
+            rebuildrollups()
+            self.stdout.write('Rebuilt statistics rollups')
+        # Finished, so a rerun starts over
+        if ckpath and os.path.exists(ckpath):
+            os.remove(ckpath)
@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from featreq.deadlines import scanoverdue, SCAN_BATCH
+
+class Command(BaseCommand):
+    help = 'Records events for open requests which have become overdue since the last scan'
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', type=int, metavar='SECONDS',
+            help='keep scanning, this many seconds apart')
+        parser.add_argument('--batch', type=int, default=SCAN_BATCH,
+            help='requests recorded per transaction (default {0})'.format(SCAN_BATCH))
+
+    def handle(self, *args, **options):
+        if options['batch'] < 1:
+            raise CommandError('--batch must be positive')
+        if options['loop'] is not None and options['loop'] < 1:
+            raise CommandError('--loop must be positive')
+
+        while True:
+            start = time.perf_counter()
+            found = scanoverdue(batch=options['batch'])
+            elapsed = time.perf_counter() - start
+            if found or options['loop'] is None:
+                self.stdout.write('{0} request(s) newly overdue ({1:.2f}s)'.format(found, elapsed))
+            if options['loop'] is None:
+                break
+            time.sleep(options['loop'])
@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from featreq.stats import rebuildrollups
+
+class Command(BaseCommand):
+    help = 'Rebuilds the statistics rollup tables from open and closed requests'
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+            help='only report rows which have drifted, without rebuilding')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        opendrift, closeddrift, timedrift = rebuildrollups(check=options['check'])
+        elapsed = time.perf_counter() - start
+
+        verb = 'Checked' if options['check'] else 'Rebuilt'
+        self.stdout.write('{0} rollups ({1:.1f}s): {2} open, {3} closed, {4} close-time row(s) drifted'.format(
+            verb, elapsed, opendrift, closeddrift, timedrift))
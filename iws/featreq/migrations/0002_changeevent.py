@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import featreq.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('featreq', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('req_created', 'Request created'), ('req_updated', 'Request updated'), ('opened', 'Request opened'), ('open_updated', 'Open request updated'), ('reprioritized', 'Priorities shifted'), ('closed', 'Request closed'), ('client_changed', 'Client changed')], editable=False, max_length=16, verbose_name='Event')),
+                ('client_id', models.UUIDField(blank=True, default=None, editable=False, null=True, verbose_name='Client ID')),
+                ('req_id', models.UUIDField(blank=True, default=None, editable=False, null=True, verbose_name='Request ID')),
+                ('data', models.TextField(blank=True, default='', editable=False, verbose_name='Payload')),
+                ('date', models.DateTimeField(blank=True, default=featreq.utils.approxnow, editable=False, verbose_name='Recorded at')),
+            ],
+            options={
+                'db_table': 'changes',
+                'verbose_name': 'change event',
+                'verbose_name_plural': 'change events',
+            },
+        ),
+    ]
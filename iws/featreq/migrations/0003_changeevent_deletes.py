@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('featreq', '0002_changeevent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='changeevent',
+            name='kind',
+            field=models.CharField(choices=[('req_created', 'Request created'), ('req_updated', 'Request updated'), ('opened', 'Request opened'), ('open_updated', 'Open request updated'), ('reprioritized', 'Priorities shifted'), ('closed', 'Request closed'), ('client_changed', 'Client changed'), ('req_deleted', 'Request deleted'), ('client_deleted', 'Client deleted'), ('open_deleted', 'Open request deleted'), ('closed_deleted', 'Closed request deleted')], editable=False, max_length=16, verbose_name='Event'),
+        ),
+    ]
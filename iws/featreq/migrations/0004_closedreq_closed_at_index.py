@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import featreq.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('featreq', '0003_changeevent_deletes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='closedreq',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, db_index=True, default=featreq.utils.approxnow, editable=False, verbose_name='Closed at'),
+        ),
+    ]
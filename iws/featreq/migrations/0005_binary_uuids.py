@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import featreq.fields
+import uuid
+
+# Columns holding request/client UUIDs, by table
+UUID_COLUMNS = (
+    ('featreqs', 'id'), ('clients', 'id'),
+    ('openreqs', 'req_id'), ('openreqs', 'client_id'),
+    ('closedreqs', 'req_id'), ('closedreqs', 'client_id'),
+)
+
+def _uuidbytes(value):
+    return bytes.fromhex(value) if isinstance(value, str) else value
+
+def uuids_tobinary(apps, schema_editor):
+    '''Converts stored 32-char hex UUIDs to 16-byte blobs (SQLite only; the
+    table rebuilds above copy values over unchanged)
+    '''
+    conn = schema_editor.connection
+    if conn.vendor != 'sqlite':
+        return
+    conn.ensure_connection()
+    conn.connection.create_function('iws_uuidbytes', 1, _uuidbytes)
+    with conn.cursor() as cursor:
+        for table, column in UUID_COLUMNS:
+            cursor.execute(
+                'UPDATE "{0}" SET "{1}" = iws_uuidbytes("{1}") WHERE typeof("{1}") = \'text\''.format(table, column))
+
+def uuids_tohex(apps, schema_editor):
+    '''Converts 16-byte blob UUIDs back to 32-char hex'''
+    conn = schema_editor.connection
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        for table, column in UUID_COLUMNS:
+            cursor.execute(
+                'UPDATE "{0}" SET "{1}" = lower(hex("{1}")) WHERE typeof("{1}") = \'blob\''.format(table, column))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('featreq', '0004_closedreq_closed_at_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='clientinfo',
+            name='id',
+            field=featreq.fields.BinaryUUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, verbose_name='Client ID'),
+        ),
+        migrations.AlterField(
+            model_name='featurereq',
+            name='id',
+            field=featreq.fields.BinaryUUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, verbose_name='Request ID'),
+        ),
+        # Unchanged definitions, but rebuilding the link tables redeclares
+        # their foreign key columns with the new key type
+        migrations.AlterField(
+            model_name='openreq',
+            name='client',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='open_list', to='featreq.ClientInfo', verbose_name='Client'),
+        ),
+        migrations.AlterField(
+            model_name='openreq',
+            name='req',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='open_list', to='featreq.FeatureReq', verbose_name='Request'),
+        ),
+        migrations.AlterField(
+            model_name='closedreq',
+            name='client',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='closed_list', to='featreq.ClientInfo', verbose_name='Client'),
+        ),
+        migrations.AlterField(
+            model_name='closedreq',
+            name='req',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='closed_list', to='featreq.FeatureReq', verbose_name='Request'),
+        ),
+        migrations.RunPython(uuids_tobinary, uuids_tohex),
+    ]
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import featreq.fields
+
+def _compress(value):
+    return featreq.fields.compresstext(value) if isinstance(value, str) else value
+
+def _decompress(value):
+    return featreq.fields.decompresstext(value) if isinstance(value, bytes) else value
+
+def desc_compress(apps, schema_editor):
+    '''Compresses stored descriptions (SQLite only; the table rebuild above
+    copies text over unchanged)
+    '''
+    conn = schema_editor.connection
+    if conn.vendor != 'sqlite':
+        return
+    conn.ensure_connection()
+    conn.connection.create_function('iws_compress', 1, _compress)
+    with conn.cursor() as cursor:
+        cursor.execute('UPDATE "featreqs" SET "desc" = iws_compress("desc") WHERE typeof("desc") = \'text\'')
+
+def desc_decompress(apps, schema_editor):
+    '''Decompresses stored descriptions back to text'''
+    conn = schema_editor.connection
+    if conn.vendor != 'sqlite':
+        return
+    conn.ensure_connection()
+    conn.connection.create_function('iws_decompress', 1, _decompress)
+    with conn.cursor() as cursor:
+        cursor.execute('UPDATE "featreqs" SET "desc" = iws_decompress("desc") WHERE typeof("desc") = \'blob\'')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('featreq', '0005_binary_uuids'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='featurereq',
+            name='desc',
+            field=featreq.fields.CompressedTextField(verbose_name='Description'),
+        ),
+        migrations.RunPython(desc_compress, desc_decompress),
+    ]
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import featreq.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('featreq', '0006_compressed_desc'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedClosedReq',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_id', featreq.fields.BinaryUUIDField(editable=False, verbose_name='Client ID')),
+                ('req_id', featreq.fields.BinaryUUIDField(editable=False, verbose_name='Request ID')),
+                ('priority', models.SmallIntegerField(blank=True, default=None, null=True, verbose_name='Priority')),
+                ('date_tgt', models.DateTimeField(blank=True, default=None, null=True, verbose_name='Target date')),
+                ('opened_at', models.DateTimeField(editable=False, verbose_name='Opened at')),
+                ('opened_by', models.CharField(editable=False, max_length=30, verbose_name='Opened by')),
+                ('closed_at', models.DateTimeField(editable=False, verbose_name='Closed at')),
+                ('closed_by', models.CharField(editable=False, max_length=30, verbose_name='Closed by')),
+                ('status', models.CharField(choices=[('', 'Select status'), ('C', 'Complete'), ('R', 'Rejected'), ('D', 'Deferred')], max_length=1, verbose_name='Closed as')),
+                ('reason', models.CharField(blank=True, default='', max_length=128, verbose_name='Details')),
+            ],
+            options={
+                'db_table': 'archive"."closedreqs',
+                'verbose_name': 'archived closed request',
+                'verbose_name_plural': 'archived closed requests',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedFeatureReq',
+            fields=[
+                ('id', featreq.fields.BinaryUUIDField(editable=False, primary_key=True, serialize=False, verbose_name='Request ID')),
+                ('title', models.CharField(max_length=128, verbose_name='Summary')),
+                ('desc', featreq.fields.CompressedTextField(verbose_name='Description')),
+                ('ref_url', models.URLField(blank=True, default='', max_length=254, verbose_name='Reference URL')),
+                ('prod_area', models.CharField(choices=[('', 'Select area'), ('PO', 'Policies'), ('BI', 'Billing'), ('CL', 'Claims'), ('RE', 'Reports')], max_length=2, verbose_name='Product area')),
+                ('date_cr', models.DateTimeField(editable=False, verbose_name='Created at')),
+                ('date_up', models.DateTimeField(editable=False, verbose_name='Updated at')),
+                ('user_cr', models.CharField(editable=False, max_length=30, verbose_name='Created by')),
+                ('user_up', models.CharField(editable=False, max_length=30, verbose_name='Updated by')),
+            ],
+            options={
+                'db_table': 'archive"."featreqs',
+                'verbose_name': 'archived request',
+                'verbose_name_plural': 'archived requests',
+                'managed': False,
+            },
+        ),
+    ]
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import Counter
+from django.db import migrations, models
+import featreq.fields
+
+def rollups_build(apps, schema_editor):
+    '''Fills rollup tables from existing open/closed requests'''
+    OpenReq = apps.get_model('featreq', 'OpenReq')
+    ClosedReq = apps.get_model('featreq', 'ClosedReq')
+    OpenStat = apps.get_model('featreq', 'OpenStat')
+    ClosedStat = apps.get_model('featreq', 'ClosedStat')
+    CloseTimeStat = apps.get_model('featreq', 'CloseTimeStat')
+
+    OpenStat.objects.bulk_create([
+        OpenStat(client_id=client_id, prod_area=prod_area, count=count)
+        for client_id, prod_area, count in OpenReq.objects.values_list(
+            'client_id', 'req__prod_area').annotate(models.Count('id')).order_by()
+    ])
+
+    closed, closetime = Counter(), Counter()
+    for client_id, opened_at, closed_at, status in ClosedReq.objects.values_list(
+            'client_id', 'opened_at', 'closed_at', 'status').iterator():
+        closed[(client_id, closed_at.strftime('%Y-%m'), status)] += 1
+        closetime[max((closed_at - opened_at).days, 0)] += 1
+    ClosedStat.objects.bulk_create([
+        ClosedStat(client_id=client_id, month=month, status=status, count=count)
+        for (client_id, month, status), count in closed.items()
+    ])
+    CloseTimeStat.objects.bulk_create([
+        CloseTimeStat(days=days, count=count) for days, count in closetime.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('featreq', '0007_archive_models'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClosedStat',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_id', featreq.fields.BinaryUUIDField(verbose_name='Client ID')),
+                ('month', models.CharField(max_length=7, verbose_name='Month closed')),
+                ('status', models.CharField(choices=[('', 'Select status'), ('C', 'Complete'), ('R', 'Rejected'), ('D', 'Deferred')], max_length=1, verbose_name='Closed as')),
+                ('count', models.IntegerField(default=0, verbose_name='Count')),
+            ],
+            options={
+                'db_table': 'stats_closed',
+            },
+        ),
+        migrations.CreateModel(
+            name='CloseTimeStat',
+            fields=[
+                ('days', models.IntegerField(primary_key=True, serialize=False, verbose_name='Days to close')),
+                ('count', models.IntegerField(default=0, verbose_name='Count')),
+            ],
+            options={
+                'db_table': 'stats_closetime',
+            },
+        ),
+        migrations.CreateModel(
+            name='OpenStat',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_id', featreq.fields.BinaryUUIDField(verbose_name='Client ID')),
+                ('prod_area', models.CharField(choices=[('', 'Select area'), ('PO', 'Policies'), ('BI', 'Billing'), ('CL', 'Claims'), ('RE', 'Reports')], max_length=2, verbose_name='Product area')),
+                ('count', models.IntegerField(default=0, verbose_name='Count')),
+            ],
+            options={
+                'db_table': 'stats_open',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='closedstat',
+            unique_together=set([('client_id', 'month', 'status')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='openstat',
+            unique_together=set([('client_id', 'prod_area')]),
+        ),
+        migrations.RunPython(rollups_build, migrations.RunPython.noop),
+    ]
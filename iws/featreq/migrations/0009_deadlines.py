@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('featreq', '0008_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='openreq',
+            name='date_tgt',
+            field=models.DateTimeField(blank=True, db_index=True, default=None, null=True, verbose_name='Target date'),
+        ),
+        migrations.AlterField(
+            model_name='changeevent',
+            name='kind',
+            field=models.CharField(choices=[('req_created', 'Request created'), ('req_updated', 'Request updated'), ('opened', 'Request opened'), ('open_updated', 'Open request updated'), ('reprioritized', 'Priorities shifted'), ('closed', 'Request closed'), ('client_changed', 'Client changed'), ('req_deleted', 'Request deleted'), ('client_deleted', 'Client deleted'), ('open_deleted', 'Open request deleted'), ('closed_deleted', 'Closed request deleted'), ('overdue', 'Open request overdue')], editable=False, max_length=16, verbose_name='Event'),
+        ),
+        migrations.CreateModel(
+            name='ScanMark',
+            fields=[
+                ('name', models.CharField(max_length=32, primary_key=True, serialize=False, verbose_name='Scan')),
+                ('mark', models.DateTimeField(verbose_name='Scanned to')),
+                ('last_id', models.IntegerField(default=0, verbose_name='Last row ID')),
+            ],
+            options={
+                'db_table': 'scanmarks',
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import featreq.fields
+
+def desc_copy(apps, schema_editor):
+    '''Copies descriptions to the side table (as stored, so still compressed)'''
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('INSERT INTO "featreq_descs" ("req_id", "body") SELECT "id", "desc" FROM "featreqs"')
+
+def desc_copyback(apps, schema_editor):
+    '''Copies descriptions back from the side table'''
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('UPDATE "featreqs" SET "desc" = (SELECT "body" FROM "featreq_descs" '
+            'WHERE "featreq_descs"."req_id" = "featreqs"."id") '
+            'WHERE "id" IN (SELECT "req_id" FROM "featreq_descs")')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('featreq', '0010_row_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeatureReqDesc',
+            fields=[
+                ('req', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='desc_row', serialize=False, to='featreq.FeatureReq', verbose_name='Request')),
+                ('body', featreq.fields.CompressedTextField(verbose_name='Description')),
+            ],
+            options={
+                'verbose_name': 'description',
+                'verbose_name_plural': 'descriptions',
+                'db_table': 'featreq_descs',
+            },
+        ),
+        migrations.RunPython(desc_copy, desc_copyback),
+        # Default only so that reversing this can add the column back
+        migrations.AlterField(
+            model_name='featurereq',
+            name='desc',
+            field=featreq.fields.CompressedTextField(default='', verbose_name='Description'),
+        ),
+        migrations.RemoveField(
+            model_name='featurereq',
+            name='desc',
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('featreq', '0011_desc_side_table'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='featurereq',
+            name='title',
+            field=models.CharField(db_index=True, max_length=128, verbose_name='Summary'),
+        ),
+    ]
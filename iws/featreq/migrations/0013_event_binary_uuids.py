@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import featreq.fields
+
+# Change event columns holding request/client UUIDs (as in 0005_binary_uuids)
+UUID_COLUMNS = (('changes', 'client_id'), ('changes', 'req_id'))
+
+def _uuidbytes(value):
+    return bytes.fromhex(value) if isinstance(value, str) else value
+
+def uuids_tobinary(apps, schema_editor):
+    '''Converts stored 32-char hex UUIDs to 16-byte blobs (SQLite only; the
+    table rebuilds above copy values over unchanged)
+    '''
+    conn = schema_editor.connection
+    if conn.vendor != 'sqlite':
+        return
+    conn.ensure_connection()
+    conn.connection.create_function('iws_uuidbytes', 1, _uuidbytes)
+    with conn.cursor() as cursor:
+        for table, column in UUID_COLUMNS:
+            cursor.execute(
+                'UPDATE "{0}" SET "{1}" = iws_uuidbytes("{1}") WHERE typeof("{1}") = \'text\''.format(table, column))
+
+def uuids_tohex(apps, schema_editor):
+    '''Converts 16-byte blob UUIDs back to 32-char hex'''
+    conn = schema_editor.connection
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        for table, column in UUID_COLUMNS:
+            cursor.execute(
+                'UPDATE "{0}" SET "{1}" = lower(hex("{1}")) WHERE typeof("{1}") = \'blob\''.format(table, column))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('featreq', '0012_title_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='changeevent',
+            name='client_id',
+            field=featreq.fields.BinaryUUIDField(blank=True, default=None, editable=False, null=True, verbose_name='Client ID'),
+        ),
+        migrations.AlterField(
+            model_name='changeevent',
+            name='req_id',
+            field=featreq.fields.BinaryUUIDField(blank=True, default=None, editable=False, null=True, verbose_name='Request ID'),
+        ),
+        migrations.RunPython(uuids_tobinary, uuids_tohex),
+    ]
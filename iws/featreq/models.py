@@ -1,10 +1,15 @@
-import datetime, uuid
+import datetime, uuid, threading
 from collections import OrderedDict
-from django.db import models, transaction
+from contextlib import contextmanager
+from django.db import models, transaction, IntegrityError
 from django.db.models import F
-from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.signals import pre_delete, post_delete
+from django.dispatch import receiver
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.conf import settings
 from .utils import *
+from .codec import jsondumps
+from .fields import BinaryUUIDField, CompressedTextField, plaintext
 
 ## Module-level functions
 
@@ -41,13 +46,90 @@ def statusbyshort(status):
     '''Get full name of short closed status identifier'''
     return STATUS_BY_SHORT[status]
 
+# Change event types
+EVENT_CHOICES = (
+    ('req_created', 'Request created'),
+    ('req_updated', 'Request updated'),
+    ('opened', 'Request opened'),
+    ('open_updated', 'Open request updated'),
+    ('reprioritized', 'Priorities shifted'),
+    ('closed', 'Request closed'),
+    ('client_changed', 'Client changed'),
+    ('req_deleted', 'Request deleted'),
+    ('client_deleted', 'Client deleted'),
+    ('open_deleted', 'Open request deleted'),
+    ('closed_deleted', 'Closed request deleted'),
+    ('overdue', 'Open request overdue'),
+)
+
+# Compact request fields included in change events (no description)
+EVENT_REQ_FIELDS = ('id', 'title', 'prod_area', 'date_up', 'user_up')
+
+## Row versions
+# Requests and open requests carry a version number, bumped by every update.
+# Updates are compare-and-swap: a single UPDATE ... WHERE id = ? AND
+# version = ?, so concurrent writers never overwrite each other's changes,
+# and no transaction is held open while new values are worked out. Callers
+# passing the version they read get VersionConflict if it's changed since;
+# otherwise the update is redone against the latest version.
+# Versions are only serialized when asked for (they're in optfields, see
+# utils.defaultfields()), so default responses, exports and events keep
+# the same fields as before; API clients get them from ETag headers, or
+# with fields=version.
+
+# Times an update is redone if other updates keep landing first
+UPDATE_RETRIES = 5
+
+class VersionConflict(ValueError):
+    """Raised when a row has changed since the version an update expected"""
+
 
 ## Model and manager classes
 
+## Descriptions
+# Request descriptions are unbounded (every update can append to them), so
+# they're kept in a side table (FeatureReqDesc), compressed, rather than in
+# featreqs itself: scans of featreqs, as the list views do, then only read
+# the small columns. FeatureReq.desc is a property, read from the side
+# table when first used, or in the same query (by join) by any FeatureReq
+# QuerySet which names desc as a field (see FeatReqQuerySet); queries of
+# other models name it via FeatureReq.lookups (see utils.fieldlookups()).
+
+# Lookup of FeatureReq.desc in its side table
+DESC_LOOKUP = 'desc_row__body'
+
+class FeatReqQuerySet(models.QuerySet):
+    """QuerySet for FeatureReq, reading desc in the same query when named"""
+
+    def withdesc(self):
+        '''Returns QuerySet reading desc (by join) along with each request'''
+        if 'desc' in self.query.annotations:
+            return self
+        return self.annotate(desc=F(DESC_LOOKUP))
+
+    def only(self, *fields):
+        if 'desc' not in fields:
+            return super(FeatReqQuerySet, self).only(*fields)
+        return super(FeatReqQuerySet, self.withdesc()).only(*[ fn for fn in fields if fn != 'desc' ])
+
+    def values(self, *fields, **kwargs):
+        qset = self.withdesc() if 'desc' in fields else self
+        return super(FeatReqQuerySet, qset).values(*fields, **kwargs)
+
+    def values_list(self, *fields, **kwargs):
+        qset = self.withdesc() if 'desc' in fields else self
+        return super(FeatReqQuerySet, qset).values_list(*fields, **kwargs)
+
 # Feature request manager
 class FeatReqManager(models.Manager):
     """Model manager for FeatureReq"""
 
+    def get_queryset(self):
+        return FeatReqQuerySet(self.model, using=self._db)
+
+    def withdesc(self):
+        return self.get_queryset().withdesc()
+
     def newreq(self, user, title, desc, ref_url='', prod_area='Policies', id=None):
         '''Create new request'''
         # Check for required fields
@@ -82,10 +164,12 @@ class FeatReqManager(models.Manager):
         newargs['date_cr'] = dt
         newargs['date_up'] = dt
 
-        # Create new instance, validate fields, and save
+        # Create new instance, validate fields, and save (recording change)
         fr = FeatureReq(**newargs)
         fr.full_clean()
-        fr.save()
+        with transaction.atomic():
+            fr.save()
+            ChangeEvent.objects.record('req_created', req_id=fr.id, data=fr.jsondict(EVENT_REQ_FIELDS))
         return fr
 
 
@@ -102,12 +186,13 @@ class FeatureReq(models.Model):
     # Fields
     # TODO: add help_text for some/all?
 
-    # UUIDv4 for long-term sanity
-    id = models.UUIDField('Request ID', primary_key=True, default=uuid.uuid4, editable=False)
+    # UUIDv4 for long-term sanity (stored as 16 bytes, see BinaryUUIDField)
+    id = BinaryUUIDField('Request ID', primary_key=True, default=uuid.uuid4, editable=False)
     # Title, summary, subject line, whatever you want to call it
-    title = models.CharField('Summary', max_length=128)
-    # Full description
-    desc = models.TextField('Description')
+    # (indexed for admin prefix searches)
+    title = models.CharField('Summary', max_length=128, db_index=True)
+    # Full description (stored compressed in a side table, see FeatureReqDesc
+    # and the desc property below)
     # URL for reference in ticket
     # TODO: possibly make many-to-many?
     ref_url = models.URLField('Reference URL', max_length=254, blank=True, default='')
@@ -128,23 +213,88 @@ class FeatureReq(models.Model):
     user_cr = models.CharField('Created by', max_length=30, blank=False, editable=False)
     # Username of latest updater
     user_up = models.CharField('Updated by', max_length=30, blank=False, editable=False)
+    # Row version (see updatereq())
+    version = models.PositiveIntegerField('Version', default=1, editable=False)
 
     objects = FeatReqManager()
 
     # Fields to serialize, in order, with callable JSON translators if required
     # fieldlist = ('id', 'title', 'desc', 'ref_url', 'prod_area', 'date_cr', 'user_cr', 'date_up', 'user_up')
     fields = OrderedDict([
-        ('id', str), ('title', None), ('desc', None), ('ref_url', None), ('prod_area', areabyshort),
-        ('date_cr', approxdatefmt), ('user_cr', None), ('date_up', approxdatefmt), ('user_up', None)
+        ('id', str), ('title', None), ('desc', plaintext), ('ref_url', None), ('prod_area', areabyshort),
+        ('date_cr', approxdatefmt), ('user_cr', None), ('date_up', approxdatefmt), ('user_up', None),
+        ('version', None)
     ])
+    # Fields only serialized when asked for by name
+    optfields = ('version',)
+
+    # Fields stored in other tables, by lookup (see utils.fieldlookups())
+    lookups = {'desc': DESC_LOOKUP}
 
     # Will call tojsondict() with self
     jsondict = tojsondict
 
+    # Description, once read or set
+    _desc = None
+
     def __str__(self):
         return str(self.title)
 
-    def updatereq(self, user, desc=None, title=None, ref_url=None, prod_area=None):
+    @property
+    def desc(self):
+        '''Description, read from FeatureReqDesc when first used (unless
+        the query which loaded the request read it already)
+        '''
+        if self._desc is None:
+            try:
+                self._desc = self.desc_row.body
+            except FeatureReqDesc.DoesNotExist:
+                self._desc = ''
+        # Decompressed on first use (see fields.CompressedText)
+        self._desc = plaintext(self._desc)
+        return self._desc
+
+    @desc.setter
+    def desc(self, value):
+        self._desc = value
+
+    def clean_fields(self, exclude=None):
+        '''Validates fields, including desc (if it's been read or set) as
+        its side table's field would
+        '''
+        errors = {}
+        try:
+            super(FeatureReq, self).clean_fields(exclude)
+        except ValidationError as e:
+            errors = e.update_error_dict(errors)
+        if self._desc is not None and (not exclude or 'desc' not in exclude):
+            try:
+                FeatureReqDesc._meta.get_field('body').clean(self.desc, None)
+            except ValidationError as e:
+                errors['desc'] = e.error_list
+        if errors:
+            raise ValidationError(errors)
+
+    def save(self, *args, **kwargs):
+        '''Saves request, and its description if it's been read or set'''
+        with transaction.atomic():
+            super(FeatureReq, self).save(*args, **kwargs)
+            if self._desc is not None:
+                FeatureReqDesc(req_id=self.id, body=self._desc).save()
+
+    def refresh_from_db(self, *args, **kwargs):
+        super(FeatureReq, self).refresh_from_db(*args, **kwargs)
+        # Description is reread when next used
+        self._desc = None
+        self.__dict__.pop(self._meta.get_field('desc_row').get_cache_name(), None)
+
+    def updatereq(self, user, desc=None, title=None, ref_url=None, prod_area=None, version=None):
+        '''Updates request, appending desc (if given) to the description.
+
+        If version is given, raises VersionConflict unless the request is
+        still at that version when saved. Otherwise, if another update lands
+        first, this one is reapplied on top of it (so no addendum is lost).
+        '''
         # Check for required fields
         if not user:
             raise ValueError('User field required')
@@ -152,10 +302,27 @@ class FeatureReq(models.Model):
         # If not, return unchanged
         if not desc and not title and not prod_area and ref_url is None:
             return self
-
+        if version is not None and version != self.version:
+            raise VersionConflict('Request {0} is at version {1}, not {2}'.format(self.id, self.version, version))
+
+        for attempt in range(UPDATE_RETRIES):
+            if self._casupdate(user, desc, title, ref_url, prod_area):
+                return self
+            # Start over from the latest version (or leave self at it)
+            self.refresh_from_db()
+            if version is not None:
+                raise VersionConflict('Request {0} changed since version {1}'.format(self.id, version))
+        raise VersionConflict('Request {0} changed too often to update'.format(self.id))
+
+    def _casupdate(self, user, desc, title, ref_url, prod_area):
+        '''Applies update to self, then saves it only if the stored request
+        is still at self's version. Returns True if saved.
+        '''
         # Get current datetime
         dt = approxnow()
         dtstr = dt.strftime('%Y-%m-%d %H:%M:%S UTC')
+        oldarea = self.prod_area
+        expected = self.version
         padstr = '\n\n'
         upstr = ""
 
@@ -218,11 +385,42 @@ class FeatureReq(models.Model):
         # Change update user/time
         self.date_up = dt
         self.user_up = user
+        self.version = expected + 1
 
-        # Finally, update, validate, save, return
+        # Finally, validate, save if unchanged since read (recording change)
         self.full_clean()
-        self.save()
-        return self
+        with transaction.atomic():
+            updfields = ('title', 'ref_url', 'prod_area', 'date_up', 'user_up', 'version')
+            if not FeatureReq.objects.filter(id=self.id, version=expected).update(
+                    **{ fname: getattr(self, fname) for fname in updfields }):
+                return False
+            FeatureReqDesc(req_id=self.id, body=self.desc).save()
+            ChangeEvent.objects.record('req_updated', req_id=self.id, data=self.jsondict(EVENT_REQ_FIELDS))
+            # Move open counts to new product area
+            if self.prod_area != oldarea:
+                counts = OpenReq.objects.filter(req_id=self.id).values_list('client_id').annotate(models.Count('id'))
+                for client_id, count in counts:
+                    OpenStat.objects.bump(-count, client_id=client_id, prod_area=oldarea)
+                    OpenStat.objects.bump(count, client_id=client_id, prod_area=self.prod_area)
+        return True
+
+
+# Feature request descriptions
+class FeatureReqDesc(models.Model):
+    """Feature request descriptions (see FeatureReq.desc)"""
+
+    class Meta:
+        verbose_name = 'description'
+        verbose_name_plural = 'descriptions'
+        db_table = 'featreq_descs'
+
+    req = models.OneToOneField(FeatureReq, on_delete=models.CASCADE, primary_key=True,
+        verbose_name='Request', related_name='desc_row')
+    # Stored compressed (see CompressedTextField)
+    body = CompressedTextField('Description')
+
+    def __str__(self):
+        return str(self.req_id)
 
 
 # Client manager
@@ -251,10 +449,12 @@ class ClientManager(models.Manager):
         # Get datetime (without microseconds)
         newargs['date_add'] = approxnow()
 
-        # Create instance, validate fields, and save
+        # Create instance, validate fields, and save (recording change)
         cl = ClientInfo(**newargs)
         cl.full_clean()
-        cl.save()
+        with transaction.atomic():
+            cl.save()
+            ChangeEvent.objects.record('client_changed', client_id=cl.id, data=cl.jsondict())
         return cl
 
 # Client details
@@ -267,8 +467,8 @@ class ClientInfo(models.Model):
         db_table = 'clients'
         # ordering = ['name']
 
-    # UUIDv4 for long-term sanity
-    id = models.UUIDField('Client ID', primary_key=True, default=uuid.uuid4, editable=False)
+    # UUIDv4 for long-term sanity (stored as 16 bytes, see BinaryUUIDField)
+    id = BinaryUUIDField('Client ID', primary_key=True, default=uuid.uuid4, editable=False)
     # Basic details
     name = models.CharField('Client name', max_length=64, db_index=True)
     con_name = models.CharField('Contact name', max_length=64, blank=True, default='')
@@ -328,9 +528,11 @@ class ClientInfo(models.Model):
         elif con_mail is None:
             self.con_mail = ''
 
-        # Finally, update, validate, save, return
+        # Finally, update, validate, save (recording change), return
         self.full_clean()
-        self.save()
+        with transaction.atomic():
+            self.save()
+            ChangeEvent.objects.record('client_changed', client_id=self.id, data=self.jsondict())
         return self
 
 
@@ -344,11 +546,12 @@ class ClientInfo(models.Model):
 class OpenReqManager(models.Manager):
     """Model manager for OpenReq"""
 
-    def shiftpri(self, client, priority):
+    def shiftpri(self, client, priority, exclude=None):
         '''Checks if client has open requests >= priority, and shifts them
         up by one if so. New priority must be an integer in range 1 < x < 32766
         (inclusive). Existing entries with priority value 32767 will be changed
-        to None/null.
+        to None/null. If exclude is given, the open request with that id is
+        left where it is (as it's the one being moved to priority).
 
         Returns True if records were shifted, False otherwise.
         '''
@@ -378,20 +581,27 @@ class OpenReqManager(models.Manager):
         # Start transaction, so all of this is (or should be) atomic
         with transaction.atomic():
             # Get everything matching client_id
-            toshift = self.filter(client_id=client_id)
+            clientreqs = self.filter(client_id=client_id)
+            toshift = clientreqs.exclude(id=exclude) if exclude is not None else clientreqs
             # Check if any openreqs match client_id and priority
             if not toshift.filter(priority=pr).exists():
                 # Nothing matches, good to go
                 return False
             # Anything at SmallIntegerField max goes to None(/null)
-            toshift.filter(priority=32767).update(priority=None)
+            toshift.filter(priority=32767).update(priority=None, version=F('version')+1)
             # Get everything >= priority and shift it up by one
-            toshift.filter(priority__gte=pr).update(priority=F('priority')+1)
+            toshift.filter(priority__gte=pr).update(priority=F('priority')+1, version=F('version')+1)
+            # Record client's new priorities (open lists per client are short,
+            # so we just send all of them)
+            ChangeEvent.objects.record('reprioritized', client_id=client_id, data=ordereddict([
+                ('client_id', str(client_id)),
+                ('priorities', [ [str(req_id), pri] for req_id, pri in clientreqs.values_list('req_id', 'priority') ])
+            ]))
 
         # Aaand that should do it
         return True
 
-    def updatereq(self, openreq, priority=False, date_tgt=False):
+    def updatereq(self, openreq, priority=False, date_tgt=False, version=None):
         '''Change priority and/or target date of given openreq.
 
         Param openreq can be an OpenReq instance, a primary key, or a dict with
@@ -403,48 +613,69 @@ class OpenReqManager(models.Manager):
         If date_tgt is a datetime object or a string in the form
         '%Y-%m-%dT%H:%M:%S', and in the future, it will be updated. If False
         (default), no update will be applied.
-        '''
-        # Wrap it all in a transaction -- too many parts to be safe from race
-        # conditions otherwise
-        with transaction.atomic():
-            # Check type of openreq and fetch if necessary
-            if not isinstance(openreq, OpenReq):
-                # Try int (primary key)
-                if isinstance(openreq, int):
-                    # Try getting OpenReq by id
-                    openreq = self.get(id=openreq)
-                # Try dict with req_id and client_id
-                elif isinstance(openreq, dict) and 'req_id' in openreq and 'client_id' in openreq:
-                    # Try getting OpenReq by ids (explicitly pulled from dict
-                    # just in case something else weird is in there)
-                    openreq = self.get(req_id=openreq['req_id'], client_id=openreq['client_id'])
-                # Nope, nothing doing
-                else:
-                    raise ValueError('Invalid OpenReq identifier {0}'.format(openreq))
 
-            # If we're not doing anything, return openreq unmodified
-            if priority is False and date_tgt is False:
-                return openreq
+        If version is given, raises VersionConflict unless openreq is still
+        at that version when saved. Otherwise, if another update lands first,
+        this one is reapplied on top of it.
+        '''
+        # Check type of openreq and fetch if necessary
+        if not isinstance(openreq, OpenReq):
+            # Try int (primary key)
+            if isinstance(openreq, int):
+                # Try getting OpenReq by id
+                openreq = self.get(id=openreq)
+            # Try dict with req_id and client_id
+            elif isinstance(openreq, dict) and 'req_id' in openreq and 'client_id' in openreq:
+                # Try getting OpenReq by ids (explicitly pulled from dict
+                # just in case something else weird is in there)
+                openreq = self.get(req_id=openreq['req_id'], client_id=openreq['client_id'])
+            # Nope, nothing doing
+            else:
+                raise ValueError('Invalid OpenReq identifier {0}'.format(openreq))
 
-            # Only update priority if not False
+        # If we're not doing anything, return openreq unmodified
+        if priority is False and date_tgt is False:
+            return openreq
+        if version is not None and version != openreq.version:
+            raise VersionConflict('Open request {0} is at version {1}, not {2}'.format(
+                openreq.id, openreq.version, version))
+
+        # If priority is None or 0, there's nothing to check/shift
+        if priority is not False and not priority:
+            priority = None
+        # Ensure date_tgt is in the future
+        if date_tgt is not False:
+            date_tgt = checkdatetgt(date_tgt)
+
+        for attempt in range(UPDATE_RETRIES):
+            oldpri, expected = openreq.priority, openreq.version
             if priority is not False:
-                # If priority is None or 0, we don't have to check/shift
-                if priority is None or priority == 0:
-                    openreq.priority = None
-                # Otherwise, check/shift other priorities for this client, and *then* save
-                elif priority != openreq.priority:
-                    self.shiftpri(openreq.client_id, priority)
-                    openreq.priority = priority
-
-            # Only update date_tgt if not False
+                openreq.priority = priority
             if date_tgt is not False:
-                # Ensure date_tgt is in the future
-                openreq.date_tgt = checkdatetgt(date_tgt)
-
-            # Now do the validate/save/return dance
+                openreq.date_tgt = date_tgt
+            openreq.version = expected + 1
+            # Validate before claiming anything
             openreq.full_clean()
-            openreq.save()
-            return openreq
+            moved = openreq.priority is not None and openreq.priority != oldpri
+
+            with transaction.atomic():
+                # One compare-and-swap UPDATE, so nothing is written if the
+                # row's changed since read
+                if self.filter(id=openreq.id, version=expected).update(
+                        priority=openreq.priority, date_tgt=openreq.date_tgt, version=openreq.version):
+                    # Only if the priority's moved, shift this client's other
+                    # open requests out of its way (in the same transaction)
+                    if moved:
+                        self.shiftpri(openreq.client_id, openreq.priority, exclude=openreq.id)
+                    ChangeEvent.objects.record(
+                        'open_updated', client_id=openreq.client_id, req_id=openreq.req_id, data=openreq.jsondict())
+                    return openreq
+
+            # Start over from the latest version (or leave openreq at it)
+            openreq.refresh_from_db()
+            if version is not None:
+                raise VersionConflict('Open request {0} changed since version {1}'.format(openreq.id, version))
+        raise VersionConflict('Open request {0} changed too often to update'.format(openreq.id))
 
     def attachreq(self, user, client, request, priority=None, date_tgt=None):
         '''Attach feature request to client.
@@ -502,6 +733,7 @@ class OpenReqManager(models.Manager):
             raise TypeError('Invalid req_id type: {0}'.format(type(request)))
 
         # Check priority (TypeError during int coercion will pass uncaught)
+        pr = None
         if priority:
             pr = int(priority)
             if pr < 0 or pr > 32766:
@@ -509,17 +741,22 @@ class OpenReqManager(models.Manager):
             elif pr == 0:
                 pr = None
             newargs['priority'] = pr
-            # Shift priorities if req'd
-            self.shiftpri(client, pr)
 
         # Check date_tgt if given
         if date_tgt:
             newargs['date_tgt'] = checkdatetgt(date_tgt)
 
-        # Create instance, validate fields, and save
-        oreq = OpenReq(**newargs)
-        oreq.full_clean()
-        oreq.save()
+        # Shift priorities if req'd, then create instance, validate fields,
+        # save, and record change, all together
+        with transaction.atomic():
+            self.shiftpri(client, pr)
+            oreq = OpenReq(**newargs)
+            oreq.full_clean()
+            oreq.save()
+            evdata = oreq.jsondict()
+            evdata['req'] = oreq.req.jsondict(EVENT_REQ_FIELDS)
+            ChangeEvent.objects.record('opened', client_id=oreq.client_id, req_id=oreq.req_id, data=evdata)
+            OpenStat.objects.bump(client_id=oreq.client_id, prod_area=oreq.req.prod_area)
         return oreq
 
     def newreq(self, user, client, priority=None, date_tgt=None, **newreq_args):
@@ -541,6 +778,18 @@ class OpenReqManager(models.Manager):
         # been raised by the above funcs)
         return oreq
 
+    def due_before(self, date):
+        '''Returns QuerySet of open requests with target dates before datetime
+        date (including any already overdue), earliest first.
+        '''
+        return self.filter(date_tgt__lt=date).order_by('date_tgt', 'id')
+
+    def overdue(self, now=None):
+        '''Returns QuerySet of open requests past their target dates as of
+        datetime now (default present), earliest first.
+        '''
+        return self.due_before(now or approxnow())
+
 # Open requests
 class OpenReq(models.Model):
     """Open requests"""
@@ -559,19 +808,22 @@ class OpenReq(models.Model):
     req = models.ForeignKey(FeatureReq, on_delete=models.CASCADE, verbose_name='Request', related_name='open_list')
     # Client's priority (must be unique or null (uniqueness not db constraint))
     priority = models.SmallIntegerField('Priority', blank=True, null=True, default=None)
-    # Target date (not strictly required)
-    date_tgt = models.DateTimeField('Target date', blank=True, null=True, default=None)
+    # Target date (not strictly required; indexed for deadline queries)
+    date_tgt = models.DateTimeField('Target date', blank=True, null=True, default=None, db_index=True)
     # Open date/time
     opened_at = models.DateTimeField('Opened at', default=approxnow, editable=False, blank=True)
     # Opened by user (stored as username string instead of foreign key (for archival purposes))
     opened_by = models.CharField('Opened by', max_length=30, blank=False, editable=False)
+    # Row version (see OpenReqManager.updatereq())
+    version = models.PositiveIntegerField('Version', default=1, editable=False)
 
     objects = OpenReqManager()
 
     fields = OrderedDict([
         ('client_id', str), ('req_id', str), ('priority', None),
-        ('date_tgt', approxdatefmt), ('opened_at', approxdatefmt), ('opened_by', None)
+        ('date_tgt', approxdatefmt), ('opened_at', approxdatefmt), ('opened_by', None), ('version', None)
     ])
+    optfields = ('version',)
 
     # Will call tojsondict() with self
     jsondict = tojsondict
@@ -683,19 +935,27 @@ class ClosedReqManager(models.Manager):
                 closeargs = newargs.copy()
                 # Add in OpenReq values (this will add req_id and client_id)
                 closeargs.update(oreq)
-                # Strip out primary key if present
-                try:
-                    del closeargs['id']
-                except KeyError:
-                    pass
+                # Strip out primary key and version if present
+                closeargs.pop('id', None)
+                closeargs.pop('version', None)
                 # Create new ClosedReq instance and validate (will bulk create)
                 creq = ClosedReq(**closeargs)
                 creq.full_clean()
                 tocreate.append(creq)
             # Insert them all at once
             ClosedReq.objects.bulk_create(tocreate)
-            # Now delete the OpenReq(s)
-            openreqs.delete()
+            # Fetch request fields for the events in one query
+            reqs = FeatureReq.objects.only(*EVENT_REQ_FIELDS).in_bulk({ creq.req_id for creq in tocreate })
+            # Now delete the OpenReq(s) (the closed events cover them)
+            with ChangeEvent.objects.suppress('open_deleted'), \
+                openareas({ req.id: req.prod_area for req in reqs.values() }):
+                openreqs.delete()
+            # Record changes
+            for creq in tocreate:
+                evdata = creq.jsondict()
+                evdata['req'] = reqs[creq.req_id].jsondict(EVENT_REQ_FIELDS)
+                ChangeEvent.objects.record('closed', client_id=creq.client_id, req_id=creq.req_id, data=evdata)
+                rollupclosed(creq)
 
         # And we're done!
         return True
@@ -722,7 +982,7 @@ class ClosedReq(models.Model):
     opened_at = models.DateTimeField('Opened at', blank=False, editable=False)
     opened_by = models.CharField('Opened by', max_length=30, blank=False, editable=False)
     # Closed by user (stored as username string instead of foreign key (for archival purposes))
-    closed_at = models.DateTimeField('Closed at', default=approxnow, editable=False, blank=True)
+    closed_at = models.DateTimeField('Closed at', default=approxnow, editable=False, blank=True, db_index=True)
     closed_by = models.CharField('Closed by', max_length=30, blank=False, editable=False)
     # Closed status
     status = models.CharField('Closed as', max_length=1, default='C', choices=STATUS_CHOICES)
@@ -743,3 +1003,341 @@ class ClosedReq(models.Model):
     def __str__(self):
         return str(self.client) + ": " + str(self.req)
 
+
+
+## Archive
+# Closed requests past a cutoff (and optionally feature requests with
+# nothing left open or closed in the main database) can be moved to a
+# separate SQLite database, attached to each connection under the schema
+# name 'archive' (see archive.py). These unmanaged models map the archived
+# tables, with the same columns and serialization as the originals. Foreign
+# keys become plain ids, since the rows referenced may be in either database.
+
+ARCHIVE_SCHEMA = 'archive'
+
+def archivetable(table):
+    '''Returns db_table value for table in the archive schema'''
+    # Quoted inside-out, so Django emits "archive"."table"
+    return '{0}"."{1}'.format(ARCHIVE_SCHEMA, table)
+
+# Archived feature requests
+class ArchivedFeatureReq(models.Model):
+    """Archived feature requests"""
+
+    class Meta:
+        verbose_name = 'archived request'
+        verbose_name_plural = 'archived requests'
+        db_table = archivetable('featreqs')
+        managed = False
+
+    id = BinaryUUIDField('Request ID', primary_key=True, editable=False)
+    title = models.CharField('Summary', max_length=128)
+    desc = CompressedTextField('Description')
+    ref_url = models.URLField('Reference URL', max_length=254, blank=True, default='')
+    prod_area = models.CharField('Product area', max_length=2, blank=False, choices=AREA_CHOICES)
+    date_cr = models.DateTimeField('Created at', editable=False)
+    date_up = models.DateTimeField('Updated at', editable=False)
+    user_cr = models.CharField('Created by', max_length=30, editable=False)
+    user_up = models.CharField('Updated by', max_length=30, editable=False)
+    version = models.PositiveIntegerField('Version', default=1, editable=False)
+
+    fields = FeatureReq.fields
+    optfields = FeatureReq.optfields
+
+    # Will call tojsondict() with self
+    jsondict = tojsondict
+
+    def __str__(self):
+        return str(self.title)
+
+# Archived closed requests
+class ArchivedClosedReq(models.Model):
+    """Archived closed requests"""
+
+    class Meta:
+        verbose_name = 'archived closed request'
+        verbose_name_plural = 'archived closed requests'
+        db_table = archivetable('closedreqs')
+        managed = False
+
+    # Same id as when it was in the main database
+    id = models.IntegerField('ID', primary_key=True)
+    client_id = BinaryUUIDField('Client ID', editable=False)
+    req_id = BinaryUUIDField('Request ID', editable=False)
+    priority = models.SmallIntegerField('Priority', blank=True, null=True, default=None)
+    date_tgt = models.DateTimeField('Target date', blank=True, null=True, default=None)
+    opened_at = models.DateTimeField('Opened at', editable=False)
+    opened_by = models.CharField('Opened by', max_length=30, editable=False)
+    closed_at = models.DateTimeField('Closed at', editable=False)
+    closed_by = models.CharField('Closed by', max_length=30, editable=False)
+    status = models.CharField('Closed as', max_length=1, choices=STATUS_CHOICES)
+    reason = models.CharField('Details', max_length=128, blank=True, default='')
+
+    fields = ClosedReq.fields
+
+    # Will call tojsondict() with self
+    jsondict = tojsondict
+
+    def __str__(self):
+        return str(self.client_id) + ": " + str(self.req_id)
+
+
+## Rollups
+# Running counts behind /featreq/stats/, kept current by the write paths
+# above (in the same transactions) and the delete handlers below, so stats
+# come from a few small tables regardless of history size. Archiving moves
+# rows without touching these (archived history still counts). Rows are
+# keyed by plain ids rather than foreign keys, so deletes never cascade
+# into them. If they ever drift, `manage.py featreq_rollups` rebuilds them.
+
+class RollupManager(models.Manager):
+    """Model manager for rollup tables"""
+
+    def bump(self, delta=1, **keys):
+        '''Adds delta to count of row matching keys, creating it if needed.
+        If another writer creates the row first, adds to theirs instead.
+        '''
+        if self.filter(**keys).update(count=F('count') + delta):
+            return
+        try:
+            # Savepoint, so losing the race doesn't break the caller's transaction
+            with transaction.atomic():
+                self.create(count=delta, **keys)
+        except IntegrityError:
+            self.filter(**keys).update(count=F('count') + delta)
+
+def closemonth(closed_at):
+    '''Returns month key (yyyy-mm) for closed_at datetime'''
+    return closed_at.strftime('%Y-%m')
+
+def closedays(opened_at, closed_at):
+    '''Returns whole days between opened_at and closed_at'''
+    return max((closed_at - opened_at).days, 0)
+
+# Product areas by request id, per thread, for open requests about to be
+# deleted (see openareas()), so the OpenReq delete receiver doesn't have to
+# look up each request in turn
+_openareas = threading.local()
+
+@contextmanager
+def openareas(areas):
+    '''Context manager which supplies product areas (dict of req_id to
+    prod_area) for open requests deleted in the current thread.
+    '''
+    prev = getattr(_openareas, 'areas', {})
+    _openareas.areas = dict(prev)
+    _openareas.areas.update(areas)
+    try:
+        yield
+    finally:
+        _openareas.areas = prev
+
+def rollupclosed(creq, delta=1):
+    '''Adds delta (1 when closed, -1 when deleted) to rollups of ClosedReq
+    creq.
+    '''
+    ClosedStat.objects.bump(delta, client_id=creq.client_id,
+        month=closemonth(creq.closed_at), status=creq.status)
+    CloseTimeStat.objects.bump(delta, days=closedays(creq.opened_at, creq.closed_at))
+
+class OpenStat(models.Model):
+    """Open request counts, by client and product area"""
+
+    class Meta:
+        db_table = 'stats_open'
+        unique_together = ['client_id', 'prod_area']
+
+    client_id = BinaryUUIDField('Client ID')
+    prod_area = models.CharField('Product area', max_length=2, choices=AREA_CHOICES)
+    count = models.IntegerField('Count', default=0)
+
+    objects = RollupManager()
+
+class ClosedStat(models.Model):
+    """Closed request counts, by client, month closed, and status"""
+
+    class Meta:
+        db_table = 'stats_closed'
+        unique_together = ['client_id', 'month', 'status']
+
+    client_id = BinaryUUIDField('Client ID')
+    month = models.CharField('Month closed', max_length=7)
+    status = models.CharField('Closed as', max_length=1, choices=STATUS_CHOICES)
+    count = models.IntegerField('Count', default=0)
+
+    objects = RollupManager()
+
+class CloseTimeStat(models.Model):
+    """Closed request counts, by whole days from opening to closing"""
+
+    class Meta:
+        db_table = 'stats_closetime'
+
+    days = models.IntegerField('Days to close', primary_key=True)
+    count = models.IntegerField('Count', default=0)
+
+    objects = RollupManager()
+
+
+## Scan marks
+# High-water marks of background scans (see deadlines.py), so each run
+# picks up where the last one left off instead of rescanning
+
+class ScanMark(models.Model):
+    """Progress of a background scan, by name"""
+
+    class Meta:
+        db_table = 'scanmarks'
+
+    name = models.CharField('Scan', max_length=32, primary_key=True)
+    # Scanned up to this date/time, and (among rows at exactly that
+    # date/time) this row id
+    mark = models.DateTimeField('Scanned to')
+    last_id = models.IntegerField('Last row ID', default=0)
+
+
+## Change events
+# Every write path in the managers above records a compact event here, in
+# the same transaction as the change itself. The autoincrement primary key
+# gives a monotonic sequence, used as the event id for change feeds.
+
+# Event kinds currently suppressed, per thread (see ChangeEventManager.suppress())
+_suppressed = threading.local()
+
+def _eventdata(data):
+    '''Returns event payload data as compact JSON string (empty if None)'''
+    if data is None:
+        return ''
+    return jsondumps(data, pretty=False).decode('utf-8').rstrip('\n')
+
+# Change event manager
+class ChangeEventManager(models.Manager):
+    """Model manager for ChangeEvent"""
+
+    @contextmanager
+    def suppress(self, *kinds):
+        '''Context manager which skips recording events of given kinds in
+        the current thread, for writes already covered by another event.
+        '''
+        prev = getattr(_suppressed, 'kinds', frozenset())
+        _suppressed.kinds = prev.union(kinds)
+        try:
+            yield
+        finally:
+            _suppressed.kinds = prev
+
+    def record(self, kind, client_id=None, req_id=None, data=None):
+        '''Records change event of given kind, with optional ids of the
+        client and/or request affected and a JSON-compatible data payload.
+        Should be called inside the transaction making the change.
+
+        Returns new ChangeEvent, or None if kind is currently suppressed.
+        '''
+        if kind in getattr(_suppressed, 'kinds', ()):
+            return None
+        ev = ChangeEvent(kind=kind, client_id=client_id, req_id=req_id, data=_eventdata(data), date=approxnow())
+        ev.save()
+        return ev
+
+    def recordmany(self, events):
+        '''Records change events given as iterable of (kind, client_id,
+        req_id, data) tuples with one bulk insert, for writes made in bulk.
+        Should be called inside the transaction making the changes.
+
+        Returns number of events recorded (not counting suppressed kinds).
+        '''
+        suppressed = getattr(_suppressed, 'kinds', ())
+        dt = approxnow()
+        evlist = [ ChangeEvent(kind=kind, client_id=client_id, req_id=req_id, data=_eventdata(data), date=dt)
+            for kind, client_id, req_id, data in events if kind not in suppressed ]
+        self.bulk_create(evlist)
+        return len(evlist)
+
+    def since(self, last_id=0, limit=None):
+        '''Returns QuerySet of events after event id last_id, in order,
+        limited to limit events if given.
+        '''
+        qset = self.filter(id__gt=last_id).order_by('id')
+        if limit:
+            qset = qset[:limit]
+        return qset
+
+    def lastid(self):
+        '''Returns latest event id, or 0 if no events recorded'''
+        last = self.order_by('-id').values_list('id', flat=True).first()
+        return last or 0
+
+# Change events
+class ChangeEvent(models.Model):
+    """Change events"""
+
+    class Meta:
+        verbose_name = 'change event'
+        verbose_name_plural = 'change events'
+        db_table = 'changes'
+
+    # Event type
+    kind = models.CharField('Event', max_length=16, choices=EVENT_CHOICES, editable=False)
+    # Client and/or request affected (not foreign keys, so events outlive them)
+    client_id = BinaryUUIDField('Client ID', blank=True, null=True, default=None, editable=False)
+    req_id = BinaryUUIDField('Request ID', blank=True, null=True, default=None, editable=False)
+    # Event payload, as compact JSON
+    data = models.TextField('Payload', blank=True, default='', editable=False)
+    # Date/time recorded
+    date = models.DateTimeField('Recorded at', default=approxnow, editable=False, blank=True)
+
+    objects = ChangeEventManager()
+
+    def __str__(self):
+        return '{0} {1}'.format(self.id, self.kind)
+
+
+# Deletes (including cascades from deleting a client or request) bypass the
+# managers, so they're recorded from the post_delete signal, which Django
+# sends for every object removed, inside the deleting transaction
+@receiver(post_delete, sender=FeatureReq)
+def _featreq_deleted(sender, instance, **kwargs):
+    ChangeEvent.objects.record('req_deleted', req_id=instance.id,
+        data=ordereddict([('id', str(instance.id))]))
+    _openareas.areas = {}
+
+@receiver(post_delete, sender=ClientInfo)
+def _client_deleted(sender, instance, **kwargs):
+    ChangeEvent.objects.record('client_deleted', client_id=instance.id,
+        data=ordereddict([('id', str(instance.id))]))
+    _openareas.areas = {}
+
+# Django sends every pre_delete of a cascade before deleting anything, and
+# removes open requests before their client or request, so the product
+# areas of a cascade's open requests are gathered up front here (one query
+# per client or request, rather than one per open request), and dropped
+# once the parent is gone
+@receiver(pre_delete, sender=FeatureReq)
+def _featreq_deleting(sender, instance, **kwargs):
+    areas = getattr(_openareas, 'areas', {})
+    areas[instance.id] = instance.prod_area
+    _openareas.areas = areas
+
+@receiver(pre_delete, sender=ClientInfo)
+def _client_deleting(sender, instance, **kwargs):
+    areas = getattr(_openareas, 'areas', {})
+    areas.update(OpenReq.objects.filter(client_id=instance.id).values_list('req_id', 'req__prod_area'))
+    _openareas.areas = areas
+
+@receiver(post_delete, sender=OpenReq)
+def _openreq_deleted(sender, instance, **kwargs):
+    ChangeEvent.objects.record('open_deleted', client_id=instance.client_id, req_id=instance.req_id,
+        data=ordereddict([('client_id', str(instance.client_id)), ('req_id', str(instance.req_id))]))
+    # Closing deletes too, so open counts are always decremented here
+    prod_area = getattr(_openareas, 'areas', {}).get(instance.req_id)
+    if prod_area is None:
+        prod_area = FeatureReq.objects.filter(id=instance.req_id).values_list('prod_area', flat=True).first()
+    if prod_area is not None:
+        OpenStat.objects.bump(-1, client_id=instance.client_id, prod_area=prod_area)
+
+@receiver(post_delete, sender=ClosedReq)
+def _closedreq_deleted(sender, instance, **kwargs):
+    ChangeEvent.objects.record('closed_deleted', client_id=instance.client_id, req_id=instance.req_id,
+        data=ordereddict([('client_id', str(instance.client_id)), ('req_id', str(instance.req_id)),
+            ('closed_at', approxdatefmt(instance.closed_at))]))
+    rollupclosed(instance, -1)
@@ -0,0 +1,109 @@
+import datetime, heapq
+from django.db import transaction
+from django.db.models import F
+from .models import ClientInfo
+from .utils import validuuid, DATETIMEFMT
+
+## Next-up queue
+# Prioritized open requests (those without a priority aren't queued), in
+# order of priority, then target date (earliest first, none last), then
+# client and request id, so the order is total and stable for paging.
+#
+# Each client's requests are read with a range scan of the (client,
+# priority) index, taking only as many rows as a page can use, and the
+# per-client runs are merged with a k-way heap merge. Nothing reads more
+# than (clients * page size) rows, however many requests are open.
+
+# Per-client requests (top-k) and merged queue page sizes
+NEXTUP_K = 5
+NEXTUP_K_MAX = 100
+QUEUE_LIMIT = 50
+QUEUE_LIMIT_MAX = 500
+
+# Stand-in for missing target dates in sort keys
+_NO_TGT = datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)
+
+def queuekey(oreq):
+    '''Returns sort key of open request oreq in the queue'''
+    return (oreq.priority, oreq.date_tgt is None, oreq.date_tgt or _NO_TGT, oreq.client_id, oreq.req_id)
+
+def fmtcursor(key):
+    '''Returns cursor string for queue key'''
+    priority, notgt, date_tgt, client_id, req_id = key
+    return '{0},{1},{2},{3}'.format(
+        priority, '' if notgt else date_tgt.strftime(DATETIMEFMT), client_id.hex, req_id.hex)
+
+def parsecursor(cursor):
+    '''Returns queue key from cursor string. Raises ValueError if invalid.'''
+    try:
+        priority, date_tgt, client_id, req_id = cursor.split(',')
+        priority = int(priority)
+        date_tgt = datetime.datetime.strptime(date_tgt, DATETIMEFMT).replace(
+            tzinfo=datetime.timezone.utc) if date_tgt else None
+    except ValueError:
+        raise ValueError('Invalid cursor: {0}'.format(cursor))
+    client_id, req_id = validuuid(client_id, None), validuuid(req_id, None)
+    if client_id is None or req_id is None:
+        raise ValueError('Invalid cursor: {0}'.format(cursor))
+    return (priority, date_tgt is None, date_tgt or _NO_TGT, client_id, req_id)
+
+def _ranked(qset):
+    '''Returns qset of prioritized open requests in queue order'''
+    # Ties on priority (within a client) are rare, so sorting the rest of
+    # the key only touches a few rows past the index order
+    return qset.filter(priority__isnull=False).order_by(
+        'priority', F('date_tgt').asc(nulls_last=True), 'req_id')
+
+def clientrun(qset, client_id, count, after=None):
+    '''Returns list of first count open requests in qset for client_id, in
+    queue order, after queue key after if given.
+    '''
+    qset = _ranked(qset.filter(client_id=client_id))
+    if after is None:
+        return list(qset[:count])
+    # Requests at the cursor's priority may fall either side of it
+    tied = [ oreq for oreq in qset.filter(priority=after[0]) if queuekey(oreq) > after ]
+    if len(tied) >= count:
+        return tied[:count]
+    return tied + list(qset.filter(priority__gt=after[0])[:count - len(tied)])
+
+def _clientids(client_ids):
+    if client_ids is None:
+        return list(ClientInfo.objects.order_by('id').values_list('id', flat=True))
+    return list(client_ids)
+
+def topk(qset, k=NEXTUP_K, client_ids=None):
+    '''Returns list of (client id, list of first k open requests) tuples,
+    for each client in client_ids (default all), from qset of OpenReq.
+    '''
+    with transaction.atomic():
+        return [ (client_id, clientrun(qset, client_id, k)) for client_id in _clientids(client_ids) ]
+
+def _merge(runs):
+    '''Generator yielding open requests from runs (lists in queue order),
+    merged in queue order.
+    '''
+    # heapq.merge() only takes a key function from Python 3.5, so merge
+    # (key, index, item) tuples instead
+    decorated = [ [ (queuekey(oreq), idx, oreq) for oreq in run ] for idx, run in enumerate(runs) ]
+    for key, idx, oreq in heapq.merge(*decorated):
+        yield oreq
+
+def queuepage(qset, limit=QUEUE_LIMIT, after=None, client_ids=None):
+    '''Returns tuple of (list of next limit open requests in the merged
+    queue after queue key after, cursor for the following page or None if
+    this is the last), from qset of OpenReq, for clients in client_ids
+    (default all).
+    '''
+    with transaction.atomic():
+        # One more than the page, to tell if there's another
+        runs = [ clientrun(qset, client_id, limit + 1, after) for client_id in _clientids(client_ids) ]
+    page = []
+    for oreq in _merge(runs):
+        page.append(oreq)
+        if len(page) > limit:
+            break
+    if len(page) > limit:
+        page = page[:limit]
+        return page, fmtcursor(queuekey(page[-1]))
+    return page, None
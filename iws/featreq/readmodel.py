@@ -0,0 +1,283 @@
+import threading, time
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Sum
+from .models import FeatureReq, OpenReq, ChangeEvent
+from .utils import tojsondict, qset_byids
+
+## Open request read model
+# Open requests are a small, hot set next to the closed history, so with
+# IWS_OPEN_READMODEL set, each process keeps them in memory (with the
+# fields of their feature requests, bar descriptions), indexed by client
+# and by request, and the open list views read from there instead of
+# running a query per request.
+#
+# The change event log is the model's change sequence: before each read,
+# the latest event id is checked (one indexed lookup), and if anything has
+# been recorded since, the open requests of the clients named in those
+# events, and the requests named, are read again. Past READ_MODEL_EVENTS
+# pending events, or if the log goes backwards, the whole model is reloaded
+# instead. Writes which don't record events (featreq_import --no-events,
+# the admin, raw SQL) are caught by a consistency check every
+# IWS_OPEN_READMODEL_CHECK seconds, which compares row counts and version
+# totals against the database and reloads on any difference.
+
+READ_MODEL = getattr(settings, 'IWS_OPEN_READMODEL', False)
+READ_MODEL_CHECK = getattr(settings, 'IWS_OPEN_READMODEL_CHECK', 60)
+# Pending events applied incrementally (any more and it's reloaded)
+READ_MODEL_EVENTS = 1000
+# Max ids per IN query
+READ_MODEL_CHUNK = 500
+
+# FeatureReq fields held (descriptions stay in the database; lists asking
+# for them are read from there)
+REQ_FIELDS = tuple( fn for fn in FeatureReq.fields if fn != 'desc' )
+OPEN_COLUMNS = ('id',) + tuple(OpenReq.fields)
+
+# Events which change open requests (read again by client), and requests
+# (read again by id)
+OPEN_EVENTS = frozenset(['opened', 'open_updated', 'reprioritized', 'closed', 'open_deleted', 'client_deleted'])
+REQ_EVENTS = frozenset(['req_updated', 'req_deleted'])
+
+
+class ReqRecord(object):
+    """Feature request fields (as FeatureReq, less description)"""
+
+    __slots__ = REQ_FIELDS
+    fields = FeatureReq.fields
+    optfields = FeatureReq.optfields
+
+    jsondict = tojsondict
+
+    def __init__(self, row):
+        self.update(row)
+
+    def update(self, row):
+        '''Sets fields from row (tuple of values in REQ_FIELDS order)'''
+        for fname, value in zip(REQ_FIELDS, row):
+            setattr(self, fname, value)
+
+
+class OpenRecord(object):
+    """Open request (as OpenReq, with req as a ReqRecord)"""
+
+    __slots__ = OPEN_COLUMNS + ('req',)
+    fields = OpenReq.fields
+    optfields = OpenReq.optfields
+
+    jsondict = tojsondict
+
+    def __init__(self, row, req):
+        for fname, value in zip(OPEN_COLUMNS, row):
+            setattr(self, fname, value)
+        self.req = req
+
+def _lastid():
+    '''Returns latest change event id (as ChangeEvent.objects.lastid(), but
+    without the ORM, since it's run before every read)
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT MAX(id) FROM {0}'.format(connection.ops.quote_name(ChangeEvent._meta.db_table)))
+        return cursor.fetchone()[0] or 0
+
+# Orders as views.openqset() reads them from the database
+def _clientorder(oreq):
+    # Unprioritized first (SQLite sorts NULLs first), then by priority
+    return (oreq.priority is not None, oreq.priority or 0, oreq.id)
+
+def _idorder(oreq):
+    return oreq.id
+
+def _dueorder(oreq):
+    return (oreq.date_tgt, oreq.id)
+
+
+class OpenModel(object):
+    """In-memory open requests, kept up to date from the change event log"""
+
+    def __init__(self, check=READ_MODEL_CHECK):
+        self.check = check
+        self.lock = threading.RLock()
+        self.lastid = None
+        self.checked = None
+        # Client id -> list of OpenRecord (in _clientorder()), request id ->
+        # list of OpenRecord, request id -> ReqRecord
+        self.byclient = {}
+        self.byreq = {}
+        self.reqs = {}
+        # Everything in _idorder() (built on first use after each change)
+        self.ordered = None
+        # Totals, for benchmarks and monitoring
+        self.loads = 0
+        self.refreshes = 0
+
+    def signature(self):
+        '''Returns tuple of (open request count, max open request id, sum of
+        open request versions, sum of held request versions) from memory.
+        '''
+        records = [ oreq for oreqs in self.byclient.values() for oreq in oreqs ]
+        return (len(records), max((oreq.id for oreq in records), default=None),
+            sum(oreq.version for oreq in records), sum(req.version for req in self.reqs.values()))
+
+    def dbsignature(self):
+        '''Returns signature (as signature()) from the database'''
+        agg = OpenReq.objects.aggregate(count=Count('id'), maxid=Max('id'), versions=Sum('version'))
+        reqversions = FeatureReq.objects.filter(
+            id__in=OpenReq.objects.values('req_id')).aggregate(versions=Sum('version'))['versions']
+        return (agg['count'], agg['maxid'], agg['versions'] or 0, reqversions or 0)
+
+    def load(self):
+        '''Reads all open requests (and their feature requests) from the
+        database, replacing anything held.
+        '''
+        with self.lock, transaction.atomic():
+            lastid = ChangeEvent.objects.lastid()
+            reqs = { row[0]: ReqRecord(row) for row in FeatureReq.objects.filter(
+                id__in=OpenReq.objects.values('req_id')).values_list(*REQ_FIELDS).iterator() }
+            byclient, byreq = {}, {}
+            for row in OpenReq.objects.values_list(*OPEN_COLUMNS).iterator():
+                oreq = OpenRecord(row, reqs[row[2]])
+                byclient.setdefault(oreq.client_id, []).append(oreq)
+                byreq.setdefault(oreq.req_id, []).append(oreq)
+            for oreqs in byclient.values():
+                oreqs.sort(key=_clientorder)
+            self.byclient, self.byreq, self.reqs = byclient, byreq, reqs
+            self.ordered = None
+            self.lastid = lastid
+            self.checked = time.monotonic()
+            self.loads += 1
+
+    def refresh(self, client_ids, req_ids):
+        '''Reads open requests of clients in client_ids, and requests in
+        req_ids, from the database again.
+        '''
+        with self.lock:
+            rows = []
+            if client_ids:
+                for qset in qset_byids(OpenReq.objects.values_list(*OPEN_COLUMNS), client_ids,
+                        'client_id', READ_MODEL_CHUNK):
+                    rows.extend(qset)
+
+            # Drop the clients' open requests, and with them any requests
+            # nothing else open refers to
+            req_ids = set(req_ids)
+            for client_id in client_ids:
+                for oreq in self.byclient.pop(client_id, ()):
+                    others = self.byreq[oreq.req_id]
+                    others.remove(oreq)
+                    if not others:
+                        del self.byreq[oreq.req_id]
+                        req_ids.add(oreq.req_id)
+
+            # Requests still (or newly) open are read again, and updated in
+            # place, so open requests elsewhere still share them
+            openids = { row[2] for row in rows }
+            req_ids.update(rid for rid in openids if rid not in self.reqs)
+            wanted = [ rid for rid in req_ids if rid in openids or rid in self.byreq ]
+            found = set()
+            for qset in qset_byids(FeatureReq.objects.values_list(*REQ_FIELDS), wanted, chunk=READ_MODEL_CHUNK):
+                for row in qset:
+                    found.add(row[0])
+                    if row[0] in self.reqs:
+                        self.reqs[row[0]].update(row)
+                    else:
+                        self.reqs[row[0]] = ReqRecord(row)
+            for rid in req_ids - found:
+                self.reqs.pop(rid, None)
+
+            for client_id in client_ids:
+                self.byclient[client_id] = []
+            for row in rows:
+                req = self.reqs.get(row[2])
+                if req is None:
+                    # Request deleted since (its events are still to come)
+                    continue
+                oreq = OpenRecord(row, req)
+                self.byclient[oreq.client_id].append(oreq)
+                self.byreq.setdefault(oreq.req_id, []).append(oreq)
+            for client_id in client_ids:
+                if self.byclient[client_id]:
+                    self.byclient[client_id].sort(key=_clientorder)
+                else:
+                    del self.byclient[client_id]
+            self.ordered = None
+            self.refreshes += 1
+
+    def sync(self):
+        '''Brings the model up to date with the change event log, reloading
+        it if it's not loaded, too far behind, or (every check seconds) found
+        inconsistent with the database.
+        '''
+        with self.lock:
+            if self.lastid is None:
+                return self.load()
+            if time.monotonic() - self.checked >= self.check:
+                self.checked = time.monotonic()
+                if self.signature() != self.dbsignature():
+                    return self.load()
+
+            lastid = _lastid()
+            if lastid == self.lastid:
+                return
+            if lastid < self.lastid:
+                # Log replaced or truncated
+                return self.load()
+            events = list(ChangeEvent.objects.since(self.lastid, READ_MODEL_EVENTS + 1).values_list(
+                'id', 'kind', 'client_id', 'req_id'))
+            if len(events) > READ_MODEL_EVENTS:
+                return self.load()
+
+            client_ids, req_ids = set(), set()
+            for evid, kind, client_id, req_id in events:
+                if kind in OPEN_EVENTS and client_id is not None:
+                    client_ids.add(client_id)
+                if kind in REQ_EVENTS and req_id is not None:
+                    req_ids.add(req_id)
+            if client_ids or req_ids:
+                self.refresh(client_ids, req_ids)
+            # Only up to the events read, in case more have landed since
+            self.lastid = events[-1][0] if events else lastid
+
+    def openlist(self, client_id=None, before=None):
+        '''Returns list of OpenRecord, for client client_id (default all),
+        with target dates before datetime before if given.
+
+        Ordered by target date if before is given, or otherwise by priority
+        (unprioritized first) for a client, or by id for all, as
+        views.openqset() reads them.
+        '''
+        with self.lock:
+            self.sync()
+            if client_id is not None:
+                oreqs = self.byclient.get(client_id, ())
+            else:
+                if self.ordered is None:
+                    self.ordered = sorted((oreq for oreqs in self.byclient.values() for oreq in oreqs),
+                        key=_idorder)
+                oreqs = self.ordered
+        if before is not None:
+            return sorted((oreq for oreq in oreqs if oreq.date_tgt is not None and oreq.date_tgt < before),
+                key=_dueorder)
+        return list(oreqs)
+
+
+# Per-process model (created on first use)
+_openmodel = None
+_openlock = threading.Lock()
+
+def getopenmodel():
+    '''Returns this process's open request read model'''
+    global _openmodel
+    with _openlock:
+        if _openmodel is None:
+            _openmodel = OpenModel()
+        return _openmodel
+
+def openrecords(client_id=None, before=None, reqfields=()):
+    '''Returns list of open requests from the read model (as openlist()),
+    or None if it's disabled, or reqfields (feature request fields wanted)
+    includes any it doesn't hold.
+    '''
+    if not READ_MODEL or any(fn not in REQ_FIELDS for fn in reqfields):
+        return None
+    return getopenmodel().openlist(client_id, before)
@@ -0,0 +1,111 @@
+from collections import namedtuple
+from .utils import tojsondict, fieldlookups, defaultfields, qset_byids, IN_QUERY_CHUNK
+
+## Row records
+# List views only read model instances' fields to pass them to jsondict(),
+# but each instance still carries its _state, field caches and so on, and
+# select_related() builds a second instance for the related object. Records
+# are namedtuples of the values_list() rows instead, with the model's fields
+# and jsondict(), so they serialize exactly as the instances would (field
+# values come through the same from_db_value() conversions).
+#
+# Link rows (OpenReq, ClosedReq) can carry a record for the related request
+# as an extra attribute; rows naming the same request share one record.
+# Related objects can also be read separately, once each, by id.
+
+# Record classes, by (model, columns, related attribute)
+_recordtypes = {}
+
+def recordtype(model, columns, relname=None):
+    '''Returns record class (a namedtuple) for rows of model with values
+    for field names columns, and related record attribute relname if given.
+    '''
+    key = (model, tuple(columns), relname)
+    try:
+        return _recordtypes[key]
+    except KeyError:
+        pass
+    names = tuple(columns) + ((relname,) if relname else ())
+    base = namedtuple(model.__name__ + 'Row', names)
+    rtype = type(model.__name__ + 'Record', (base,), {
+        '__slots__': (),
+        'fields': model.fields,
+        'optfields': getattr(model, 'optfields', ()),
+        'jsondict': tojsondict,
+    })
+    _recordtypes[key] = rtype
+    return rtype
+
+def linkrecords(qset, relname=None, relfields=(), withid=False):
+    '''Generator yielding records of link model (OpenReq, ClosedReq or
+    ArchivedClosedReq) rows of qset, with all of the model's fields (and
+    the row id, if withid is True), plus (if relname is given) a record of
+    the related object's fields relfields as attribute relname, read in the
+    same query.
+    '''
+    model = qset.model
+    columns = (('id',) if withid else ()) + tuple(model.fields)
+    if not relname:
+        make = recordtype(model, columns)._make
+        for row in qset.values_list(*columns).iterator():
+            yield make(row)
+        return
+
+    relfields = tuple(relfields)
+    relmodel = model._meta.get_field(relname).related_model
+    make = recordtype(model, columns, relname)._make
+    makerel = recordtype(relmodel, relfields)._make
+    keyidx = columns.index(relname + '_id')
+    ncols = len(columns)
+    related = {}
+    qcols = columns + tuple(fieldlookups(relmodel, relfields, relname + '__'))
+    for row in qset.values_list(*qcols).iterator():
+        key = row[keyidx]
+        try:
+            rel = related[key]
+        except KeyError:
+            rel = related[key] = makerel(row[ncols:])
+        yield make(row[:ncols] + (rel,))
+
+def batchesbyid(qset, size=500, **kwargs):
+    '''Generator yielding lists of up to size link records of qset's rows
+    (as linkrecords(), with ids, given kwargs), in id order, each batch read
+    only when it's needed (by id range, so it's one indexed query however
+    far into the table it is).
+    '''
+    qset = qset.order_by('id')
+    lastid = None
+    while True:
+        page = qset if lastid is None else qset.filter(id__gt=lastid)
+        batch = list(linkrecords(page[:size], withid=True, **kwargs))
+        if batch:
+            yield batch
+        if len(batch) < size:
+            return
+        lastid = batch[-1].id
+
+def recorddicts(models, ids, fields=None, binary=False, chunk=IN_QUERY_CHUNK, withid=True):
+    '''Returns dict of id to JSON-compatible dict (with fields, or the
+    model's default fields if empty, including id unless withid is False)
+    for each of ids found, looked for in each of models in turn. Each id is
+    read once, with one query per model (per chunk ids) for those not yet
+    found.
+    '''
+    fields = list(fields or defaultfields(models[0]))
+    outfields = fields
+    if 'id' not in fields:
+        fields = ['id'] + fields
+        if withid:
+            outfields = fields
+    found = {}
+    pending = list(set(ids))
+    for model in models:
+        if not pending:
+            break
+        make = recordtype(model, fields)._make
+        for qset in qset_byids(model.objects.values_list(*fields), pending, chunk=chunk):
+            for row in qset.iterator():
+                rec = make(row)
+                found[rec.id] = rec.jsondict(outfields, binary=binary)
+        pending = [ uid for uid in pending if uid not in found ]
+    return found
@@ -0,0 +1,120 @@
+from collections import Counter
+from django.db import transaction
+from django.db.models import Count
+from .models import OpenReq, ClosedReq, ArchivedClosedReq, OpenStat, ClosedStat, CloseTimeStat,\
+    closemonth, closedays, areabyshort, statusbyshort
+from .archive import archiveenabled
+from .utils import approxnow, ordereddict
+
+## Manager statistics
+# Read from the rollup tables (see models.OpenStat etc), except for overdue
+# counts, which depend on the current time and so are counted from the
+# open requests directly (bounded by what's open, not by history).
+
+def mediandays(counts):
+    '''Returns median of histogram counts (iterable of (days, count) tuples,
+    sorted by days), or None if empty.
+    '''
+    counts = [ (days, count) for days, count in counts if count > 0 ]
+    total = sum(count for days, count in counts)
+    if not total:
+        return None
+    # Zero-based positions of the middle value(s)
+    lower, upper = (total - 1) // 2, total // 2
+    lowval = upval = None
+    seen = 0
+    for days, count in counts:
+        seen += count
+        if lowval is None and seen > lower:
+            lowval = days
+        if seen > upper:
+            upval = days
+            break
+    return (lowval + upval) / 2
+
+def getstats(binary=False):
+    '''Returns dict of current statistics'''
+    fmtid = (lambda uid: uid.bytes) if binary else str
+
+    openlist = [ ordereddict([
+            ('client_id', fmtid(client_id)), ('prod_area', areabyshort(prod_area)), ('count', count)])
+        for client_id, prod_area, count in OpenStat.objects.filter(count__gt=0).order_by(
+            'client_id', 'prod_area').values_list('client_id', 'prod_area', 'count') ]
+
+    closedlist = [ ordereddict([
+            ('client_id', fmtid(client_id)), ('month', month), ('status', statusbyshort(status)),
+            ('count', count)])
+        for client_id, month, status, count in ClosedStat.objects.filter(count__gt=0).order_by(
+            'client_id', 'month', 'status').values_list('client_id', 'month', 'status', 'count') ]
+
+    overduelist = [ ordereddict([('client_id', fmtid(client_id)), ('count', count)])
+        for client_id, count in OpenReq.objects.filter(date_tgt__lt=approxnow()).order_by(
+            'client_id').values_list('client_id').annotate(Count('id')) ]
+
+    closetimes = list(CloseTimeStat.objects.order_by('days').values_list('days', 'count'))
+
+    return ordereddict([
+        ('open_count', sum(row['count'] for row in openlist)),
+        ('open_by_client', openlist),
+        ('closed_count', sum(row['count'] for row in closedlist)),
+        ('closed_by_month', closedlist),
+        ('overdue_count', sum(row['count'] for row in overduelist)),
+        ('overdue_by_client', overduelist),
+        ('median_days_to_close', mediandays(closetimes)),
+    ])
+
+def computerollups():
+    '''Returns tuple of Counters (open, closed, closetime) computed from
+    scratch, keyed as the rollup tables are.
+    '''
+    opencounts = Counter({ (client_id, prod_area): count
+        for client_id, prod_area, count in OpenReq.objects.values_list(
+            'client_id', 'req__prod_area').annotate(Count('id')).order_by() })
+
+    closedcounts, closetimes = Counter(), Counter()
+    sources = [ClosedReq]
+    if archiveenabled():
+        sources.append(ArchivedClosedReq)
+    for model in sources:
+        for client_id, opened_at, closed_at, status in model.objects.values_list(
+                'client_id', 'opened_at', 'closed_at', 'status').iterator():
+            closedcounts[(client_id, closemonth(closed_at), status)] += 1
+            closetimes[closedays(opened_at, closed_at)] += 1
+
+    return opencounts, closedcounts, closetimes
+
+def _drift(current, computed):
+    '''Returns number of keys whose counts differ between Counters'''
+    return sum(1 for key in set(current) | set(computed) if current[key] != computed[key])
+
+def rebuildrollups(check=False):
+    '''Recomputes rollup tables from open/closed requests (including
+    archived ones). If check is True, only compares.
+
+    Returns tuple of rows found drifted for (open, closed, closetime).
+    '''
+    with transaction.atomic():
+        opencounts, closedcounts, closetimes = computerollups()
+
+        current = (
+            Counter({ (cid, area): count for cid, area, count in
+                OpenStat.objects.values_list('client_id', 'prod_area', 'count') if count }),
+            Counter({ (cid, month, status): count for cid, month, status, count in
+                ClosedStat.objects.values_list('client_id', 'month', 'status', 'count') if count }),
+            Counter({ days: count for days, count in
+                CloseTimeStat.objects.values_list('days', 'count') if count }),
+        )
+        drift = tuple(_drift(cur, comp) for cur, comp in zip(current, (opencounts, closedcounts, closetimes)))
+
+        if not check:
+            OpenStat.objects.all().delete()
+            ClosedStat.objects.all().delete()
+            CloseTimeStat.objects.all().delete()
+            OpenStat.objects.bulk_create([ OpenStat(client_id=cid, prod_area=area, count=count)
+                for (cid, area), count in opencounts.items() ])
+            ClosedStat.objects.bulk_create([ ClosedStat(client_id=cid, month=month, status=status, count=count)
+                for (cid, month, status), count in closedcounts.items() ])
+            CloseTimeStat.objects.bulk_create([ CloseTimeStat(days=days, count=count)
+                for days, count in closetimes.items() ])
+
+    return drift
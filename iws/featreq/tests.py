@@ -1,3 +1,224 @@
-from django.test import TestCase
+import datetime, io, os, subprocess, sys, tempfile
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from benchmark import IMPORTS_BUDGET, IMPORTS_DEFERRED, importtimes
+from .models import FeatureReq, ClientInfo, OpenReq, ClosedReq, ChangeEvent
+from .analytics import closedmetrics
+from .codec import BINARY_CODECS, binarycontype
+from .deadlines import scanoverdue
+from .export import exportstream, parsetypes
+from .importer import importbatch, importlines
+from .management.commands.featreq_import import writecheckpoint
+from .utils import approxnow, DATETIMEFMT
 
-# Create your tests here.
+# Directory of manage.py and cli.py
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class CliImportTests(SimpleTestCase):
+    """Import time of the slim command entry point (see cli.py)"""
+
+    def importrun(self):
+        '''Runs cli.py featreq_export --help under -X importtime. Returns
+        tuple of (total ms, set of module names imported).
+        '''
+        proc = subprocess.run([sys.executable, '-X', 'importtime', 'cli.py', 'featreq_export', '--help'],
+            cwd=BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+        return importtimes(proc.stderr.decode())
+
+    def testdeferredimports(self):
+        total, modules = self.importrun()
+        loaded = [ name for name in IMPORTS_DEFERRED
+            if any(mod == name or mod.startswith(name + '.') for mod in modules) ]
+        self.assertEqual(loaded, [])
+
+    def testimportbudget(self):
+        # Best of a few runs, so a cold disk cache doesn't count
+        best = min(self.importrun()[0] for x in range(3))
+        self.assertLessEqual(best, IMPORTS_BUDGET)
+
+
+class AcceptTests(SimpleTestCase):
+    """Binary content type negotiation honours q-values"""
+
+    def setUp(self):
+        if 'application/msgpack' not in BINARY_CODECS or 'application/cbor' not in BINARY_CODECS:
+            self.skipTest('msgpack and cbor2 are not both installed')
+
+    def testqvalues(self):
+        for accept, contype in (
+                ('application/msgpack', 'application/msgpack'),
+                ('application/json, application/msgpack', None),
+                ('application/msgpack, application/json', 'application/msgpack'),
+                ('application/json;q=0.9, application/cbor', 'application/cbor'),
+                ('application/msgpack;q=0.5, application/cbor;q=0.8', 'application/cbor'),
+                ('application/json, application/msgpack;q=0.5', None),
+                ('application/msgpack;q=0', None),
+                ('*/*, application/msgpack', 'application/msgpack'),
+                ('*/*;q=0.1, application/cbor;q=0.5', 'application/cbor'),
+                ('application/msgpack;q=x, application/cbor;q=0.2', 'application/cbor'),
+                ('text/html', None), ('', None)):
+            self.assertEqual(binarycontype(accept), contype, accept)
+
+
+class VersionTests(TestCase):
+    """Compare-and-swap updates of requests and open requests"""
+
+    def setUp(self):
+        User.objects.create_user('tester', password='testpass')
+        self.client.login(username='tester', password='testpass')
+        self.cl = ClientInfo.objects.newclient('Test client')
+        self.oreq = OpenReq.objects.newreq('tester', self.cl, priority=1, title='Test request', desc='Test')
+        self.url = '/featreq/client/{0}/open/'.format(self.cl.id)
+
+    def postupdate(self, ifmatch, **args):
+        args.update(action='update', req_id=str(self.oreq.req_id))
+        return self.client.post(self.url, args, HTTP_ACCEPT='application/json', HTTP_IF_MATCH=ifmatch)
+
+    def teststaleifmatch(self):
+        OpenReq.objects.updatereq(self.oreq, priority=3)
+        resp = self.postupdate('"1"', priority=2)
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(resp.json()['version'], 2)
+        self.assertEqual(OpenReq.objects.get(id=self.oreq.id).priority, 3)
+
+    def testcurrentifmatch(self):
+        resp = self.postupdate('"1"', priority=2)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['ETag'], '"2"')
+        self.assertEqual(OpenReq.objects.get(id=self.oreq.id).priority, 2)
+
+    def testopenupdatesnotlost(self):
+        # Both read at version 1, then update different fields in turn
+        first = OpenReq.objects.get(id=self.oreq.id)
+        second = OpenReq.objects.get(id=self.oreq.id)
+        tgt = approxnow() + datetime.timedelta(days=7)
+        OpenReq.objects.updatereq(first, priority=4)
+        OpenReq.objects.updatereq(second, date_tgt=tgt)
+        oreq = OpenReq.objects.get(id=self.oreq.id)
+        self.assertEqual((oreq.priority, oreq.date_tgt, oreq.version), (4, tgt, 3))
+
+    def testrequpdatesnotlost(self):
+        first = FeatureReq.objects.get(id=self.oreq.req_id)
+        second = FeatureReq.objects.get(id=self.oreq.req_id)
+        first.updatereq('tester', desc='First addendum')
+        second.updatereq('tester', desc='Second addendum')
+        fr = FeatureReq.objects.get(id=self.oreq.req_id)
+        self.assertIn('First addendum', fr.desc)
+        self.assertIn('Second addendum', fr.desc)
+        self.assertEqual(fr.version, 3)
+
+    def testshiftversions(self):
+        # Moving into another's priority bumps each row once, and a
+        # date-only change doesn't shift anything
+        other = OpenReq.objects.newreq('tester', self.cl, priority=2, title='Other request', desc='Test')
+        OpenReq.objects.updatereq(other, priority=1)
+        self.assertEqual(OpenReq.objects.get(id=other.id).version, 2)
+        self.assertEqual(OpenReq.objects.get(id=self.oreq.id).version, 2)
+        shifts = ChangeEvent.objects.filter(kind='reprioritized').count()
+        OpenReq.objects.updatereq(other, date_tgt=approxnow() + datetime.timedelta(days=7))
+        self.assertEqual(ChangeEvent.objects.filter(kind='reprioritized').count(), shifts)
+
+
+class OverdueScanTests(TestCase):
+    """Overdue scan, including targets set behind its mark"""
+
+    def setUp(self):
+        self.cl = ClientInfo.objects.newclient('Test client')
+        self.fr = FeatureReq.objects.newreq('tester', 'Test request', 'Test')
+
+    def importopen(self, date_tgt, priority=1):
+        counts, errors = importbatch([ (1, 'open', {
+            'client_id': str(self.cl.id), 'req_id': str(self.fr.id),
+            'priority': priority, 'date_tgt': date_tgt.strftime(DATETIMEFMT),
+        }) ])
+        self.assertEqual(errors, [])
+
+    def testpasttarget(self):
+        now = approxnow()
+        self.assertEqual(scanoverdue(now), 0)
+        # Imported with a target already behind the scan's mark
+        self.importopen(now - datetime.timedelta(days=2))
+        self.assertEqual(scanoverdue(now + datetime.timedelta(seconds=1)), 1)
+        self.assertEqual(scanoverdue(now + datetime.timedelta(seconds=2)), 0)
+        # Changing something else doesn't record it again
+        self.importopen(now - datetime.timedelta(days=2), priority=2)
+        self.assertEqual(scanoverdue(now + datetime.timedelta(seconds=3)), 0)
+        # But a new target (also passed) does
+        self.importopen(now - datetime.timedelta(days=1), priority=2)
+        self.assertEqual(scanoverdue(now + datetime.timedelta(seconds=4)), 1)
+        self.assertEqual(ChangeEvent.objects.filter(kind='overdue').count(), 2)
+
+    def testfuturetarget(self):
+        now = approxnow()
+        self.importopen(now + datetime.timedelta(days=1))
+        self.assertEqual(scanoverdue(now), 0)
+        self.assertEqual(scanoverdue(now + datetime.timedelta(days=2)), 1)
+        self.assertEqual(scanoverdue(now + datetime.timedelta(days=3)), 0)
+
+
+class ImportTests(TestCase):
+    """Bulk import is idempotent, and resumes from its checkpoint"""
+
+    def setUp(self):
+        clients = [ ClientInfo.objects.newclient('Client {0}'.format(x)) for x in range(2) ]
+        for x in range(3):
+            OpenReq.objects.newreq('tester', clients[x % 2], title='Request {0}'.format(x), desc='Test ' * 20)
+        ClosedReq.objects.closereq('tester', OpenReq.objects.order_by('pk').first().req)
+        self.lines = b''.join(exportstream(parsetypes(''))).splitlines(True)
+
+    def snapshot(self):
+        '''Returns tuple of all rows (as exported) and events recorded'''
+        return (b''.join(exportstream(parsetypes(''))),
+            list(ChangeEvent.objects.order_by('id').values_list('kind', 'req_id', 'client_id')))
+
+    def testreimport(self):
+        before = self.snapshot()
+        results = list(importlines(self.lines, batch=2))
+        self.assertEqual(sum(len(errors) for lineno, counts, errors in results), 0)
+        self.assertEqual(sum(sum(counts.values()) for lineno, counts, errors in results), len(self.lines))
+        # No versions bumped and no events recorded
+        self.assertEqual(self.snapshot(), before)
+
+    def testresume(self):
+        rows = self.snapshot()[0]
+        reqcount = FeatureReq.objects.count()
+        for model in (ClosedReq, OpenReq, FeatureReq, ClientInfo, ChangeEvent):
+            model.objects.all().delete()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'export.ndjson')
+            with open(path, 'wb') as f:
+                f.writelines(self.lines)
+            # Stopped after the first batch was committed and checkpointed
+            partial = importlines(self.lines, batch=2)
+            lineno = next(partial)[0]
+            partial.close()
+            ckpath = path + '.checkpoint'
+            writecheckpoint(ckpath, {'source': path, 'line': lineno})
+            self.assertLess(FeatureReq.objects.count(), reqcount)
+            err = io.StringIO()
+            call_command('featreq_import', path, batch=2, rollups=False, stdout=io.StringIO(), stderr=err)
+            self.assertIn('Resuming after line {0}'.format(lineno), err.getvalue())
+            self.assertFalse(os.path.exists(ckpath))
+        self.assertEqual(self.snapshot()[0], rows)
+        self.assertEqual(ChangeEvent.objects.filter(kind='req_created').count(), reqcount)
+
+
+class ChurnTests(TestCase):
+    """Priority churn counts priority changes only, including shifts"""
+
+    def testchurn(self):
+        cl = ClientInfo.objects.newclient('Test client')
+        first = OpenReq.objects.newreq('tester', cl, priority=1, title='First request', desc='Test')
+        second = OpenReq.objects.newreq('tester', cl, priority=2, title='Second request', desc='Test')
+        # Date-only changes aren't churn
+        for oreq in (first, second):
+            OpenReq.objects.updatereq(oreq, date_tgt=approxnow() + datetime.timedelta(days=7))
+        # Moving second to 1 shifts first to 2: one change each
+        OpenReq.objects.updatereq(OpenReq.objects.get(id=second.id), priority=1)
+        for oreq in (first, second):
+            ClosedReq.objects.closereq('tester', oreq.req)
+        rows, count = closedmetrics(group=())
+        self.assertEqual(count, 2)
+        self.assertEqual((rows[0]['churn_mean'], rows[0]['churn_max']), (1, 1))
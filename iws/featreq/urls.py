@@ -26,6 +26,13 @@ urlpatterns = [
     url(r'^auth/', views.apiauth, name='featreq-auth'),
     url(r'^req/', include(req_patterns)),
     url(r'^client/', include(client_patterns)),
+    url(r'^events/$', views.events, name='featreq-events'),
+    url(r'^changes/$', views.changes, name='featreq-changes'),
+    url(r'^stats/$', views.stats, name='featreq-stats'),
+    url(r'^analytics/$', views.analytics, name='featreq-analytics'),
+    url(r'^export/$', views.export, name='featreq-export'),
+    url(r'^nextup/$', views.nextup, name='featreq-nextup'),
+    url(r'^nextup/queue/$', views.nextupqueue, name='featreq-nextup-queue'),
 ]
 
     # url(r'^open/$', views.openindexbyclient, name='featreq-open-index'),
@@ -1,6 +1,13 @@
-import datetime, uuid
+import sys, datetime, uuid
 from collections import OrderedDict
 
+# Plain dicts keep insertion order from Python 3.7 onwards, so we only need
+# OrderedDict (and its extra per-item overhead) on older interpreters
+if sys.version_info >= (3, 7):
+    ordereddict = dict
+else:
+    ordereddict = OrderedDict
+
 ## Utility functions used in various places
 
 # UUID v4 validation
@@ -99,23 +106,68 @@ def checkdatetgt(date_tgt):
     else:
         return None
 
+# Binary format translators
+# The UUID fields on each model serialize via str(), and datetime fields
+# via approxdatefmt(); for binary formats we swap those for the raw 16-byte
+# UUID and the datetime itself, leaving all other translators (and thus
+# the field schemas) unchanged
+def uuidbytes(uid):
+    '''Returns 16-byte form of UUID uid (given as UUID instance or string),
+    or None if uid is None.
+    '''
+    if uid is None:
+        return None
+    elif isinstance(uid, uuid.UUID):
+        return uid.bytes
+    else:
+        return uuid.UUID(uid).bytes
+
+BINARY_FCALLS = { str: uuidbytes, approxdatefmt: None }
+
+def binaryfcalls(fcalls):
+    '''Returns tuple of field translators from fcalls, with string/datetime
+    translators replaced by their binary-format equivalents.
+    '''
+    return tuple(BINARY_FCALLS.get(fc, fc) for fc in fcalls)
+
+def fieldlookups(model, fields, prefix=''):
+    '''Returns list of query lookups for field names fields of model (each
+    prefixed with prefix, for a related model), with fields the model
+    stores in other tables (named in its lookups attribute, if any) looked
+    up there.
+    '''
+    lookups = getattr(model, 'lookups', {})
+    return [ prefix + lookups.get(fn, fn) for fn in fields ]
+
+def defaultfields(model):
+    '''Returns tuple of model's field names serialized when none are asked
+    for: all of model.fields, less those in its optfields attribute (if any),
+    which are only included when asked for by name.
+    '''
+    opt = getattr(model, 'optfields', ())
+    return tuple( fn for fn in model.fields if fn not in opt )
+
 # JSON-compatible OrderedDict creation
-def tojsondict(model, fields=None, fcalls=None):
+def tojsondict(model, fields=None, fcalls=None, binary=False):
     '''Returns JSON-compatible dict of model values.
-    Uses OrderedDict to ensure values in model-specified order.
+    Uses an insertion-ordered dict to ensure values in model-specified order.
 
     If neither of fields or fcalls are specified, the model 
     class must have a fields attribute as an OrderedDict
-    of field names and callables for JSON compatibility.
+    of field names and callables for JSON compatibility
+    (and fields defaults to defaultfields(model)).
 
     If fields is specified, it must be an iterable of valid field
     names of the model.
 
     If fcalls is specified, it must be an iterable matching
     fields, with each item a callable object or None.
+
+    If binary is True, UUIDs and datetimes will be left in binary-friendly
+    form (see binaryfcalls()) instead of translated to strings.
     '''
 
-    retvals = OrderedDict()
+    retvals = ordereddict()
 
     # Get fields dict if necessary
     # (Checked because there might be times when model is 
@@ -124,9 +176,11 @@ def tojsondict(model, fields=None, fcalls=None):
     if not fields or not fcalls:
         fielddict = model.fields
         if not fields:
-            fields = fielddict.keys()
+            fields = defaultfields(model)
         if not fcalls:
             fcalls = tuple(fielddict[k] for k in fields)
+    if binary:
+        fcalls = binaryfcalls(fcalls)
 
     # Iterate over selected fields in given order, and translate
     for fname, fcall in zip(fields, fcalls):
@@ -138,9 +192,9 @@ def tojsondict(model, fields=None, fcalls=None):
 
     return retvals
 
-def qset_vals_tojsonlist(qset, fields=None, fcalls=None):
+def qset_vals_tojsonlist(qset, fields=None, fcalls=None, binary=False):
     '''Takes a QuerySet qset and an optional list of fields to
-    convert to a JSON-compatible list of OrderedDicts. Avoids
+    convert to a JSON-compatible list of insertion-ordered dicts. Avoids
     overhead of model instantiation by using values_list() as
     an intermediate reprsentation.
 
@@ -153,6 +207,9 @@ def qset_vals_tojsonlist(qset, fields=None, fcalls=None):
 
     If fcalls is specified, it must be an iterable matching
     fields, with each item a callable object or None.
+
+    If binary is True, UUIDs and datetimes will be left in binary-friendly
+    form (see binaryfcalls()) instead of translated to strings.
     '''
     # Get fields dict if necessary
     # (Checked because there might be times when qset is something
@@ -164,15 +221,29 @@ def qset_vals_tojsonlist(qset, fields=None, fcalls=None):
         # matching callables (instead of repeated dict lookups) if
         # not passed in
         if not fields:
-            fields = tuple(fielddict)
+            fields = defaultfields(qset.model)
         if not fcalls:
             fcalls = tuple(fielddict[k] for k in fields)
+    if binary:
+        fcalls = binaryfcalls(fcalls)
     # BIG LIST COMPREHENSION ONE-LINER
-    # (For each values_list() item, we make an OrderedDict of the 
+    # (For each values_list() item, we make an ordered dict of the 
     # field names and field values, using the callable translator
     # if it exists)
-    return [ OrderedDict([ (fn, fc(fv)) if fc is not None else (fn, fv) 
+    return [ ordereddict([ (fn, fc(fv)) if fc is not None else (fn, fv) 
         for fn, fc, fv in zip(fields, fcalls, fvals)]) 
             for fvals in qset.values_list(*fields) ]
 
 
+
+# Max ids per IN query (keeps under SQLite's bound parameter limit)
+IN_QUERY_CHUNK = 500
+
+def qset_byids(qset, ids, field='id', chunk=IN_QUERY_CHUNK):
+    '''Generator yielding QuerySets of the rows of qset matching any of ids
+    on field, chunk ids per query.
+    '''
+    ids = list(ids)
+    lookup = field + '__in'
+    for start in range(0, len(ids), chunk):
+        yield qset.filter(**{lookup: ids[start:start+chunk]})
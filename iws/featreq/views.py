@@ -1,7 +1,7 @@
-import datetime, json
+import datetime
 from collections import OrderedDict
 from functools import partial
-from django.http import HttpResponse, HttpResponseRedirect, HttpResponsePermanentRedirect,\
+from django.http import HttpResponse, StreamingHttpResponse, HttpResponseRedirect, HttpResponsePermanentRedirect,\
     HttpResponseNotFound, HttpResponseNotAllowed, HttpResponseBadRequest, HttpResponseForbidden
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.urlresolvers import reverse as urlreverse
@@ -10,8 +10,22 @@ from django.shortcuts import render
 from django.views.decorators.csrf import ensure_csrf_cookie, csrf_exempt, requires_csrf_token
 from django.middleware.csrf import get_token as csrf_get_token
 from django.contrib.auth import authenticate, login, logout
-from .models import FeatureReq, ClientInfo, OpenReq, ClosedReq
-from .utils import approxnow, tojsondict, qset_vals_tojsonlist, DATETIMEFMT
+from django.core.cache import cache
+from django.conf import settings
+from .models import FeatureReq, ClientInfo, OpenReq, ClosedReq, ChangeEvent, ArchivedFeatureReq, ArchivedClosedReq,\
+    VersionConflict
+from .utils import approxnow, validuuid, checkdatetgt, ordereddict, uuidbytes, tojsondict, qset_vals_tojsonlist,\
+    fieldlookups, defaultfields, qset_byids, DATETIMEFMT, IN_QUERY_CHUNK
+from .codec import jsondumps, jsonloads, jsonpretty, binarycontype, binarydumps
+from .archive import archiveenabled
+from .stats import getstats
+from .analytics import closedmetrics, parsegroup, GROUP_DIMS
+from .export import exportstream, exportcontype, parsetypes
+from .nextup import topk, queuepage, parsecursor, NEXTUP_K, NEXTUP_K_MAX, QUEUE_LIMIT, QUEUE_LIMIT_MAX
+from .writequeue import queuedwrite
+from .coalesce import coalesce, notewrite
+from .readmodel import openrecords
+from .records import linkrecords, batchesbyid, recorddicts
 
 ## Common vars
 
@@ -19,17 +33,20 @@ from .utils import approxnow, tojsondict, qset_vals_tojsonlist, DATETIMEFMT
 # 24h for testing purposes at present
 SESSION_EXPIRY = 86400
 WEBVIEW_URL = '/webview/'
+# Seconds analytics results are cached for
+ANALYTICS_CACHE = getattr(settings, 'IWS_ANALYTICS_CACHE', 900)
 
 # Default 404 JSON response dict
 # Views may add extra information, or JSONify and send as-is
 json404 = OrderedDict([('status_code', 404), ('error', 'Resource not found')])
-json404str = json.dumps(json404, indent=1) + '\n'
+json404str = jsondumps(json404)
 json_contype = 'application/json'
 plain_contype = 'text/plain'
 
 # OpenReq and ClosedReq modified fields and qset_vals_tojsonlist partials
 openreq_byreq_fields = OpenReq.fields.copy()
 del openreq_byreq_fields['req_id']
+del openreq_byreq_fields['version']
 # openreq_byreq_partial = partial(
 #     qset_vals_tojsonlist, 
 #     fields=openreq_byreq_fields.keys(), 
@@ -51,6 +68,7 @@ client_with_counts_dict = OrderedDict([
 
 openreq_byclient_fields = OpenReq.fields.copy()
 del openreq_byclient_fields['client_id']
+del openreq_byclient_fields['version']
 #openreq_byclient_fields.move_to_end('req_id')
 #del openreq_byclient_fields['req_id']
 #openreq_byclient_fields['req'] = tojsondict
@@ -61,6 +79,19 @@ del closedreq_byclient_fields['client_id']
 #del closedreq_byclient_fields['req_id']
 #closedreq_byclient_fields['req'] = tojsondict
 
+# Related objects which link lists can expand (see getexpand()), with the
+# models to look for them in
+EXPAND_MODELS = OrderedDict([
+    ('client', (ClientInfo,)),
+    ('req', (FeatureReq,)),
+])
+
+# Default and maximum number of change events per /changes/ page
+CHANGES_LIMIT = 1000
+CHANGES_LIMIT_MAX = 10000
+# Max ids per multi-get (so it's always one query)
+MULTIGET_MAX = IN_QUERY_CHUNK
+
 ## Shortcut funcs
 
 def req_is_json(request):
@@ -76,6 +107,33 @@ def req_is_plain(request):
     else:
         return False
 
+def req_is_binary(request):
+    '''Returns binary content type (MessagePack or CBOR) accepted by request,
+    or None if JSON should be used.
+    '''
+    return binarycontype(request.META.get('HTTP_ACCEPT', ''))
+
+def req_json_pretty(request):
+    '''Returns whether JSON responses to request are indented: False if its
+    query string asks for compact output (compact=1), True if it asks
+    otherwise (compact=0), or None for the default (see codec.jsondumps()).
+    '''
+    compact = request.GET.get('compact')
+    if compact is None:
+        return None
+    return compact.lower() not in ('1', 'true')
+
+def dataresponse(request, respobj, status=200):
+    '''Constructs response from respobj, encoded in a binary format if
+    accepted by request, otherwise as JSON. Any binary-specific values in
+    respobj (see utils.binaryfcalls()) must match the format used.
+    '''
+    contype = req_is_binary(request)
+    if contype:
+        return HttpResponse(binarydumps(respobj, contype), status=status, content_type=contype)
+    else:
+        return HttpResponse(jsondumps(respobj, req_json_pretty(request)), status=status, content_type=json_contype)
+
 def getusername(request):
     '''Extracts username from request, or provides default.'''
     unknown_user = 'UNKNOWN'
@@ -110,7 +168,7 @@ def badrequest(request, errormsg, field=None, adderr=None):
             errordict['field'] = str(field)
         if adderr:
             errordict.update(adderr)
-        jsonbytes = (json.dumps(errordict, indent=1) + '\n').encode('utf-8')
+        jsonbytes = jsondumps(errordict, req_json_pretty(request))
         return HttpResponseBadRequest(jsonbytes, content_type=json_contype)
 
 def forbidden(request, errormsg='Not authorized', adderr=None):
@@ -129,7 +187,47 @@ def forbidden(request, errormsg='Not authorized', adderr=None):
             ('error', errormsg)])
         if adderr:
             errordict.update(adderr)
-        return HttpResponseForbidden(json.dumps(errordict, indent=1)+'\n', content_type=json_contype)
+        return HttpResponseForbidden(jsondumps(errordict, req_json_pretty(request)), content_type=json_contype)
+
+def conflict(request, errormsg, adderr=None):
+    '''Constructs 409 Conflict response with given error message.
+    If given, adderr must be a dict of additional fields to append to the
+    error response.
+    '''
+
+    if req_is_plain(request):
+        errorstr = 'Status code: 409\nError message: {0}\n'.format(errormsg)
+        return HttpResponse(errorstr, status=409, content_type=plain_contype)
+    else:
+        errordict = OrderedDict([
+            ('status_code', 409),
+            ('error', str(errormsg))])
+        if adderr:
+            errordict.update(adderr)
+        return HttpResponse(jsondumps(errordict, req_json_pretty(request)), status=409, content_type=json_contype)
+
+def getifmatch(request):
+    '''Returns row version from request's If-Match header (a version
+    number as an entity tag, as in ETag responses), or None if absent or
+    '*'. Raises ValueError if not a version number.
+    '''
+    etag = request.META.get('HTTP_IF_MATCH', '').strip()
+    if not etag or etag == '*':
+        return None
+    # Weak or strong, the version's the same
+    if etag.startswith('W/'):
+        etag = etag[2:]
+    try:
+        version = int(etag.strip('"'))
+    except ValueError:
+        version = 0
+    if version < 1:
+        raise ValueError('Invalid If-Match header: {0}'.format(etag))
+    return version
+
+def versionetag(version):
+    '''Returns ETag header value for row version'''
+    return '"{0}"'.format(version)
 
 def getargsfrompost(request, fieldnames=None, required=None, aslist=None, asint=None):
     '''Extracts ordered dict of arguments from POST request. Requests with
@@ -157,27 +255,24 @@ def getargsfrompost(request, fieldnames=None, required=None, aslist=None, asint=
         # Specific codepath for JSON, since we can decode into the form
         # of our own choosing
 
-        # Set encoding, falling back to UTF-8
-        encoding = request.encoding
-        if not encoding:
-            encoding = 'utf-8'
+        # Decode straight from the body bytes (the codec skips the
+        # intermediate str for UTF-8, which is the default)
+        body = jsonloads(request.body, request.encoding)
 
         # If fieldnames given, we need to populate and order the returned
-        # dict, so we'll decode JSON as a regular dict and transfer over
-        # values field-by-field
+        # dict, so we transfer over values field-by-field
         if fieldnames:
             respdict = OrderedDict()
-            tmpdict = json.loads(request.body.decode(encoding))
             for fn in fieldnames:
                 try:
-                    fv = tmpdict[fn]
+                    fv = body[fn]
                 except KeyError:
                     pass
                 else:
                     respdict[fn] = fv
-        # If no fieldnames given, we decode straight into an OrderedDict
+        # If no fieldnames given, the decoded dict is already in body order
         else:
-            respdict = json.loads(request.body.decode(encoding), object_pairs_hook=OrderedDict)
+            respdict = OrderedDict(body)
 
         # Now we check the output
         # Check required fields
@@ -318,8 +413,149 @@ def getfieldsfromget(
 
     return fields
 
+def parseids(values):
+    '''Returns list of UUIDs from values (iterable of ids, or of comma-
+    separated lists of them), in order, without duplicates. Raises
+    ValueError if any are invalid, or there are more than MULTIGET_MAX.
+    '''
+    ids = ordereddict()
+    for value in values:
+        for idstr in str(value).split(','):
+            idstr = idstr.strip()
+            if not idstr:
+                continue
+            uid = validuuid(idstr, version=None)
+            if uid is None:
+                raise ValueError('Invalid id: {0}'.format(idstr))
+            ids[uid] = None
+    if len(ids) > MULTIGET_MAX:
+        raise ValueError('Too many ids: {0} (max {1})'.format(len(ids), MULTIGET_MAX))
+    return list(ids)
+
+def multiget(request, models, ids, fields, name):
+    '''Returns data response with JSON-compatible dicts (with fields, or
+    the default fields if empty, always including id) of the rows with ids
+    in ids (list of UUIDs), in the same order, as <name>_list, with
+    <name>_count, and with the ids not found as missing. Rows are looked for
+    in each of models in turn, with one query each (for those not yet
+    found; see records.recorddicts()).
+    '''
+    binary = bool(req_is_binary(request))
+    idkey = uuidbytes if binary else str
+    found = recorddicts(models, ids, fields, binary)
+
+    rowlist, missing = [], []
+    for uid in ids:
+        try:
+            rowlist.append(found[uid])
+        except KeyError:
+            missing.append(idkey(uid))
+    return dataresponse(request, ordereddict([
+        (name + '_count', len(rowlist)), (name + '_list', rowlist), ('missing', missing)
+    ]))
+
+def getincludearchived(request):
+    '''Returns True if query string in request asks for archived rows
+    (include_archived=1), and the archive database is enabled.
+    '''
+    return request.GET.get('include_archived', '').lower() in ('1', 'true') and archiveenabled()
+
+def getexpand(request):
+    '''Returns insertion-ordered dict of relation name to list of fields
+    (None for all) for each related object to expand, as named in query
+    string parameter expand (comma-separated, any of EXPAND_MODELS), with
+    fields from parameter <name>_fields. Raises ValueError if a name isn't
+    valid.
+    '''
+    expand = ordereddict()
+    for value in request.GET.getlist('expand'):
+        for relname in value.split(','):
+            relname = relname.strip()
+            if not relname:
+                continue
+            try:
+                model = EXPAND_MODELS[relname][0]
+            except KeyError:
+                raise ValueError('Invalid expand: {0}'.format(relname))
+            expand[relname] = getfieldsfromget(request, fieldname=relname + '_fields', allowed=model.fields) or None
+    return expand
+
+def expandlinks(request, links, relname, fields=None):
+    '''Takes list of (dict, record) pairs for link rows (as from jsondict()
+    of OpenReq or ClosedReq records), and replaces <relname>_id in each
+    dict with relname, as JSON-compatible dict of the related object (with
+    fields, or all if None). Related objects are read with one batched
+    query, once each however many rows name them; any not found are given
+    as id only.
+    '''
+    binary = bool(req_is_binary(request))
+    idname = relname + '_id'
+    models = EXPAND_MODELS[relname]
+    if relname == 'req' and getincludearchived(request):
+        models = models + (ArchivedFeatureReq,)
+    related = recorddicts(models, [ getattr(rec, idname) for _, rec in links ], fields, binary,
+        chunk=IN_QUERY_CHUNK)
+    for linkdict, rec in links:
+        relid = linkdict.pop(idname)
+        try:
+            linkdict[relname] = related[getattr(rec, idname)]
+        except KeyError:
+            linkdict[relname] = {'id': relid}
+
+def getopenbefore(request):
+    '''Returns datetime to limit open requests' target dates to (before),
+    if query string in request has overdue=1 (past target date) and/or
+    due_before=<date> (target date before date), or None if neither.
+    Raises ValueError if due_before is invalid.
+    '''
+    before = checkdatetgt(request.GET.get('due_before'))
+    if request.GET.get('overdue', '').lower() in ('1', 'true'):
+        now = approxnow()
+        before = min(before, now) if before else now
+    return before or None
+
+def openqset(before=None, client_id=None):
+    '''Returns QuerySet of OpenReq, for client client_id if given, limited
+    to target dates before datetime before if given.
+
+    Ordered by target date if before is given, or otherwise by priority
+    (unprioritized first, as SQLite sorts NULLs) for a client, or by id for
+    all (the read model, see readmodel.py, returns the same orders).
+    '''
+    if before:
+        qset = OpenReq.objects.due_before(before)
+    elif client_id is not None:
+        qset = OpenReq.objects.order_by('priority', 'id')
+    else:
+        qset = OpenReq.objects.order_by('id')
+    return qset.filter(client_id=client_id) if client_id is not None else qset
+
+def getopenqset(request):
+    '''Returns QuerySet of OpenReq, limited by target date as asked for in
+    request's query string (see getopenbefore()). Raises ValueError if
+    due_before is invalid.
+    '''
+    return openqset(getopenbefore(request))
+
+def linkprojection(qset, fields, relname='req'):
+    '''Returns QuerySet qset of link model (OpenReq or ClosedReq) joined via
+    select_related(relname), loading all of the link model's own columns
+    but only the given fields of the related model, so large columns
+    (FeatureReq.desc, in its side table) aren't read unless asked for.
+    '''
+    model = qset.model
+    lookups = fieldlookups(model._meta.get_field(relname).related_model, fields, relname + '__')
+    # Join whichever tables the lookups are in
+    related = set( lookup.rsplit('__', 1)[0] for lookup in lookups )
+    return qset.select_related(*related).only(*([ f.name for f in model._meta.concrete_fields ] + lookups))
+
 def prettifyjson(request, response):
-    resp = render(request, 'featreq/json.html', {'response': response})
+    # Responses are compact JSON, so indent them here for the browser
+    try:
+        body = jsonpretty(response.content)
+    except ValueError:
+        body = response.content
+    resp = render(request, 'featreq/json.html', {'response': response, 'body': body})
     resp.status_code = response.status_code
     resp.reason_phrase = response.reason_phrase
     return resp
@@ -342,7 +578,7 @@ def allow_methods(methods, usejson=True):
                         ('status_code', 405),
                         ('error', respstr.format(request.method))
                     ])
-                    jsonbytes = (json.dumps(errordict, indent=1) + '\n').encode('utf-8')
+                    jsonbytes = jsondumps(errordict, req_json_pretty(request))
                     return HttpResponseNotAllowed(methods, jsonbytes, content_type=json_contype)
         else:
             def wrapped(request, *args, **kwargs):
@@ -353,6 +589,16 @@ def allow_methods(methods, usejson=True):
         return wrapped
     return wrap
 
+def notedwrite(request, func, *args, **kwargs):
+    '''Calls write func(*args, **kwargs) through the write queue (see
+    writequeue.queuedwrite()), then notes the write in request's session,
+    so its next reads aren't coalesced with ones started before it (see
+    coalesce.py). Returns func's result, or raises its exception.
+    '''
+    result = queuedwrite(func, *args, **kwargs)
+    notewrite(request)
+    return result
+
 def auth_required(f):
     '''Decorator for views. Checks that user is authenticated, returns
     403 Forbidden response if not.
@@ -369,7 +615,7 @@ def makepretty(f):
     returns either raw JSON or the prettified version.
     '''
     def wrapped(request, *args, **kwargs):
-        if req_is_json(request):
+        if req_is_json(request) or req_is_binary(request):
             return f(request, *args, **kwargs)
         else:
             resp = f(request, *args, **kwargs)
@@ -409,7 +655,7 @@ def index(request):
                 ('full_name', fullname),
                 ('session_expiry', request.session.get_expiry_age())
             ])
-            return HttpResponse(json.dumps(respdict, indent=1)+'\n', content_type=json_contype)
+            return HttpResponse(jsondumps(respdict, req_json_pretty(request)), content_type=json_contype)
         else:
             return HttpResponseRedirect(WEBVIEW_URL)
 
@@ -491,7 +737,7 @@ def apiauth(request):
                     ('csrf_token', csrf_get_token(request)),
                     ('session_expiry', mod_time),
                 ])
-                return HttpResponse(json.dumps(respdict, indent=1)+'\n', content_type=json_contype)
+                return HttpResponse(jsondumps(respdict, req_json_pretty(request)), content_type=json_contype)
 
     if request.method == 'GET':
         return _authresp(request)
@@ -564,6 +810,7 @@ def apiauth(request):
         else:
             return badrequest(request, 'Invalid action: {0}'.format(action), 'action')
 
+@coalesce
 @makepretty
 @auth_required
 @allow_methods(['GET', 'POST'])
@@ -571,15 +818,25 @@ def reqindex(request):
     # TODO: add filter options
 
     if request.method == 'GET':
+        # Get listed requests only, if ids given
+        if 'ids' in request.GET:
+            try:
+                ids = parseids(request.GET.getlist('ids'))
+            except ValueError as e:
+                return badrequest(request, e, 'ids')
+            fields = getfieldsfromget(request, allowed=FeatureReq.fields)
+            models = (FeatureReq, ArchivedFeatureReq) if getincludearchived(request) else (FeatureReq,)
+            return multiget(request, models, ids, fields, 'req')
+
         # Get requested fieldname list
         fields = getfieldsfromget(request, empty=['id', 'title'], allowed=FeatureReq.fields)
 
         # Get featreqs
-        frlist = qset_vals_tojsonlist(FeatureReq.objects, fields)
+        frlist = qset_vals_tojsonlist(FeatureReq.objects, fields, binary=bool(req_is_binary(request)))
 
         # Construct response
-        respdict = OrderedDict([('req_count', len(frlist)), ('req_list', frlist)])
-        return HttpResponse(json.dumps(respdict, indent=1)+'\n', content_type=json_contype)
+        respdict = ordereddict([('req_count', len(frlist)), ('req_list', frlist)])
+        return dataresponse(request, respdict)
 
     elif request.method == 'POST':
         # Get user
@@ -588,34 +845,51 @@ def reqindex(request):
 
         # Get args
         try:
-            # TODO: remove title and desc from required if any additional
-            # actions get defined
             postargs = getargsfrompost(request,
-                fieldnames=('action', 'id', 'title', 'desc', 'ref_url', 'prod_area'),
-                required={'action', 'title', 'desc'}
+                fieldnames=('action', 'id', 'title', 'desc', 'ref_url', 'prod_area', 'ids', 'fields'),
+                required={'action'},
+                aslist={'ids', 'fields'}
             )
         except ValueError as e:
             return badrequest(request, e)
 
         # Update request
         action = postargs.pop('action').lower()
-        if action == 'create':
+        if action == 'get':
+            # Multi-get, for id lists too long for a query string
+            try:
+                ids = parseids(postargs.get('ids', ()))
+            except ValueError as e:
+                return badrequest(request, e, 'ids')
+            fields = [ fn for fv in postargs.get('fields', ()) for fn in str(fv).split(',') if fn in FeatureReq.fields ]
+            models = (FeatureReq, ArchivedFeatureReq) if getincludearchived(request) else (FeatureReq,)
+            return multiget(request, models, ids, fields, 'req')
+
+        elif action == 'create':
+            for fn in ('title', 'desc'):
+                if fn not in postargs:
+                    return badrequest(request, 'Required field {0} missing'.format(fn))
+            # (Multi-get args don't apply)
+            postargs.pop('ids', None)
+            postargs.pop('fields', None)
+
             # Add user
             postargs['user'] = username
             postargs.move_to_end('user', last=False)
 
             # Attempt featreq creation and return new featreq or error
             try:
-                fr = FeatureReq.objects.newreq(**postargs)
+                fr = notedwrite(request, FeatureReq.objects.newreq, **postargs)
             except Exception as e:
                 return badrequest(request, e)
             else:
-                resp = HttpResponse(json.dumps({'req': fr.jsondict()}, indent=1)+'\n', status=201, content_type=json_contype)
+                resp = dataresponse(request, {'req': fr.jsondict(binary=bool(req_is_binary(request)))}, status=201)
                 resp['Location'] = urlreverse('featreq-req-byid', kwargs={'req_id':fr.id})
                 return resp
         else:
             return badrequest(request, 'Invalid action "{0}"'.format(action), field='action')
 
+@coalesce
 @makepretty
 @auth_required
 @allow_methods(['GET'])
@@ -623,29 +897,40 @@ def reqindex_ext(request, tolist):
     # TODO: add filter options
 
     def _getindex(request, listopen, listclosed):
-        # We'll feed each FeatureReq into an OrderedDict by id, and append matching
+        # We'll feed each FeatureReq into an ordered dict by id, and append matching
         # OpenReqs to them
-        frdict = OrderedDict()
+        frdict = ordereddict()
+        binary = bool(req_is_binary(request))
 
         # Get requested fieldname list
         fields = getfieldsfromget(
             request,
             empty=['id', 'title'],
-            allfields=FeatureReq.fields.keys(),
+            allfields=defaultfields(FeatureReq),
             allowed=FeatureReq.fields
         )
+        # (Empty after filtering means all fields, as with jsondict())
+        reqfields = fields or defaultfields(FeatureReq)
 
         # Get open, if requested
         if listopen:
-            # Get all open requests, prefetching FeatureReq objects
-            oreqlist = OpenReq.objects.select_related('req')
+            # Get all open requests (or those due, if asked), from the read
+            # model if enabled, or reading requested FeatureReq fields in the
+            # same query
+            try:
+                before = getopenbefore(request)
+            except ValueError as e:
+                return badrequest(request, e, 'due_before')
+            oreqlist = openrecords(before=before, reqfields=reqfields)
+            if oreqlist is None:
+                oreqlist = linkrecords(openqset(before), 'req', reqfields)
             for oreq in oreqlist:
                 # Get/create featreq dict
                 try:
                     fr = frdict[oreq.req_id]
                 except KeyError:
                     # FeatureReq not in master dict, create JSON-compat dict and add
-                    fr = oreq.req.jsondict(fields)
+                    fr = oreq.req.jsondict(fields, binary=binary)
                     frdict[oreq.req_id] = fr
                 # Get open_list from featreq dict
                 try:
@@ -655,19 +940,20 @@ def reqindex_ext(request, tolist):
                     openlist = list()
                     fr['open_list'] = openlist
                 # Now add OpenReq to list (minus redundant req_id)
-                openlist.append(oreq.jsondict(openreq_byreq_fields.keys(), openreq_byreq_fields.values()))
+                openlist.append(oreq.jsondict(
+                    openreq_byreq_fields.keys(), openreq_byreq_fields.values(), binary))
 
         # Get closed, if requested
         if listclosed:
-            # Get all closed requests, prefetching FeatureReq objects
-            creqlist = ClosedReq.objects.select_related('req')
+            # Get all closed requests, with requested FeatureReq fields
+            creqlist = linkrecords(ClosedReq.objects.all(), 'req', reqfields)
             for creq in creqlist:
                 # Get/create featreq dict
                 try:
                     fr = frdict[creq.req_id]
                 except KeyError:
                     # FeatureReq not in master dict, create JSON-compat dict and add
-                    fr = creq.req.jsondict(fields)
+                    fr = creq.req.jsondict(fields, binary=binary)
                     frdict[creq.req_id] = fr
                 # Get closed_list from featreq dict
                 try:
@@ -677,14 +963,35 @@ def reqindex_ext(request, tolist):
                     closedlist = list()
                     fr['closed_list'] = closedlist
                 # Now add ClosedReq to list (minus redundant req_id)
-                closedlist.append(creq.jsondict(closedreq_byreq_fields.keys(), closedreq_byreq_fields.values()))
+                closedlist.append(creq.jsondict(
+                    closedreq_byreq_fields.keys(), closedreq_byreq_fields.values(), binary))
+
+            # Get archived closed requests too, if requested
+            # (A batch at a time, fetching featreqs not already listed, from
+            # either database, for each)
+            if getincludearchived(request):
+                for acreqlist in batchesbyid(ArchivedClosedReq.objects.all(), IN_QUERY_CHUNK):
+                    missing = { acreq.req_id for acreq in acreqlist if acreq.req_id not in frdict }
+                    fetched = recorddicts((FeatureReq, ArchivedFeatureReq), missing, reqfields, binary, withid=False)
+                    for acreq in acreqlist:
+                        try:
+                            fr = frdict[acreq.req_id]
+                        except KeyError:
+                            try:
+                                # Listed in order of first archived row
+                                fr = frdict[acreq.req_id] = fetched[acreq.req_id]
+                            except KeyError:
+                                # Featreq deleted outright
+                                continue
+                        fr.setdefault('closed_list', []).append(acreq.jsondict(
+                            closedreq_byreq_fields.keys(), closedreq_byreq_fields.values(), binary))
 
         # Now list-ify everything
         frlist = list(frdict.values())
 
         # Construct response
-        respdict = OrderedDict([('req_count', len(frlist)), ('req_list', frlist)])
-        return HttpResponse(json.dumps(respdict, indent=1)+'\n', content_type=json_contype)
+        respdict = ordereddict([('req_count', len(frlist)), ('req_list', frlist)])
+        return dataresponse(request, respdict)
 
     '''
     @allow_methods(['GET'])
@@ -726,8 +1033,10 @@ def reqbyid(request, req_id):
         return HttpResponseNotFound(json404str, content_type=json_contype)
     else:
         if request.method == 'GET':
-            # Return (ordered) dict as JSON
-            return HttpResponse(json.dumps({'req': fr.jsondict()}, indent=1)+'\n', content_type=json_contype)
+            # Return (ordered) dict as JSON (or binary)
+            resp = dataresponse(request, {'req': fr.jsondict(binary=bool(req_is_binary(request)))})
+            resp['ETag'] = versionetag(fr.version)
+            return resp
         elif request.method == 'POST':
             # Get user
             # TODO: try/except (once auth in place)
@@ -749,13 +1058,23 @@ def reqbyid(request, req_id):
                 postargs['user'] = username
                 postargs.move_to_end('user', last=False)
 
+                # Only update if unchanged since version given, if any
+                try:
+                    postargs['version'] = getifmatch(request)
+                except ValueError as e:
+                    return badrequest(request, e)
+
                 # Attempt update and return new featreq or error
                 try:
-                    fr = fr.updatereq(**postargs)
+                    fr = notedwrite(request, fr.updatereq, **postargs)
+                except VersionConflict as e:
+                    return conflict(request, e, {'version': fr.version})
                 except Exception as e:
                     return badrequest(request, e)
                 else:
-                    return HttpResponse(json.dumps({'req': fr.jsondict()}, indent=1)+'\n', content_type=json_contype)
+                    resp = dataresponse(request, {'req': fr.jsondict(binary=bool(req_is_binary(request)))})
+                    resp['ETag'] = versionetag(fr.version)
+                    return resp
             else:
                 return badrequest(request, 'Invalid action "{0}"'.format(action), field='action')
 
@@ -767,27 +1086,58 @@ def reqbyid_ext(request, req_id, tolist):
         # Get featreq fields
         fields = getfieldsfromget(request, empty=['id'], allowed=FeatureReq.fields)
 
+        binary = bool(req_is_binary(request))
+
+        # Get related objects to expand
+        try:
+            expand = getexpand(request)
+        except ValueError as e:
+            return badrequest(request, e, 'expand')
+
         # Get featreq dict
-        frdict = featreq.jsondict(fields)
+        frdict = featreq.jsondict(fields, binary=binary)
+
+        # Expanding the featreq itself adds any other fields asked for
+        if 'req' in expand:
+            reqdicts = recorddicts((featreq._meta.concrete_model,), [featreq.id], expand['req'], binary)
+            for fn, fv in reqdicts.get(featreq.id, {}).items():
+                frdict.setdefault(fn, fv)
+
+        # Archived featreqs have nothing open or closed in the main database
+        archived = isinstance(featreq, ArchivedFeatureReq)
+
+        # Link rows and their dicts, if clients are to be expanded
+        links = []
+
+        def _linklist(qset, linkfields):
+            if 'client' not in expand:
+                return qset_vals_tojsonlist(qset, linkfields.keys(), linkfields.values(), binary)
+            linklist = []
+            for rec in linkrecords(qset):
+                linkdict = rec.jsondict(linkfields.keys(), linkfields.values(), binary)
+                linklist.append(linkdict)
+                links.append((linkdict, rec))
+            return linklist
 
         # Get open if requested
         if listopen:
-            frdict['open_list'] = qset_vals_tojsonlist(
-                featreq.open_list,
-                openreq_byreq_fields.keys(),
-                openreq_byreq_fields.values()
-            )
+            frdict['open_list'] = [] if archived else _linklist(featreq.open_list.all(), openreq_byreq_fields)
 
         # Get closed if requested
         if listclosed:
-            frdict['closed_list'] = qset_vals_tojsonlist(
-                featreq.closed_list,
-                closedreq_byreq_fields.keys(),
-                closedreq_byreq_fields.values()
-            )
+            frdict['closed_list'] = [] if archived else _linklist(featreq.closed_list.all(), closedreq_byreq_fields)
+            if getincludearchived(request):
+                frdict['closed_list'].extend(_linklist(
+                    ArchivedClosedReq.objects.filter(req_id=featreq.id).order_by('id'),
+                    closedreq_byreq_fields
+                ))
+
+        # Expand clients (each read once, in one query)
+        if 'client' in expand:
+            expandlinks(request, links, 'client', expand['client'])
 
-        # Return dict as JSON
-        return HttpResponse(json.dumps({'req': frdict}, indent=1)+'\n', content_type=json_contype)
+        # Return dict as JSON (or binary)
+        return dataresponse(request, {'req': frdict})
 
     @allow_methods(['GET'])
     def _openext(request, featreq):
@@ -846,7 +1196,7 @@ def reqbyid_ext(request, req_id, tolist):
 
                 # Now attempt to attach
                 try:
-                    OpenReq.objects.attachreq(**postargs)
+                    notedwrite(request, OpenReq.objects.attachreq, **postargs)
                 except Exception as e:
                     return badrequest(request, e)
 
@@ -871,18 +1221,27 @@ def reqbyid_ext(request, req_id, tolist):
                     if fn not in {'priority', 'date_tgt'}:
                         del postargs[fn]
 
-                # Add openreq
+                # Add openreq, and version it must still be at, if given
                 postargs['openreq'] = oreq
+                try:
+                    postargs['version'] = getifmatch(request)
+                except ValueError as e:
+                    return badrequest(request, e)
 
                 # Now attempt to update
                 try:
-                    OpenReq.objects.updatereq(**postargs)
+                    oreq = notedwrite(request, OpenReq.objects.updatereq, **postargs)
+                except VersionConflict as e:
+                    return conflict(request, e, {'version': oreq.version})
                 except Exception as e:
                     return badrequest(request, e)
 
                 # Made it this far, good to go
-                # Return updated view
-                return _getext(request, featreq, listopen=True, listclosed=True)
+                # Return updated view, with the open request's new version
+                resp = _getext(request, featreq, listopen=True, listclosed=True)
+                if resp.status_code == 200:
+                    resp['ETag'] = versionetag(oreq.version)
+                return resp
 
             elif action == 'close':
                 # Check if client specified
@@ -910,7 +1269,7 @@ def reqbyid_ext(request, req_id, tolist):
 
                 # Now attempt to close
                 try:
-                    ClosedReq.objects.closereq(**postargs)
+                    notedwrite(request, ClosedReq.objects.closereq, **postargs)
                 except Exception as e:
                     return badrequest(request, e)
 
@@ -922,9 +1281,21 @@ def reqbyid_ext(request, req_id, tolist):
                 return badrequest(request, 'Invalid action "{0}"'.format(action), field='action')
 
     # Get selected featreq
+    # For reads, only load the fields which will be returned; writes get the
+    # full instance, since the write paths touch other fields
+    qset = FeatureReq.objects
+    if request.method == 'GET':
+        fields = getfieldsfromget(request, empty=['id'], allowed=FeatureReq.fields)
+        # (None or empty means all fields)
+        qset = qset.only(*fields) if fields else qset.withdesc()
     try:
-        fr = FeatureReq.objects.get(id=req_id)
+        fr = qset.get(id=req_id)
     except ObjectDoesNotExist:
+        fr = None
+        # Archived featreqs can still be read, if asked for
+        if request.method == 'GET' and getincludearchived(request):
+            fr = ArchivedFeatureReq.objects.filter(id=req_id).first()
+    if fr is None:
         return HttpResponseNotFound(json404str, content_type=json_contype)
     else:
         # Forward to appropriate inner function
@@ -944,21 +1315,36 @@ def reqredir(request, req_id):
     else:
         return HttpResponseNotFound(json404str, content_type=json_contype)
 
+@coalesce
 @makepretty
 @auth_required
 @allow_methods(['GET', 'POST'])
 def clientindex(request):
     # TODO: add filter options, additional field options
     if request.method == 'GET':
+        # Get listed clients only, if ids given
+        if 'ids' in request.GET:
+            try:
+                ids = parseids(request.GET.getlist('ids'))
+            except ValueError as e:
+                return badrequest(request, e, 'ids')
+            fields = getfieldsfromget(request, allowed=ClientInfo.fields)
+            return multiget(request, (ClientInfo,), ids, fields, 'client')
+
         # Get JSON-compat dicts for all clients
         # Get client id, name, and open/closed counts
         clqset = ClientInfo.objects.annotate(
             open_count=Count('open_list', distinct=True), 
             closed_count=Count('closed_list', distinct=True))
-        cllist = qset_vals_tojsonlist(clqset, client_with_counts_dict.keys(), client_with_counts_dict.values())
+        cllist = qset_vals_tojsonlist(
+            clqset,
+            client_with_counts_dict.keys(),
+            client_with_counts_dict.values(),
+            bool(req_is_binary(request))
+        )
         # Construct response
-        respdict = OrderedDict([('client_count', len(cllist)), ('client_list', cllist)])
-        return HttpResponse(json.dumps(respdict, indent=1)+'\n', content_type=json_contype)
+        respdict = ordereddict([('client_count', len(cllist)), ('client_list', cllist)])
+        return dataresponse(request, respdict)
 
     elif request.method == 'POST':
         # Get user
@@ -967,29 +1353,43 @@ def clientindex(request):
 
         # Get args
         try:
-            # TODO: remove title and desc from required if any additional
-            # actions get defined
             postargs = getargsfrompost(request,
-                fieldnames=('action', 'name', 'con_name', 'con_mail', 'id'),
-                required={'action', 'name'}
+                fieldnames=('action', 'name', 'con_name', 'con_mail', 'id', 'ids', 'fields'),
+                required={'action'},
+                aslist={'ids', 'fields'}
             )
         except ValueError as e:
             return badrequest(request, e)
 
         # Update request
         action = postargs.pop('action').lower()
-        if action == 'create':
+        if action == 'get':
+            # Multi-get, for id lists too long for a query string
+            try:
+                ids = parseids(postargs.get('ids', ()))
+            except ValueError as e:
+                return badrequest(request, e, 'ids')
+            fields = [ fn for fv in postargs.get('fields', ()) for fn in str(fv).split(',') if fn in ClientInfo.fields ]
+            return multiget(request, (ClientInfo,), ids, fields, 'client')
+
+        elif action == 'create':
+            if 'name' not in postargs:
+                return badrequest(request, 'Required field name missing')
+            # (Multi-get args don't apply)
+            postargs.pop('ids', None)
+            postargs.pop('fields', None)
+
             # User not recorded by newclient() at present
             # postargs['user'] = username
             # postargs.move_to_end('user', last=False)
 
             # Attempt client creation and return new featreq or error
             try:
-                cl = ClientInfo.objects.newclient(**postargs)
+                cl = notedwrite(request, ClientInfo.objects.newclient, **postargs)
             except Exception as e:
                 return badrequest(request, e)
             else:
-                resp = HttpResponse(json.dumps({'client': cl.jsondict()}, indent=1)+'\n', status=201, content_type=json_contype)
+                resp = dataresponse(request, {'client': cl.jsondict(binary=bool(req_is_binary(request)))}, status=201)
                 resp['Location'] = urlreverse('featreq-client-byid', kwargs={'client_id':cl.id})
                 return resp
         else:
@@ -1007,8 +1407,8 @@ def clientbyid(request, client_id):
         return HttpResponseNotFound(json404str, content_type=json_contype)
     else:
         if request.method == 'GET':
-            # Return (ordered) dict as JSON
-            return HttpResponse(json.dumps({'client': cl.jsondict()}, indent=1)+'\n', content_type=json_contype)
+            # Return (ordered) dict as JSON (or binary)
+            return dataresponse(request, {'client': cl.jsondict(binary=bool(req_is_binary(request)))})
 
         elif request.method == 'POST':
             # User not recorded by updateclient() at present
@@ -1029,11 +1429,11 @@ def clientbyid(request, client_id):
             if action == 'update':
                 # Attempt update and return client details or error
                 try:
-                    cl = cl.updateclient(**postargs)
+                    cl = notedwrite(request, cl.updateclient, **postargs)
                 except Exception as e:
                     return badrequest(request, e)
                 else:
-                    return HttpResponse(json.dumps({'client': cl.jsondict()}, indent=1)+'\n', content_type=json_contype)
+                    return dataresponse(request, {'client': cl.jsondict(binary=bool(req_is_binary(request)))})
             else:
                 return badrequest(request, 'Invalid action "{0}"'.format(action), field='action')
 
@@ -1047,6 +1447,7 @@ def clientredir(request, client_id):
     else:
         return HttpResponseNotFound(json404str, content_type=json_contype)
 
+@coalesce
 @makepretty
 @auth_required
 def clientreqindex(request, client_id, tolist):
@@ -1059,34 +1460,67 @@ def clientreqindex(request, client_id, tolist):
         fields = getfieldsfromget(
             request,
             empty=None,
-            allfields=FeatureReq.fields.keys(),
+            allfields=defaultfields(FeatureReq),
             allowed=FeatureReq.fields
         )
 
-        respdict = OrderedDict([('id', client_id)])
+        binary = bool(req_is_binary(request))
+        respdict = ordereddict([('id', uuidbytes(client_id) if binary else client_id)])
+        client_uid = validuuid(client_id, version=None)
+
+        # Get related objects to expand
+        try:
+            expand = getexpand(request)
+        except ValueError as e:
+            return badrequest(request, e, 'expand')
+
+        # Expanding the client itself adds its fields
+        if 'client' in expand:
+            clientdicts = recorddicts((ClientInfo,), [client_uid], expand['client'], binary)
+            for fn, fv in clientdicts.get(client_uid, {}).items():
+                respdict.setdefault(fn, fv)
+
+        # Featreqs expanded are read once each, in one query, after the
+        # lists (with req_fields, or otherwise fields, as the fields), rather
+        # than joined to every row
+        expandreq = 'req' in expand
+        if expandreq:
+            reqfields = expand['req'] or fields
+            fields = None
+        links = []
 
         # Get open, if requested
         if listopen:
             oreqlist = []
-            # Get open reqs for client
-            qset = OpenReq.objects.filter(client_id=client_id)
+            # Get open reqs for client (or those due, if asked)
+            try:
+                before = getopenbefore(request)
+            except ValueError as e:
+                return badrequest(request, e, 'due_before')
 
-            # Only fetch related featreq if details requested
-            if fields:
-                qset = qset.select_related('req')
+            # From the read model if enabled, or otherwise only fetching
+            # related featreq if details requested, and then only the
+            # fields requested
+            qset = openrecords(client_uid, before, fields or ()) if client_uid else None
+            if qset is None:
+                qset = openqset(before, client_id)
+                qset = linkrecords(qset, 'req', fields) if fields else linkrecords(qset)
 
             for oreq in qset:
                 # Get JSON-compat dict
                 oreqdict = oreq.jsondict(
                     fields=openreq_byclient_fields.keys(), 
-                    fcalls=openreq_byclient_fields.values()
+                    fcalls=openreq_byclient_fields.values(),
+                    binary=binary
                 )
 
-                if fields:
+                if expandreq:
+                    links.append((oreqdict, oreq))
+                elif fields:
                     # Remove redundant req_id
                     del oreqdict['req_id']
                     # Add featreq details (with specified fields)
-                    oreqdict['req'] = oreq.req.jsondict(fields)
+                    oreqdict['req'] = oreq.req.jsondict(fields, binary=binary)
                     # TODO: move to front?
                 else:
                     # Move req_id into req sub-object
@@ -1104,22 +1538,25 @@ def clientreqindex(request, client_id, tolist):
             # Get closed reqs for client
             qset = ClosedReq.objects.filter(client_id=client_id)
 
-            # Only fetch related featreq if details requested
-            if fields:
-                qset = qset.select_related('req')
+            # Only fetch related featreq if details requested, and then
+            # only the fields requested
+            qset = linkrecords(qset, 'req', fields) if fields else linkrecords(qset)
 
             for creq in qset:
                 # Get JSON-compat dict
                 creqdict = creq.jsondict(
                     fields=closedreq_byclient_fields.keys(), 
-                    fcalls=closedreq_byclient_fields.values()
+                    fcalls=closedreq_byclient_fields.values(),
+                    binary=binary
                 )
 
-                if fields:
+                if expandreq:
+                    links.append((creqdict, creq))
+                elif fields:
                     # Remove redundant req_id
                     del creqdict['req_id']
                     # Add featreq details (with specified fields)
-                    creqdict['req'] = creq.req.jsondict(fields)
+                    creqdict['req'] = creq.req.jsondict(fields, binary=binary)
                     # TODO: move to front?
                 else:
                     # Move req_id into req sub-object
@@ -1128,10 +1565,43 @@ def clientreqindex(request, client_id, tolist):
 
                 creqlist.append(creqdict)
 
+            # Get archived closed reqs for client too, if requested (a batch
+            # at a time, fetching featreqs for each)
+            if getincludearchived(request):
+                acreqbatches = batchesbyid(ArchivedClosedReq.objects.filter(client_id=client_id), IN_QUERY_CHUNK)
+                for acreqlist in acreqbatches:
+                    if fields:
+                        frdicts = recorddicts((FeatureReq, ArchivedFeatureReq),
+                            { acreq.req_id for acreq in acreqlist }, fields, binary, withid=False)
+                    for acreq in acreqlist:
+                        creqdict = acreq.jsondict(
+                            fields=closedreq_byclient_fields.keys(),
+                            fcalls=closedreq_byclient_fields.values(),
+                            binary=binary
+                        )
+                        if expandreq:
+                            creqlist.append(creqdict)
+                            links.append((creqdict, acreq))
+                            continue
+                        req_id = creqdict.pop('req_id')
+                        if fields:
+                            try:
+                                creqdict['req'] = frdicts[acreq.req_id]
+                            except KeyError:
+                                # Featreq deleted outright
+                                continue
+                        else:
+                            creqdict['req'] = {'id': req_id}
+                        creqlist.append(creqdict)
+
             # Add to response
             respdict['closed_list'] = creqlist
 
-        return HttpResponse(json.dumps({'client': respdict}, indent=1)+'\n', content_type=json_contype)
+        # Expand featreqs
+        if expandreq:
+            expandlinks(request, links, 'req', reqfields)
+
+        return dataresponse(request, {'client': respdict})
 
     @allow_methods(['GET', 'POST'])
     def _openindex(request, client_id):
@@ -1177,7 +1647,7 @@ def clientreqindex(request, client_id, tolist):
 
                 # Now attempt to attach
                 try:
-                    OpenReq.objects.attachreq(**postargs)
+                    notedwrite(request, OpenReq.objects.attachreq, **postargs)
                 except Exception as e:
                     return badrequest(request, e)
 
@@ -1197,18 +1667,27 @@ def clientreqindex(request, client_id, tolist):
                     if fn not in {'priority', 'date_tgt'}:
                         del postargs[fn]
 
-                # Add openreq
+                # Add openreq, and version it must still be at, if given
                 postargs['openreq'] = oreq
+                try:
+                    postargs['version'] = getifmatch(request)
+                except ValueError as e:
+                    return badrequest(request, e)
 
                 # Now attempt to update
                 try:
-                    OpenReq.objects.updatereq(**postargs)
+                    oreq = notedwrite(request, OpenReq.objects.updatereq, **postargs)
+                except VersionConflict as e:
+                    return conflict(request, e, {'version': oreq.version})
                 except Exception as e:
                     return badrequest(request, e)
 
                 # Made it this far, good to go
-                # Return updated view
-                return _getindex(request, client_id, listopen=True)
+                # Return updated view, with the open request's new version
+                resp = _getindex(request, client_id, listopen=True)
+                if resp.status_code == 200:
+                    resp['ETag'] = versionetag(oreq.version)
+                return resp
 
             elif action == 'close':
                 # Check req_id is in open list for this client
@@ -1232,7 +1711,7 @@ def clientreqindex(request, client_id, tolist):
 
                 # Now attempt to close
                 try:
-                    ClosedReq.objects.closereq(**postargs)
+                    notedwrite(request, ClosedReq.objects.closereq, **postargs)
                 except Exception as e:
                     return badrequest(request, e)
 
@@ -1264,3 +1743,308 @@ def clientreqindex(request, client_id, tolist):
         elif tolist == 'all':
             return _allindex(request, client_id)
 
+@auth_required
+@allow_methods(['GET'])
+def events(request):
+    '''Server-sent events change stream. Under WSGI, sends any events pending
+    since the Last-Event-ID header (or since parameter) and closes, with a
+    retry directive so the browser reconnects and picks up from there. The
+    ASGI application in events.py serves the same stream over long-lived
+    connections.
+    '''
+    # Imported here, since events.py brings in asyncio, which WSGI workers
+    # otherwise have no use for
+    from .events import ssemessage, sseretry, parselastid, EVENT_CONTYPE, EVENT_BATCH
+    lastid = parselastid(request.META.get('HTTP_LAST_EVENT_ID'))
+    if lastid is None:
+        since = getfieldsfromget(request, empty=None, fieldsep=None, fieldname='since', allfieldname=None)
+        if since:
+            lastid = parselastid(since[0])
+
+    chunks = [sseretry()]
+    if lastid is None:
+        # New stream, so start from the present
+        lastid = ChangeEvent.objects.lastid()
+        evlist = []
+    else:
+        evlist = list(ChangeEvent.objects.since(lastid, EVENT_BATCH))
+
+    if evlist:
+        chunks.extend(ssemessage(ev) for ev in evlist)
+    else:
+        # Keep client's position (an id with no data sets it without
+        # dispatching an event)
+        chunks.append('id: {0}\n\n'.format(lastid).encode('utf-8'))
+
+    resp = HttpResponse(b''.join(chunks), content_type=EVENT_CONTYPE)
+    resp['Cache-Control'] = 'no-cache'
+    return resp
+
+@makepretty
+@auth_required
+@allow_methods(['GET'])
+def stats(request):
+    '''Returns open/closed/overdue counts and median time to close, from
+    the rollup tables.
+    '''
+    return dataresponse(request, {'stats': getstats(binary=bool(req_is_binary(request)))})
+
+@makepretty
+@auth_required
+@allow_methods(['GET'])
+def analytics(request):
+    '''Returns closed request lead time, target date slippage and priority
+    churn, grouped by the dimensions in parameter group. Results are cached
+    for IWS_ANALYTICS_CACHE seconds per grouping.
+    '''
+    try:
+        group = parsegroup(request.GET.get('group', ','.join(GROUP_DIMS)))
+    except ValueError as e:
+        return badrequest(request, e, 'group')
+
+    cachekey = 'featreq-analytics:' + ','.join(group)
+    result = cache.get(cachekey)
+    if result is None:
+        try:
+            metrics, rowcount = closedmetrics(group)
+        except ValueError as e:
+            return badrequest(request, e)
+        result = ordereddict([
+            ('computed_at', approxnow().strftime(DATETIMEFMT)),
+            ('row_count', rowcount),
+            ('group', list(group)),
+            ('metrics', metrics),
+        ])
+        cache.set(cachekey, result, ANALYTICS_CACHE)
+
+    return dataresponse(request, {'analytics': result})
+
+@auth_required
+@allow_methods(['GET'])
+def export(request):
+    '''Streams export of types in parameter types (default all) in format
+    given by parameter format (ndjson or csv), gzipped if parameter gzip is
+    set. See export.py.
+    '''
+    fmt = request.GET.get('format', 'ndjson')
+    gzip = request.GET.get('gzip', '').lower() in ('1', 'true')
+    try:
+        types = parsetypes(request.GET.get('types', ''))
+        chunks = exportstream(types, fmt, gzip)
+    except ValueError as e:
+        return badrequest(request, e)
+
+    filename = 'featreq-{0}.{1}'.format(approxnow().strftime('%Y%m%dT%H%M%SZ'), fmt)
+    if gzip:
+        filename += '.gz'
+    resp = StreamingHttpResponse(chunks, content_type=exportcontype(fmt, gzip))
+    resp['Content-Disposition'] = 'attachment; filename="{0}"'.format(filename)
+    return resp
+
+def getnextupargs(request):
+    '''Returns tuple of (OpenReq QuerySet, featreq fields, client ids or
+    None for all) from query string in request, for the next-up views.
+    Raises ValueError for invalid client ids or due_before.
+    '''
+    fields = getfieldsfromget(
+        request,
+        empty=None,
+        allfields=defaultfields(FeatureReq),
+        allowed=FeatureReq.fields
+    )
+    qset = getopenqset(request)
+    # Only fetch related featreq if details requested, as in clientreqindex
+    # (always including id, since requests aren't otherwise identified)
+    if fields:
+        fields = list(fields)
+        if 'id' not in fields:
+            fields.insert(0, 'id')
+        qset = linkprojection(qset, fields)
+
+    client_ids = None
+    clientstr = request.GET.get('client_id')
+    if clientstr:
+        client_ids = []
+        for cid in clientstr.split(','):
+            uid = validuuid(cid)
+            if not uid:
+                raise ValueError('Invalid client_id: {0}'.format(cid))
+            client_ids.append(uid)
+    return qset, fields, client_ids
+
+def nextupdict(oreq, fields, binary=False):
+    '''Returns JSON-compatible dict of open request oreq for the next-up
+    views, with featreq fields (or only id) as sub-object req.
+    '''
+    oreqdict = oreq.jsondict(binary=binary)
+    req_id = oreqdict.pop('req_id')
+    oreqdict['req'] = oreq.req.jsondict(fields, binary=binary) if fields else {'id': req_id}
+    return oreqdict
+
+@makepretty
+@auth_required
+@allow_methods(['GET'])
+def nextup(request):
+    '''Returns the first k (parameter k) prioritized open requests of each
+    client (or of clients in parameter client_id), in priority order.
+    '''
+    try:
+        k = int(request.GET.get('k', NEXTUP_K))
+    except ValueError:
+        return badrequest(request, 'Invalid k: {0}'.format(request.GET.get('k')), 'k')
+    k = max(1, min(k, NEXTUP_K_MAX))
+    try:
+        qset, fields, client_ids = getnextupargs(request)
+    except ValueError as e:
+        return badrequest(request, e)
+
+    binary = bool(req_is_binary(request))
+    clientlist = [ ordereddict([
+            ('client_id', uuidbytes(client_id) if binary else str(client_id)),
+            ('open_list', [ nextupdict(oreq, fields, binary) for oreq in oreqlist ]),
+        ]) for client_id, oreqlist in topk(qset, k, client_ids) ]
+    return dataresponse(request, {'nextup': ordereddict([('k', k), ('client_list', clientlist)])})
+
+@makepretty
+@auth_required
+@allow_methods(['GET'])
+def nextupqueue(request):
+    '''Returns page of prioritized open requests across all clients (or
+    clients in parameter client_id), in order of priority, then target
+    date, of at most limit requests, after cursor given in parameter after,
+    plus the cursor for the next page.
+    '''
+    try:
+        limit = int(request.GET.get('limit', QUEUE_LIMIT))
+    except ValueError:
+        return badrequest(request, 'Invalid limit: {0}'.format(request.GET.get('limit')), 'limit')
+    limit = max(1, min(limit, QUEUE_LIMIT_MAX))
+    after = request.GET.get('after')
+    try:
+        after = parsecursor(after) if after else None
+    except ValueError as e:
+        return badrequest(request, e, 'after')
+    try:
+        qset, fields, client_ids = getnextupargs(request)
+    except ValueError as e:
+        return badrequest(request, e)
+
+    binary = bool(req_is_binary(request))
+    page, cursor = queuepage(qset, limit, after, client_ids)
+    return dataresponse(request, {'queue': ordereddict([
+        ('open_list', [ nextupdict(oreq, fields, binary) for oreq in page ]),
+        ('cursor', cursor),
+        ('more', cursor is not None),
+    ])})
+
+@makepretty
+@auth_required
+@allow_methods(['GET'])
+def changes(request):
+    '''Incremental sync: returns current state of all clients, requests,
+    and open/closed requests changed or deleted after cursor given in
+    parameter since, reading at most limit change events, plus the cursor
+    to use for the next call.
+    '''
+    # Get cursor and page size
+    try:
+        since = int(request.GET.get('since', 0))
+        limit = int(request.GET.get('limit', CHANGES_LIMIT))
+    except ValueError as e:
+        return badrequest(request, 'Invalid since or limit: {0}'.format(str(e)))
+    if since < 0:
+        return badrequest(request, 'Invalid since: {0}'.format(since), 'since')
+    limit = max(1, min(limit, CHANGES_LIMIT_MAX))
+
+    # Get requested featreq fields (all by default, as sync clients want
+    # everything)
+    fields = getfieldsfromget(
+        request,
+        empty=list(defaultfields(FeatureReq)),
+        allfields=list(defaultfields(FeatureReq)),
+        allowed=FeatureReq.fields
+    )
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+
+    # Collapse events into sets of entities touched (in event order, so a
+    # later delete cancels an earlier change and vice versa)
+    evlist = list(ChangeEvent.objects.since(since, limit).values_list('id', 'kind', 'client_id', 'req_id', 'data'))
+    req_ids = ordereddict()
+    client_ids = ordereddict()
+    open_keys = ordereddict()
+    # Closed requests by (client, req, closed_at), as event payloads
+    closed_reqs = ordereddict()
+    del_reqs = ordereddict()
+    del_clients = ordereddict()
+    del_open = ordereddict()
+    del_closed = []
+
+    for evid, kind, client_id, req_id, data in evlist:
+        if kind == 'req_created' or kind == 'req_updated':
+            req_ids[str(req_id)] = None
+            del_reqs.pop(str(req_id), None)
+        elif kind == 'client_changed':
+            client_ids[str(client_id)] = None
+            del_clients.pop(str(client_id), None)
+        elif kind == 'opened' or kind == 'open_updated':
+            key = (str(client_id), str(req_id))
+            open_keys[key] = None
+            del_open.pop(key, None)
+        elif kind == 'reprioritized':
+            for pri_req_id, pri in jsonloads(data)['priorities']:
+                open_keys[(str(client_id), pri_req_id)] = None
+        elif kind == 'closed':
+            # Closing removes the open request
+            key = (str(client_id), str(req_id))
+            open_keys.pop(key, None)
+            del_open[key] = None
+            creq = jsonloads(data)
+            creq.pop('req', None)
+            closed_reqs[(creq['client_id'], creq['req_id'], creq['closed_at'])] = creq
+        elif kind == 'req_deleted':
+            req_ids.pop(str(req_id), None)
+            del_reqs[str(req_id)] = None
+        elif kind == 'client_deleted':
+            client_ids.pop(str(client_id), None)
+            del_clients[str(client_id)] = None
+        elif kind == 'open_deleted':
+            key = (str(client_id), str(req_id))
+            open_keys.pop(key, None)
+            del_open[key] = None
+        elif kind == 'closed_deleted':
+            dcreq = jsonloads(data)
+            closed_reqs.pop((dcreq['client_id'], dcreq['req_id'], dcreq['closed_at']), None)
+            del_closed.append(dcreq)
+
+    # Fetch current state of changed entities
+    frlist = []
+    for qset in qset_byids(FeatureReq.objects, req_ids):
+        frlist.extend(qset_vals_tojsonlist(qset, fields))
+    cllist = []
+    for qset in qset_byids(ClientInfo.objects, client_ids):
+        cllist.extend(qset_vals_tojsonlist(qset))
+    oreqlist = []
+    for qset in qset_byids(OpenReq.objects, set(r for c, r in open_keys), 'req_id'):
+        oreqlist.extend(oreq for oreq in qset_vals_tojsonlist(qset)
+            if (oreq['client_id'], oreq['req_id']) in open_keys)
+
+    # New cursor is last event read (or unchanged if nothing new)
+    cursor = evlist[-1][0] if evlist else since
+
+    respdict = ordereddict([
+        ('since', since),
+        ('cursor', cursor),
+        ('more', len(evlist) == limit),
+        ('req_list', frlist),
+        ('client_list', cllist),
+        ('open_list', oreqlist),
+        ('closed_list', list(closed_reqs.values())),
+        ('deleted', ordereddict([
+            ('req_list', list(del_reqs)),
+            ('client_list', list(del_clients)),
+            ('open_list', [ ordereddict([('client_id', c), ('req_id', r)]) for c, r in del_open ]),
+            ('closed_list', del_closed),
+        ])),
+    ])
+    return HttpResponse(jsondumps(respdict, req_json_pretty(request)), content_type=json_contype)
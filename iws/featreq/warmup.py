@@ -0,0 +1,97 @@
+import logging, time
+from collections import OrderedDict
+from django.conf import settings
+from django.db import connections
+
+## Worker warmup
+# uWSGI loads the application once in its master process and forks the
+# workers from it (unless lazy-apps is set), and forks replacements each
+# time a worker is recycled (max-requests). Anything loaded before the
+# fork is shared copy-on-write by every worker, and isn't loaded again on
+# recycling, so warmup() (called from iws/wsgi.py) loads everything the
+# first request would otherwise pay for: view modules, URL patterns,
+# templates (kept by the cached template loader), translations, codecs,
+# lookup tables and the open request read model, if enabled.
+#
+# Database connections mustn't cross a fork (SQLite's especially), so the
+# first query (which loads the schema) is run and the connection closed
+# again; workers open their own on first use, which is cheap once the
+# database file is in the page cache.
+
+logger = logging.getLogger('featreq.warmup')
+
+WARMUP_TEMPLATES = ('featreq/json.html', 'featreq/login.html')
+
+def _importviews():
+    from importlib import import_module
+    import_module(settings.ROOT_URLCONF)
+    from . import views, admin
+
+def _compileurls():
+    from django.core.urlresolvers import get_resolver
+    # Populating reverse lookups compiles every pattern
+    get_resolver(None).reverse_dict
+
+def _loadtemplates():
+    from django.template.loader import get_template
+    from django.utils import translation
+    for name in WARMUP_TEMPLATES:
+        get_template(name)
+    translation.activate(settings.LANGUAGE_CODE)
+    translation.deactivate()
+
+def _primecodecs():
+    from .codec import jsondumps, jsonloads, binarydumps, BINARY_CODECS
+    from .models import FeatureReq, OpenReq, ClosedReq, ClientInfo, prodareas
+    sample = {'warmup': [1, 'x', None]}
+    jsonloads(jsondumps(sample))
+    for contype in BINARY_CODECS:
+        binarydumps(sample, contype)
+    prodareas()
+    # Field lookups used by jsondict()/values() (desc is a property, see
+    # FeatureReqDesc)
+    for model in (FeatureReq, OpenReq, ClosedReq, ClientInfo):
+        for fname in model.fields:
+            if fname not in getattr(model, 'lookups', {}):
+                model._meta.get_field(fname)
+
+def _loadreadmodel():
+    from .readmodel import getopenmodel, READ_MODEL
+    if READ_MODEL:
+        getopenmodel().load()
+
+def _firstquery():
+    from .models import FeatureReq, ChangeEvent
+    FeatureReq.objects.only('id').first()
+    ChangeEvent.objects.lastid()
+    connections.close_all()
+
+WARMUP_STEPS = OrderedDict([
+    ('views', _importviews),
+    ('urls', _compileurls),
+    ('templates', _loadtemplates),
+    ('codecs', _primecodecs),
+    ('readmodel', _loadreadmodel),
+    ('database', _firstquery),
+])
+
+def warmup():
+    '''Loads everything a first request would, and closes any database
+    connections opened doing so. Failing steps are logged and skipped.
+
+    Returns dict of seconds taken per step.
+    '''
+    timings = OrderedDict()
+    for name, func in WARMUP_STEPS.items():
+        start = time.perf_counter()
+        try:
+            func()
+        except Exception:
+            # Not worth failing startup over; the first request will
+            # report the problem properly
+            logger.exception('Warmup step %s failed', name)
+        timings[name] = time.perf_counter() - start
+    connections.close_all()
+    logger.info('Warmed up in %.3fs (%s)', sum(timings.values()),
+        ', '.join('{0} {1:.3f}s'.format(name, secs) for name, secs in timings.items()))
+    return timings
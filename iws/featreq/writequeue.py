@@ -0,0 +1,134 @@
+import os, queue, threading, time
+from concurrent.futures import Future
+from django.conf import settings
+from django.db import connection, transaction
+
+## Group-commit write queue
+# SQLite allows one writer at a time, and every commit waits on an fsync,
+# so many small write transactions from concurrent workers queue up on the
+# database lock (failing with "database is locked" once they've waited
+# past the timeout). With IWS_WRITE_QUEUE set, manager calls made through
+# queuedwrite() are handed to one writer thread per process, which runs
+# whatever arrives within IWS_WRITE_WINDOW milliseconds (up to
+# IWS_WRITE_BATCH calls) in a single shared transaction, each call in its
+# own savepoint. A call which raises only rolls back its own savepoint,
+# and its exception is re-raised in the caller; results are only handed
+# back once the shared transaction has committed.
+#
+# Only calls made from threads of the same process can share a commit, so
+# under uWSGI this wants worker threads (the threads option) rather than
+# many single-threaded processes.
+
+WRITE_QUEUE = getattr(settings, 'IWS_WRITE_QUEUE', False)
+# Milliseconds to gather calls after the first arrives
+WRITE_WINDOW = getattr(settings, 'IWS_WRITE_WINDOW', 2)
+# Max calls per shared transaction
+WRITE_BATCH = getattr(settings, 'IWS_WRITE_BATCH', 100)
+
+class WriteQueue(object):
+    """Writer thread running queued calls in shared transactions"""
+
+    def __init__(self, window=WRITE_WINDOW, batch=WRITE_BATCH):
+        if batch < 1:
+            raise ValueError('Invalid batch size: {0}'.format(batch))
+        self.window = window / 1000
+        self.batch = batch
+        self.pending = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        # Totals, for benchmarks and monitoring
+        self.calls = 0
+        self.commits = 0
+
+    def start(self):
+        '''Starts writer thread, if not already running'''
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='featreq-writer', daemon=True)
+                self.thread.start()
+
+    def submit(self, func, *args, **kwargs):
+        '''Queues call func(*args, **kwargs), returning a Future for its
+        result (set once committed).
+        '''
+        fut = Future()
+        self.start()
+        self.pending.put((fut, func, args, kwargs))
+        return fut
+
+    def call(self, func, *args, **kwargs):
+        '''Queues call func(*args, **kwargs) and waits for it to commit.
+        Returns its result, or raises its exception.
+        '''
+        return self.submit(func, *args, **kwargs).result()
+
+    def _gather(self):
+        '''Returns list of queued calls, waiting for the first, then taking
+        whatever else arrives within the window.
+        '''
+        items = [ self.pending.get() ]
+        deadline = time.perf_counter() + self.window
+        while len(items) < self.batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self.pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            self.commit(self._gather())
+
+    def commit(self, items):
+        '''Runs calls items (list of (future, func, args, kwargs) tuples) in
+        one transaction, then sets each future's result or exception.
+        '''
+        outcomes = []
+        try:
+            with transaction.atomic():
+                for fut, func, args, kwargs in items:
+                    try:
+                        with transaction.atomic():
+                            outcomes.append((fut, func(*args, **kwargs), None))
+                    except Exception as e:
+                        outcomes.append((fut, None, e))
+        except Exception as e:
+            # Commit failed, so none of it happened
+            for fut, func, args, kwargs in items:
+                fut.set_exception(e)
+            connection.close_if_unusable_or_obsolete()
+            return
+        self.calls += len(items)
+        self.commits += 1
+        for fut, result, exc in outcomes:
+            if exc is None:
+                fut.set_result(result)
+            else:
+                fut.set_exception(exc)
+
+
+# Per-process queue (replaced after fork, since threads don't survive it)
+_writequeue = None
+_writepid = None
+_writelock = threading.Lock()
+
+def getwritequeue():
+    '''Returns this process's write queue'''
+    global _writequeue, _writepid
+    with _writelock:
+        if _writequeue is None or _writepid != os.getpid():
+            _writequeue, _writepid = WriteQueue(), os.getpid()
+        return _writequeue
+
+def queuedwrite(func, *args, **kwargs):
+    '''Calls func(*args, **kwargs) through the write queue if enabled, or
+    directly if not. Returns its result, or raises its exception.
+    '''
+    # Calls made inside a transaction (including from the writer thread
+    # itself) can't wait on another one
+    if not WRITE_QUEUE or connection.in_atomic_block:
+        return func(*args, **kwargs)
+    return getwritequeue().call(func, *args, **kwargs)
@@ -0,0 +1,21 @@
+"""
+ASGI config for iws project.
+
+Serves the whole site: the /featreq/events/ change stream and /featreq/changes/
+long-polls are held open as coroutines, so thousands of idle connections cost
+a single process, and all other requests run through Django on a bounded pool
+of threads (see featreq/asyncapp.py), so slow list requests don't tie up a
+whole worker process each.
+
+Run with any ASGI server, for example:
+    uvicorn --app-dir /path/to/iws-demo/iws iws.asgi:application
+"""
+
+import os
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "iws.settings")
+django.setup()
+
+from featreq.asyncapp import application
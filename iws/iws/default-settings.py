@@ -61,7 +61,6 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates/')],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -69,6 +68,14 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Templates are parsed once per process (before workers fork,
+            # see featreq/warmup.py), so changes need a restart
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -136,3 +143,55 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static/')
 
 IWS_REQ_ADD_CHG_DESC = False
 
+# JSON backend: 'auto' picks the fastest installed (orjson, ujson, json)
+IWS_JSON_CODEC = 'auto'
+# Compact JSON responses by default, instead of indented (either can be
+# asked for per request with compact=1/0)
+IWS_JSON_COMPACT = False
+
+# Change event stream: client reconnect interval (ms) under WSGI, and
+# database poll/heartbeat intervals (s) and DB thread count under ASGI
+IWS_EVENTS_RETRY = 3000
+IWS_EVENTS_POLL = 0.5
+IWS_EVENTS_HEARTBEAT = 15
+IWS_ASGI_DB_THREADS = 4
+
+# Decompressed request descriptions cached per process
+IWS_DESC_CACHE = 256
+
+# Switch SQLite databases to write-ahead logging on first connection (see
+# featreq/db.py), so long reads (such as exports) don't hold off writes; set
+# False if the database is on a network filesystem, where WAL doesn't work
+IWS_SQLITE_WAL = True
+
+# Archive database for old closed requests (SQLite file path, or None to
+# disable); see `manage.py featreq_archive`
+IWS_ARCHIVE_DB = None
+
+# Seconds /featreq/analytics/ results are cached for (per grouping)
+IWS_ANALYTICS_CACHE = 900
+
+# Group commit for API writes (see featreq/writequeue.py): milliseconds to
+# gather concurrent writes for, and max writes per shared transaction
+IWS_WRITE_QUEUE = False
+IWS_WRITE_WINDOW = 2
+IWS_WRITE_BATCH = 100
+
+# Identical concurrent GETs share one run of the view (see
+# featreq/coalesce.py), across processes too if set here (needs a shared
+# cache backend); seconds to wait on another process's run, and seconds
+# after a session writes during which its GETs aren't coalesced (so it
+# always reads its own writes)
+IWS_COALESCE_CACHE = False
+IWS_COALESCE_WAIT = 5
+IWS_COALESCE_AFTER_WRITE = 5
+
+# Serve open request lists from memory, per process (see
+# featreq/readmodel.py), and seconds between consistency checks against
+# the database
+IWS_OPEN_READMODEL = False
+IWS_OPEN_READMODEL_CHECK = 60
+
+# Load views, templates etc. when the WSGI application is loaded, so uWSGI
+# workers share them (see featreq/warmup.py)
+IWS_WARMUP = True
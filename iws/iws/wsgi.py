@@ -1,7 +1,9 @@
 """
 WSGI config for iws project.
 
-It exposes the WSGI callable as a module-level variable named ``application``.
+It exposes the WSGI callable as a module-level variable named ``application``,
+loading everything the first request would need up front (unless IWS_WARMUP is
+off), so uWSGI workers forked from the master share it (see featreq/warmup.py).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/1.9/howto/deployment/wsgi/
@@ -14,3 +16,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "iws.settings")
 
 application = get_wsgi_application()
+
+from django.conf import settings
+
+if getattr(settings, 'IWS_WARMUP', True):
+    from featreq.warmup import warmup
+    warmup()
@@ -126,12 +126,173 @@ iwsApp.config(['$httpProvider',function($httpProvider) {
 	$httpProvider.interceptors.push('errorInterceptor');
 }]);
 
-iwsApp.factory('clientListService', ['$http', function ($http) {
+iwsApp.factory('eventService', ['$rootScope', function ($rootScope) {
+	var eventurl = '/featreq/events/';
+	var kinds = ['req_created', 'req_updated', 'opened', 'open_updated', 'reprioritized', 'closed', 'client_changed'];
+	var source = null;
+	var status = {
+		live: false
+	};
+
+	$rootScope.$on('login_success', function (event, auth) {
+		connect();
+	});
+
+	$rootScope.$on('logged_out', function (event, auth) {
+		disconnect();
+	});
+
+	return {
+		status: status
+	};
+
+	function connect () {
+		// Already connected, or no browser support (lists will be refetched instead)
+		if ((source) || (!window.EventSource)) {
+			return;
+		}
+		source = new EventSource(eventurl);
+		for (var i = 0, len = kinds.length; i < len; i++) {
+			source.addEventListener(kinds[i], dispatch);
+		}
+		// Only live once actually connected (lists are refetched until then)
+		source.onopen = opened;
+		source.onerror = failed;
+	}
+
+	function opened () {
+		$rootScope.$applyAsync(function () {
+			status.live = true;
+		});
+	}
+
+	function failed (err) {
+		// Not live while down (changes may be missed); the browser reconnects
+		// by itself unless the stream is closed for good (eg 403 once the
+		// session expires), in which case drop it so connect() can try again
+		// (on next login)
+		var target = err.target;
+		if ((target.readyState === EventSource.CLOSED) && (source === target)) {
+			source = null;
+		}
+		$rootScope.$applyAsync(function () {
+			status.live = false;
+		});
+	}
+
+	function disconnect () {
+		if (source) {
+			source.close();
+			source = null;
+		}
+		status.live = false;
+	}
+
+	function dispatch (msg) {
+		// Rebroadcast as change_<kind> event for services to patch their state
+		var data = JSON.parse(msg.data);
+		$rootScope.$apply(function () {
+			$rootScope.$broadcast('change_' + msg.type, data);
+		});
+	}
+}]);
+
+iwsApp.factory('batchService', ['$http', '$q', '$timeout', function ($http, $q, $timeout) {
+	// Records asked for by id within the same turn are fetched together,
+	// through the multi-get form of the list endpoints
+	var maxget = 50;	// Ids per GET (longer lists are POSTed)
+	var maxids = 500;	// Ids per request
+
+	return {
+		fetcher: fetcher
+	};
+
+	function fetcher (url, name, fields) {
+		// Returns function taking an id and returning a promise for its record
+		var pending = iwsUtil.emptyobj();
+		var queued = false;
+
+		return function (id) {
+			if (!(id in pending)) {
+				pending[id] = $q.defer();
+			}
+			if (!queued) {
+				queued = true;
+				$timeout(flush, 0, false);
+			}
+			return pending[id].promise;
+		};
+
+		function flush () {
+			var batch = pending;
+			var ids = Object.keys(batch);
+			pending = iwsUtil.emptyobj();
+			queued = false;
+			for (var i = 0, len = ids.length; i < len; i += maxids) {
+				fetch(ids.slice(i, i + maxids), batch);
+			}
+		}
+
+		function fetch (ids, batch) {
+			var request;
+			if (ids.length > maxget) {
+				request = $http.post(url, {action: 'get', ids: ids, fields: fields || []});
+			}
+			else {
+				var params = {ids: ids.join(',')};
+				if (fields) {
+					params.fields = fields.join(',');
+				}
+				request = $http.get(url, {params: params});
+			}
+			request.then(function (response) {
+				var list = response.data[name + '_list'];
+				for (var i = 0, len = list.length; i < len; i++) {
+					var row = list[i];
+					if (row.id in batch) {
+						batch[row.id].resolve(row);
+						delete batch[row.id];
+					}
+				}
+				// Anything left wasn't found
+				rejectall(ids, batch, {status_code: 404, error: 'Resource not found'});
+			}, function (reason) {
+				rejectall(ids, batch, reason);
+			});
+		}
+
+		function rejectall (ids, batch, reason) {
+			for (var i = 0, len = ids.length; i < len; i++) {
+				if (ids[i] in batch) {
+					batch[ids[i]].reject(reason);
+					delete batch[ids[i]];
+				}
+			}
+		}
+	}
+}]);
+
+iwsApp.factory('clientListService', ['$http', '$rootScope', 'batchService', function ($http, $rootScope, batchService) {
 	var clienturl = '/featreq/client/';
 	var clients = iwsUtil.emptyobj();
 	var clients_byid = null;
+	// Names of clients not in the list (looked up in batches), by id
+	var getname = batchService.fetcher(clienturl, 'client', ['id', 'name']);
+	var names = iwsUtil.emptyobj();
 	clearclients();
 
+	$rootScope.$on('change_client_changed', function (event, data) {
+		patchclient(data);
+	});
+
+	$rootScope.$on('change_opened', function (event, data) {
+		patchcounts(data.client_id, 1, 0);
+	});
+
+	$rootScope.$on('change_closed', function (event, data) {
+		patchcounts(data.client_id, -1, 1);
+	});
+
 	return {
 		clients: clients,
 		getclients: getclients,
@@ -144,10 +305,7 @@ iwsApp.factory('clientListService', ['$http', function ($http) {
 		return $http.get(clienturl).then(function (response) {
 			var client_list = response.data.client_list;
 			if (client_list) {
-				client_list.sort(
-					function(a, b) {
-						return a.name.localeCompare(b.name);
-				});
+				client_list.sort(sortclients);
 			}
 			clients.list = client_list;
 
@@ -182,9 +340,18 @@ iwsApp.factory('clientListService', ['$http', function ($http) {
 		if (use_cl) {
 			return use_cl.name;
 		}
-		else {
+		else if (!use_id || use_id == '_all') {
 			return '';
 		}
+		else if (!(use_id in names)) {
+			// Not listed (yet), so look it up, along with any others asked
+			// for while rendering
+			names[use_id] = '';
+			getname(use_id).then(function (cli) {
+				names[use_id] = cli.name;
+			});
+		}
+		return names[use_id];
 	}
 
 	function clearclients () {
@@ -194,12 +361,45 @@ iwsApp.factory('clientListService', ['$http', function ($http) {
 		clients.closed = 0;
 		clients_byid = iwsUtil.emptyobj();
 	}
+
+	function patchclient (data) {
+		var cli = getclientbyid(data.id);
+		if (cli) {
+			cli.name = data.name;
+		}
+		else {
+			cli = {
+				id: data.id,
+				name: data.name,
+				open_count: 0,
+				closed_count: 0
+			};
+			clients.list.push(cli);
+			clients_byid[cli.id] = cli;
+		}
+		clients.list.sort(sortclients);
+	}
+
+	function patchcounts (client_id, open, closed) {
+		var cli = getclientbyid(client_id);
+		if (cli) {
+			cli.open_count += open;
+			cli.closed_count += closed;
+			clients.open += open;
+			clients.closed += closed;
+		}
+	}
+
+	function sortclients (a, b) {
+		return a.name.localeCompare(b.name);
+	}
 }]);
 
-iwsApp.factory('clientDetailService', ['$http', '$q', function ($http, $q) {
+iwsApp.factory('clientDetailService', ['$http', '$q', 'batchService', function ($http, $q, batchService) {
 	var baseurl = '/featreq/client/';
 	var fields = ['con_mail', 'con_name', 'name'];
 	var client = iwsUtil.emptyobj();
+	var getclient = batchService.fetcher(baseurl, 'client');
 
 	return {
 		client: client,
@@ -211,8 +411,7 @@ iwsApp.factory('clientDetailService', ['$http', '$q', function ($http, $q) {
 
 	function getdetails (client_id) {
 		if ((client_id) && (client_id != '_all')) {
-			return $http.get(baseurl + client_id).then(function (response) {
-				var newclient = response.data.client;
+			return getclient(client_id).then(function (newclient) {
 				newclient.date_add = new Date(newclient.date_add);
 				angular.copy(newclient, client)
 				return client;
@@ -288,7 +487,7 @@ iwsApp.factory('clientDetailService', ['$http', '$q', function ($http, $q) {
 	}
 }]);
 
-iwsApp.factory('reqListService', ['$http', '$q', function ($http, $q) {
+iwsApp.factory('reqListService', ['$http', '$q', '$rootScope', function ($http, $q, $rootScope) {
 	var baseurl = '/featreq/client/';
 	var allurl = '/featreq/req';
 	var reqfields = ['id', 'title', 'prod_area'];
@@ -301,6 +500,62 @@ iwsApp.factory('reqListService', ['$http', '$q', function ($http, $q) {
 		open_list: null,
 		closed_list: null
 	};
+
+	$rootScope.$on('change_opened', function (event, data) {
+		if ((client.open_list !== null) && (inlist(data.client_id))) {
+			if (findreq(client.open_list, data.client_id, data.req.id) == -1) {
+				client.open_list.push(iwsUtil.oreqproc(listentry(data)));
+				client.open_list.sort(sortopen);
+			}
+		}
+	});
+
+	$rootScope.$on('change_open_updated', function (event, data) {
+		if ((client.open_list !== null) && (inlist(data.client_id))) {
+			var i = findreq(client.open_list, data.client_id, data.req_id);
+			if (i != -1) {
+				// Have to create new outer object so watching controller(s) will pick it up
+				var neworeq = angular.copy(client.open_list[i]);
+				neworeq.priority = data.priority;
+				neworeq.date_tgt = data.date_tgt ? new Date(data.date_tgt) : null;
+				client.open_list[i] = neworeq;
+				client.open_list.sort(sortopen);
+			}
+		}
+	});
+
+	$rootScope.$on('change_reprioritized', function (event, data) {
+		if ((client.open_list !== null) && (inlist(data.client_id))) {
+			for (var i = 0, len = data.priorities.length; i < len; i++) {
+				var j = findreq(client.open_list, data.client_id, data.priorities[i][0]);
+				if (j != -1) {
+					client.open_list[j].priority = data.priorities[i][1];
+				}
+			}
+			client.open_list.sort(sortopen);
+		}
+	});
+
+	$rootScope.$on('change_closed', function (event, data) {
+		if (!inlist(data.client_id)) {
+			return;
+		}
+		if (client.open_list !== null) {
+			var i = findreq(client.open_list, data.client_id, data.req.id);
+			if (i != -1) {
+				client.open_list.splice(i, 1);
+			}
+		}
+		if (client.closed_list !== null) {
+			client.closed_list.push(iwsUtil.creqproc(listentry(data)));
+			client.closed_list.sort(sortclosed);
+		}
+	});
+
+	$rootScope.$on('change_req_updated', function (event, data) {
+		updatereq(data);
+	});
+
 	return {
 		client: client,
 		getopen: getopen,
@@ -514,11 +769,37 @@ iwsApp.factory('reqListService', ['$http', '$q', function ($http, $q) {
 		return a.closed_at > b.closed_at ? -1 : a.closed_at < b.closed_at ? 1 : 0;
 	}
 
+	function inlist (client_id) {
+		// Whether changes for client_id belong in the current lists
+		return (client.id == client_id) || (client.id == '_all');
+	}
+
+	function findreq (list, client_id, req_id) {
+		// Index of entry for req_id (and client_id, for the _all lists), or -1
+		for (var i = list.length - 1; i >= 0; i--) {
+			var entry = list[i];
+			if ((entry.req.id == req_id) && ((!entry.client_id) || (entry.client_id == client_id))) {
+				return i;
+			}
+		}
+		return -1;
+	}
+
+	function listentry (data) {
+		// Change event data in list entry form (client_id only kept for _all lists)
+		var entry = angular.copy(data);
+		if (client.id != '_all') {
+			delete entry.client_id;
+		}
+		return entry;
+	}
+
 }]);
 
-iwsApp.factory('reqDetailService', ['$http', '$q', function ($http, $q) {
+iwsApp.factory('reqDetailService', ['$http', '$q', '$rootScope', 'batchService', function ($http, $q, $rootScope, batchService) {
 	var baseurl = '/featreq/req/';
 	var exturl = '/all/';
+	var getreq = batchService.fetcher(baseurl, 'req');
 	var fields = ['prod_area', 'ref_url', 'desc', 'title', 'id'];
 	var upfields = ['prod_area', 'ref_url', 'title'];
 	var extra = ['user_up', 'date_up', 'user_cr', 'date_cr'];
@@ -528,6 +809,52 @@ iwsApp.factory('reqDetailService', ['$http', '$q', function ($http, $q) {
 		closed: []
 	};
 
+	$rootScope.$on('change_req_updated', function (event, data) {
+		if (data.id == detail.req.id) {
+			// Description isn't sent with changes, so leave it be
+			detail.req.title = data.title;
+			detail.req.prod_area = data.prod_area;
+			detail.req.date_up = new Date(data.date_up);
+			detail.req.user_up = data.user_up;
+		}
+	});
+
+	$rootScope.$on('change_opened', function (event, data) {
+		if ((data.req.id == detail.req.id) && (findclient(detail.open, data.client_id) == -1)) {
+			detail.open.push(iwsUtil.oreqproc(data));
+		}
+	});
+
+	$rootScope.$on('change_open_updated', function (event, data) {
+		if (data.req_id == detail.req.id) {
+			var i = findclient(detail.open, data.client_id);
+			if (i != -1) {
+				detail.open[i] = iwsUtil.oreqproc(data);
+			}
+		}
+	});
+
+	$rootScope.$on('change_reprioritized', function (event, data) {
+		var i = findclient(detail.open, data.client_id);
+		if (i != -1) {
+			for (var j = 0, len = data.priorities.length; j < len; j++) {
+				if (data.priorities[j][0] == detail.req.id) {
+					detail.open[i].priority = data.priorities[j][1];
+				}
+			}
+		}
+	});
+
+	$rootScope.$on('change_closed', function (event, data) {
+		if (data.req.id == detail.req.id) {
+			var i = findclient(detail.open, data.client_id);
+			if (i != -1) {
+				detail.open.splice(i, 1);
+			}
+			detail.closed.push(iwsUtil.creqproc(data));
+		}
+	});
+
 	return {
 		detail: detail,
 		getdetails: getdetails,
@@ -544,7 +871,7 @@ iwsApp.factory('reqDetailService', ['$http', '$q', function ($http, $q) {
 			return $q.when(detail);
 		}
 		var reqdetails = {
-			req: $http.get(baseurl + req_id).then(procreq),
+			req: getreq(req_id).then(procreq),
 			lists: $http.get(baseurl + req_id + exturl).then(proclists)
 		};
 		return $q.all(reqdetails).then(function() {
@@ -668,8 +995,7 @@ iwsApp.factory('reqDetailService', ['$http', '$q', function ($http, $q) {
 		detail.closed = [];
 	}
 
-	function procreq (response) {
-		var newreq = response.data.req;
+	function procreq (newreq) {
 		// Process dates
 		newreq.date_cr = new Date(newreq.date_cr);
 		newreq.date_up = new Date(newreq.date_up);
@@ -712,6 +1038,18 @@ iwsApp.factory('reqDetailService', ['$http', '$q', function ($http, $q) {
 		return detail;
 	}
 
+	function findclient (list, client_id) {
+		// Index of entry for client_id, or -1
+		if (list) {
+			for (var i = list.length - 1; i >= 0; i--) {
+				if (list[i].client_id == client_id) {
+					return i;
+				}
+			}
+		}
+		return -1;
+	}
+
 }]);
 
 
@@ -783,8 +1121,8 @@ iwsApp.controller('LoginController', ['$rootScope', 'authService',
 	}
 ]);
 
-iwsApp.controller('ClientListController', ['$scope', 'clientListService',
-	function ($scope, clientListService) {
+iwsApp.controller('ClientListController', ['$scope', 'clientListService', 'eventService',
+	function ($scope, clientListService, eventService) {
 
 		var vm = this;
 		vm.logged_in = false;
@@ -804,7 +1142,10 @@ iwsApp.controller('ClientListController', ['$scope', 'clientListService',
 
 		$scope.$on('client_updated', function (event, client) {
 			if (client) {
-				clientListService.getclients();
+				// Change events will patch the list if connected
+				if (!eventService.status.live) {
+					clientListService.getclients();
+				}
 				if (client.id != vm.clients.id) {
 					selectclient(client.id);
 				}
@@ -812,11 +1153,15 @@ iwsApp.controller('ClientListController', ['$scope', 'clientListService',
 		});
 
 		$scope.$on('oreq_closed', function (event, client_id) {
-			clientListService.getclients();
+			if (!eventService.status.live) {
+				clientListService.getclients();
+			}
 		});
 
 		$scope.$on('req_created', function (event, client_id) {
-			clientListService.getclients();
+			if (!eventService.status.live) {
+				clientListService.getclients();
+			}
 		});
 
 		function selectclient (client_id) {
@@ -905,8 +1250,8 @@ iwsApp.controller('ClientDetailController', ['$scope', 'clientDetailService',
 	}
 ]);
 
-iwsApp.controller('ReqListController', ['$scope', 'reqListService', 'clientListService',
-	function ($scope, reqListService, clientListService) {
+iwsApp.controller('ReqListController', ['$scope', 'reqListService', 'clientListService', 'eventService',
+	function ($scope, reqListService, clientListService, eventService) {
 		var vm = this;
 		vm.tab = 'open';
 		vm.req = {
@@ -933,7 +1278,8 @@ iwsApp.controller('ReqListController', ['$scope', 'reqListService', 'clientListS
 			// Update under the following conditions:
 			//   - client_id matches or is _all
 			//   - tab is open, or tab is closed and open list has already been fetched
-			if (((vm.client.id == client_id) || (vm.client.id == '_all')) && 
+			// (Change events will patch the list instead if connected)
+			if (((vm.client.id == client_id) || (vm.client.id == '_all')) && (!eventService.status.live) &&
 				((vm.tab == 'open') || ((vm.tab == 'closed') && (vm.client.open_list !== null)))) {
 				reqListService.refopen();
 			}
@@ -942,11 +1288,13 @@ iwsApp.controller('ReqListController', ['$scope', 'reqListService', 'clientListS
 		$scope.$on('oreq_closed', function(event, client_id) {
 			// We want to update both lists if fetched
 			if ((vm.client.id == client_id) || (vm.client.id == '_all')) {
-				if (vm.client.open !== null) {
-					reqListService.refopen();
-				}
-				if (vm.client.closed !== null) {
-					reqListService.refclosed();
+				if (!eventService.status.live) {
+					if (vm.client.open !== null) {
+						reqListService.refopen();
+					}
+					if (vm.client.closed !== null) {
+						reqListService.refclosed();
+					}
 				}
 				// Deselect request on open tab, select on closed
 				// Don't send req_select event -- we want to let
@@ -961,7 +1309,7 @@ iwsApp.controller('ReqListController', ['$scope', 'reqListService', 'clientListS
 		$scope.$on('req_created', function(event, client_id, req){
 			if ((vm.client.id == client_id) || (vm.client.id == '_all')) {
 				vm.req.open = req.id;
-				if (vm.client.open !== null) {
+				if ((vm.client.open !== null) && (!eventService.status.live)) {
 					reqListService.refopen();
 				}
 				selecttab('open');
@@ -970,7 +1318,9 @@ iwsApp.controller('ReqListController', ['$scope', 'reqListService', 'clientListS
 
 		$scope.$on('req_updated', function(event, req) {
 			// Update if tab is open, or tab is closed and open list has already been fetched
-			if ((vm.tab == 'open') || ((vm.tab == 'closed') && (vm.client.open_list !== null))) {
+			// (change events will patch the list instead if connected)
+			if ((!eventService.status.live) &&
+				((vm.tab == 'open') || ((vm.tab == 'closed') && (vm.client.open_list !== null)))) {
 				reqListService.updatereq(req);
 			}
 		});